@@ -0,0 +1,943 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from service import CatalogService, run_load
+from store import (BatchPricer, Cart, CartLine, CatalogStore, ColumnarProduct, ConcurrentProduct, Inventory,
+                   PricingPolicy, Product, ProductRecord, SessionCartManager, Sorter, TextInterface, ViewCache,
+                   metrics, print_event)
+
+
+CATEGORIES = ["Смартфоны", "Ноутбуки", "Аксессуары", "Телевизоры", "Планшеты"]
+BRANDS = ["Samsung", "Apple", "Xiaomi", "ASUS", "Lenovo", "Sony", "LG", "Huawei", "Acer", "Philips"]
+WORDS = ["беспроводной", "игровой", "компактный", "черный", "белый", "Pro", "Max", "Lite", "Ultra", "Mini"]
+
+
+@contextlib.contextmanager
+def _silenced():
+    """Подавление вывода print на время подготовки данных"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def build_catalog(size, seed=0, catalog_class=Product, catalog=None):
+    """Создание синтетического каталога заданного размера"""
+    rng = random.Random(seed)
+    if catalog is None:
+        catalog = catalog_class()
+    for i in range(size):
+        catalog.add_product(
+            name=f"{rng.choice(BRANDS)} {rng.choice(WORDS)} {i}",
+            category=rng.choice(CATEGORIES),
+            price=rng.randint(100, 200000),
+            weight=round(rng.uniform(0.05, 30), 2),
+            description=f"{rng.choice(WORDS)} {rng.choice(WORDS)} товар, модель {i}"
+        )
+    return catalog
+
+
+def bench_lookup(sizes=(1000, 10000, 100000, 1000000), lookups=100000, seed=0):
+    """Замер времени поиска товара по ID для каталогов разного размера"""
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        catalog = build_catalog(size, seed)
+        ids = [rng.randint(1, size) for _ in range(lookups)]
+        find = catalog._find_product_by_id
+
+        start = time.perf_counter()
+        for product_id in ids:
+            find(product_id)
+        elapsed = time.perf_counter() - start
+
+        results.append({'size': size, 'ns_per_lookup': elapsed / lookups * 1e9})
+    return results
+
+
+def bench_concurrent_reads(size=100000, threads=(1, 2, 4, 8), lookups=200000, seed=0):
+    """Поиск по ID из нескольких потоков при работающем писателе
+
+    Product читается под общей блокировкой, ConcurrentProduct - без нее.
+    Рост пропускной способности с числом потоков заметен на сборках
+    Python без GIL.
+    """
+    results = []
+    for catalog_class in (Product, ConcurrentProduct):
+        catalog = build_catalog(size, seed, catalog_class)
+        lock = threading.Lock()
+        if catalog_class is ConcurrentProduct:
+            def find(product_id, find=catalog.get_product_info):
+                return find(product_id)
+        else:
+            def find(product_id, find=catalog.get_product_info):
+                with lock:
+                    return find(product_id)
+
+        def read(ids):
+            for product_id in ids:
+                find(product_id)
+
+        for count in threads:
+            rng = random.Random(seed)
+            stop = threading.Event()
+
+            def write():
+                writer_rng = random.Random(seed + 1)
+                while not stop.is_set():
+                    product_id = writer_rng.randint(1, size)
+                    with lock:
+                        catalog.edit_product(product_id, price=writer_rng.randint(100, 200000))
+
+            workers = [threading.Thread(target=read, args=([rng.randint(1, size) for _ in range(lookups)],))
+                       for _ in range(count)]
+            writer = threading.Thread(target=write)
+            writer.start()
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            writer.join()
+            results.append({'storage': catalog_class.__name__, 'threads': count,
+                            'reads_per_sec': count * lookups / elapsed})
+    return results
+
+
+def _traced_bytes(build, count):
+    """Память, выделенная функцией build, в байтах на элемент"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size / count
+
+
+def bench_record_memory(size=100000, seed=0):
+    """Память на запись товара и строку корзины: словари и записи со __slots__
+
+    Строковые значения общие для обоих вариантов, поэтому в замер входят
+    только сами записи и ссылки на них в списке.
+    """
+    values = [tuple(product.values()) for product in build_catalog(size, seed)]
+    records = [ProductRecord(*row) for row in values]
+    return [
+        {'object': 'товар',
+         'before': _traced_bytes(lambda: [dict(zip(ProductRecord.FIELDS, row)) for row in values], size),
+         'after': _traced_bytes(lambda: [ProductRecord(*row) for row in values], size)},
+        {'object': 'строка корзины',
+         'before': _traced_bytes(lambda: [{'product': record, 'quantity': 1} for record in records], size),
+         'after': _traced_bytes(lambda: [CartLine(record, 1) for record in records], size)},
+    ]
+
+
+def bench_columnar_scan(size=1000000, repeat=5, seed=0):
+    """Замер полного прохода по каталогу: фильтр по категории и цене, средняя цена"""
+    results = []
+    for catalog_class in (Product, ColumnarProduct):
+        catalog = build_catalog(size, seed, catalog_class)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if catalog_class is ColumnarProduct:
+                catalog.select(category=CATEGORIES[0], min_price=10000, max_price=20000)
+                catalog.average_price_by_category()
+            else:
+                [product['id'] for product in catalog
+                 if product['category'] == CATEGORIES[0] and 10000 <= product['price'] <= 20000]
+                sums = {}
+                for product in catalog:
+                    total, count = sums.get(product['category'], (0.0, 0))
+                    sums[product['category']] = (total + product['price'], count + 1)
+        elapsed = time.perf_counter() - start
+
+        results.append({'storage': catalog_class.__name__, 'size': size,
+                        'ms_per_scan': elapsed / repeat * 1e3})
+    return results
+
+
+def bench_batch_quote(carts=100000, lines_per_cart=5, catalog_size=10000, seed=0):
+    """Пропускная способность расчета корзин: по одной Cart и пакетом"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    rows = [
+        (cart_id, rng.randint(1, catalog_size), rng.randint(1, 3))
+        for cart_id in range(carts)
+        for _ in range(lines_per_cart)
+    ]
+    rules = Cart(catalog)
+    rules.add_discount_rule('percentage', value=5)
+    rules.add_discount_rule('fixed', value=1000)
+    rules.add_discount_rule('threshold', threshold=100000, discount_type='percentage', discount_value=10)
+
+    start = time.perf_counter()
+    cart, current = None, None
+    for cart_id, product_id, quantity in rows:
+        if cart_id != current:
+            if cart is not None:
+                cart.calculate_total()
+            cart, current = Cart(catalog), cart_id
+            cart.discount_rules = rules.discount_rules
+        cart.add_item(product_id, quantity)
+    cart.calculate_total()
+    per_cart = time.perf_counter() - start
+
+    start = time.perf_counter()
+    BatchPricer.quote_rows(catalog, rows, rules.discount_rules, rules.tax_rate)
+    batch = time.perf_counter() - start
+
+    return [
+        {'mode': 'Cart.calculate_total', 'carts': carts, 'carts_per_sec': carts / per_cart},
+        {'mode': 'BatchPricer.quote_rows', 'carts': carts, 'carts_per_sec': carts / batch},
+    ]
+
+
+def bench_reprice(carts=200000, lines_per_cart=5, catalog_size=10000, worker_counts=(1, 2, 4, 8), seed=0):
+    """Пересчет всех корзин после смены правил: в одном процессе и в пуле процессов"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    cart_list = []
+    for _ in range(carts):
+        cart = Cart(catalog)
+        for _ in range(lines_per_cart):
+            cart.add_item(rng.randint(1, catalog_size), rng.randint(1, 3))
+        cart_list.append(cart)
+    rules = Cart(catalog)
+    rules.add_discount_rule('percentage', value=5)
+    rules.add_discount_rule('category', value=10, category=CATEGORIES[0])
+    rules.add_discount_rule('threshold', threshold=100000, discount_type='percentage', discount_value=10)
+    for cart in cart_list:
+        cart.discount_rules = rules.discount_rules
+
+    start = time.perf_counter()
+    BatchPricer.quote_carts(cart_list)
+    results = [{'workers': 0, 'carts': carts, 'carts_per_sec': carts / (time.perf_counter() - start)}]
+    for workers in worker_counts:
+        start = time.perf_counter()
+        for _ in BatchPricer.reprice_carts(cart_list, rules.discount_rules, rules.tax_rate, workers=workers,
+                                           chunk_size=max(1, carts // (4 * workers))):
+            pass
+        results.append({'workers': workers, 'carts': carts, 'carts_per_sec': carts / (time.perf_counter() - start)})
+    return results
+
+
+def bench_reservations(threads=(1, 2, 4, 8), shard_counts=(1, 16), reservations=200000, carts_per_thread=100):
+    """Резервы одного популярного товара из нескольких потоков
+
+    Один шард соответствует общей блокировке на товар; с несколькими
+    шардами потоки списывают остаток с разных счетчиков и реже ждут
+    друг друга. Сравнивается число резервов в секунду при одинаковом
+    числе потоков.
+    """
+    catalog = build_catalog(10)
+    results = []
+    for shards in shard_counts:
+        for count in threads:
+            inventory = Inventory(shards=shards)
+            inventory.set_stock(1, reservations)
+            per_thread = reservations // count
+
+            def reserve():
+                carts = [Cart(catalog, inventory) for _ in range(carts_per_thread)]
+                for i in range(per_thread):
+                    carts[i % carts_per_thread].add_item(1)
+
+            workers = [threading.Thread(target=reserve) for _ in range(count)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            results.append({'shards': shards, 'threads': count,
+                            'reservations_per_sec': per_thread * count / elapsed})
+    return results
+
+
+def bench_cart_mutations(operations=100000, catalog_size=1000, seed=0):
+    """Изменения корзины без подписчиков и с выводом сообщений на экран"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    ids = [rng.randint(1, catalog_size) for _ in range(operations)]
+    results = []
+    for mode in ('без подписчиков', 'print_event'):
+        cart = Cart(catalog)
+        if mode == 'print_event':
+            cart.subscribe(print_event)
+        with _silenced():
+            start = time.perf_counter()
+            for product_id in ids:
+                cart.add_item(product_id)
+                cart.remove_item(product_id, 1)
+            elapsed = time.perf_counter() - start
+        results.append({'mode': mode, 'ns_per_operation': elapsed / (2 * operations) * 1e9})
+    return results
+
+
+def bench_cart_refresh(carts=10000, lines_per_cart=20, catalog_size=10000, edits=1000, seed=0):
+    """Перевод корзин на новые версии товаров после изменения цен в каталоге"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    sessions = []
+    for _ in range(carts):
+        cart = Cart(catalog)
+        for product_id in rng.sample(range(1, catalog_size + 1), lines_per_cart):
+            cart.add_item(product_id)
+        sessions.append(cart)
+    for product_id in rng.sample(range(1, catalog_size + 1), edits):
+        catalog.edit_product(product_id, price=rng.randint(100, 200000))
+
+    start = time.perf_counter()
+    updated = sum(cart.refresh()[0] for cart in sessions)
+    elapsed = time.perf_counter() - start
+    return {'carts': carts, 'lines_updated': updated, 'us_per_cart': elapsed / carts * 1e6}
+
+
+def bench_sessions(sessions=200000, lines_per_cart=3, catalog_size=10000, max_carts=50000, seed=0):
+    """Память на корзину сессии и задержки вытеснения и загрузки с диска"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    lines = [[(rng.randint(1, catalog_size), rng.randint(1, 3)) for _ in range(lines_per_cart)]
+             for _ in range(sessions)]
+    results = {'sessions': sessions}
+
+    # Память корзин без вытеснения: отдельные Cart и корзины менеджера
+    tracemalloc.start()
+    carts = []
+    for session_lines in lines[:max_carts]:
+        cart = Cart(catalog)
+        for product_id, quantity in session_lines:
+            cart.add_item(product_id, quantity)
+        carts.append(cart)
+    results['cart_bytes'] = tracemalloc.get_traced_memory()[0] / max_carts
+    del carts
+    tracemalloc.stop()
+
+    directory = tempfile.mkdtemp(prefix='store-bench-')
+    try:
+        tracemalloc.start()
+        manager = SessionCartManager(catalog, directory, PricingPolicy())
+        for session_id, session_lines in enumerate(lines[:max_carts]):
+            cart = manager.get_cart(session_id)
+            for product_id, quantity in session_lines:
+                cart.add_item(product_id, quantity)
+        results['session_cart_bytes'] = tracemalloc.get_traced_memory()[0] / max_carts
+        tracemalloc.stop()
+
+        # Все сессии через менеджер с ограничением числа корзин в памяти
+        manager.max_carts = max_carts
+        start = time.perf_counter()
+        for session_id, session_lines in enumerate(lines):
+            cart = manager.get_cart(session_id)
+            if session_id >= max_carts:
+                for product_id, quantity in session_lines:
+                    cart.add_item(product_id, quantity)
+        for session_id in rng.sample(range(sessions), 10000):
+            manager.get_cart(session_id).calculate_total()
+        results['seconds'] = time.perf_counter() - start
+        results.update(manager.stats())
+        manager.close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_metrics_overhead(operations=100000, catalog_size=1000, seed=0):
+    """Стоимость изменений корзины с выключенным и включенным сбором метрик"""
+    rng = random.Random(seed)
+    catalog = build_catalog(catalog_size, seed)
+    ids = [rng.randint(1, catalog_size) for _ in range(operations)]
+    results = []
+    for enabled in (False, True):
+        if enabled:
+            metrics.enable()
+        try:
+            cart = Cart(catalog)
+            start = time.perf_counter()
+            for product_id in ids:
+                cart.add_item(product_id)
+                cart.remove_item(product_id, 1)
+            elapsed = time.perf_counter() - start
+        finally:
+            metrics.disable()
+        results.append({'metrics': enabled, 'ns_per_operation': elapsed / (2 * operations) * 1e9})
+    metrics.reset()
+    return results
+
+
+def bench_script_replay(commands=100000, seed=0):
+    """Скорость пакетного выполнения сценария команд без вывода сообщений"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(commands):
+        product_id = rng.randint(1, 3)
+        lines.append(rng.choice((f"add {product_id} {rng.randint(1, 3)}", f"remove {product_id} 1")))
+
+    interface = TextInterface(verbose=False)
+    start = time.perf_counter()
+    errors = interface.run_script(lines)
+    elapsed = time.perf_counter() - start
+    return {'commands': commands, 'errors': errors, 'commands_per_sec': commands / elapsed}
+
+
+def bench_sort(lines=100000, key=('category', '-price'), seed=0):
+    """Сортировка корзины большого размера по составному ключу"""
+    catalog = build_catalog(lines, seed)
+    items = [{'product': product, 'quantity': 1} for product in catalog]
+    random.Random(seed).shuffle(items)
+    results = []
+
+    start = time.perf_counter()
+    sorted(items, key=lambda item: (item['product']['category'], -item['product']['price']))
+    results.append({'algorithm': 'sorted()', 'lines': lines, 'seconds': time.perf_counter() - start})
+
+    for algorithm in ('tim', 'quick', 'merge'):
+        shuffled = list(items)
+        start = time.perf_counter()
+        Sorter.sort(shuffled, algorithm=algorithm, key=key)
+        results.append({'algorithm': algorithm, 'lines': lines, 'seconds': time.perf_counter() - start})
+    return results
+
+
+def bench_first_page(sizes=(10000, 100000, 1000000), page_size=20, seed=0):
+    """Первая страница самых дешевых товаров: полная сортировка и top-k"""
+    results = []
+    for size in sizes:
+        products = build_catalog(size, seed).products
+
+        start = time.perf_counter()
+        Sorter.sort(list(products), key='price')[:page_size]
+        full_sort = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Sorter.page(products, 1, page_size, key='price')
+        first_page = time.perf_counter() - start
+
+        results.append({'size': size, 'sort_ms': full_sort * 1e3, 'page_ms': first_page * 1e3})
+    return results
+
+
+def bench_render(size=100000, seed=0):
+    """Вывод каталога в /dev/null: текст, CSV и JSON одной записью и первая страница"""
+    catalog = build_catalog(size, seed)
+    results = []
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        for mode, options in (('text', {}), ('csv', {'format': 'csv'}), ('json', {'format': 'json'}),
+                              ('page', {'page': 1, 'limit': 20})):
+            start = time.perf_counter()
+            catalog.display_catalog(**options)
+            results.append({'mode': mode, 'size': size, 'ms': (time.perf_counter() - start) * 1e3})
+    return results
+
+
+def bench_service(size=100000, connections=32, sessions=2000, pipeline=8, seed=0):
+    """Запросы в секунду и задержка HTTP-сервиса; клиент и сервер работают в одном процессе"""
+    catalog = build_catalog(size, seed)
+    catalog.facets()
+    catalog.search('')
+    service = CatalogService(catalog, Cart(catalog))
+
+    async def run():
+        server = await service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await run_load('127.0.0.1', port, connections, sessions, pipeline, size, seed)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    report = asyncio.run(run())
+    report['lookups_per_batch'] = service.batcher.lookups / max(service.batcher.batches, 1)
+    return report
+
+
+def bench_range_query(size=1000000, queries=100, seed=0):
+    """Запрос товаров с ценой в узком диапазоне: полный проход и индекс"""
+    rng = random.Random(seed)
+    catalog = build_catalog(size, seed)
+    bounds = [(low, low + 100) for low in (rng.randint(100, 199900) for _ in range(queries))]
+
+    start = time.perf_counter()
+    for low, high in bounds[:10]:
+        [product for product in catalog if low <= product['price'] <= high]
+    scan = (time.perf_counter() - start) / 10
+
+    start = time.perf_counter()
+    catalog.find_by_range('price', 0, 0)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for low, high in bounds:
+        catalog.find_by_range('price', low, high)
+    indexed = (time.perf_counter() - start) / queries
+
+    return {'size': size, 'scan_ms': scan * 1e3, 'index_build_ms': build * 1e3, 'index_ms': indexed * 1e3}
+
+
+def bench_facets(size=1000000, edits=10000, seed=0):
+    """Агрегаты по категориям: полный проход и поддерживаемый индекс"""
+    rng = random.Random(seed)
+    catalog = build_catalog(size, seed)
+
+    start = time.perf_counter()
+    catalog.facets(iter(catalog))
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    catalog.facets()
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(edits):
+        catalog.edit_product(rng.randint(1, size), price=rng.randint(100, 200000), category=rng.choice(CATEGORIES))
+    edit = (time.perf_counter() - start) / edits
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        catalog.facets()
+    query = (time.perf_counter() - start) / 1000
+
+    return {'size': size, 'scan_ms': scan * 1e3, 'index_build_ms': build * 1e3,
+            'index_ms': query * 1e3, 'edit_us': edit * 1e6}
+
+
+def bench_view_cache(size=200000, edits=100, rounds=20, seed=0):
+    """Отсортированный список и текст каталога после небольших изменений: заново и через кэш"""
+    rng = random.Random(seed)
+    catalog = build_catalog(size, seed)
+    cache = ViewCache(catalog)
+    cache.sorted_products('price')
+    cache.rendered_catalog()
+    rebuild = cached = 0.0
+    for _ in range(rounds):
+        for _ in range(edits):
+            catalog.edit_product(rng.randint(1, size), price=rng.randint(100, 200000))
+
+        start = time.perf_counter()
+        sorted(catalog, key=lambda product: (product['price'], product['id']))
+        ''.join(catalog.render_catalog())
+        rebuild += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cache.sorted_products('price')
+        cache.rendered_catalog()
+        cached += time.perf_counter() - start
+    return {'size': size, 'edits': edits, 'rebuild_ms': rebuild / rounds * 1e3, 'cached_ms': cached / rounds * 1e3}
+
+
+def bench_search(size=1000000, seed=0):
+    """Задержка подсказок при наборе и объем полнотекстового индекса"""
+    catalog = build_catalog(size, seed)
+
+    start = time.perf_counter()
+    catalog.search('')
+    catalog.suggest('s')
+    build = time.perf_counter() - start
+
+    queries = ['s', 'sa', 'sam', 'samsung', 'samsung б', 'samsung бес', 'игровой a', 'xiaomi pro 12', 'модель 5']
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(100):
+            catalog.suggest(query)
+        results.append({'query': query, 'ms': (time.perf_counter() - start) / 100 * 1e3})
+
+    return {
+        'size': size,
+        'build_s': build,
+        'index_mb': catalog._search_index.memory_usage() / 2 ** 20,
+        'queries': results
+    }
+
+
+def bench_startup(size=2000000, seed=0):
+    """Загрузка каталога из хранилища: повтор журнала и чтение снимка"""
+    directory = tempfile.mkdtemp(prefix='store-bench-')
+    try:
+        store = CatalogStore(directory, group_size=10000)
+        build_catalog(size, seed, catalog=store.load(ColumnarProduct))
+        store.close()
+
+        results = []
+        start = time.perf_counter()
+        store = CatalogStore(directory)
+        store.load(ColumnarProduct)
+        results.append({'source': 'журнал', 'storage': 'ColumnarProduct', 'seconds': time.perf_counter() - start})
+        store.snapshot()
+        store.close()
+
+        for catalog_class in (ColumnarProduct, Product):
+            start = time.perf_counter()
+            store = CatalogStore(directory)
+            store.load(catalog_class)
+            results.append({'source': 'снимок', 'storage': catalog_class.__name__,
+                            'seconds': time.perf_counter() - start})
+            store.close()
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_import(size=1000000, seed=0):
+    """Скорость потокового импорта CSV: новые товары и повторный импорт по артикулам; скорость выгрузки"""
+    directory = tempfile.mkdtemp(prefix='store-bench-')
+    try:
+        path = os.path.join(directory, 'catalog.csv')
+        build_catalog(size, seed).export_products(path, fields=('name', 'category', 'price', 'weight', 'description'))
+        # Артикулы дописываются отдельной колонкой, чтобы повторный импорт обновлял товары
+        with open(path, encoding='utf-8') as source, open(path + '.sku', 'w', encoding='utf-8') as target:
+            target.write('sku,' + next(source))
+            for row_number, line in enumerate(source):
+                target.write(f'SKU{row_number},{line}')
+        os.replace(path + '.sku', path)
+
+        catalog = Product()
+        results = []
+        for mode in ('добавление', 'повтор'):
+            stats = catalog.import_products(path)
+            results.append({'mode': mode, 'rows': stats['rows'], 'rows_per_sec': stats['rows_per_sec']})
+
+        start = time.perf_counter()
+        rows = catalog.export_products(os.path.join(directory, 'export.jsonl'))
+        results.append({'mode': 'выгрузка', 'rows': rows, 'rows_per_sec': rows / (time.perf_counter() - start)})
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+# Размеры наборов данных для run_suite: 'quick' - для проверки перед
+# каждым изменением, 'full' - каталоги до 1 млн товаров и корзины до 100 тыс. строк
+SUITE_PROFILES = {
+    'quick': {
+        'catalog_sizes': (1000, 10000),
+        'cart_lines': (10, 1000),
+        'rule_counts': (0, 1, 10),
+        'sort_lines': 1000,
+        'quadratic_sort_lines': 200,
+        'display_sizes': (1000,),
+    },
+    'full': {
+        'catalog_sizes': (1000, 10000, 100000, 1000000),
+        'cart_lines': (10, 1000, 100000),
+        'rule_counts': (0, 1, 10, 100),
+        'sort_lines': 100000,
+        'quadratic_sort_lines': 2000,
+        'display_sizes': (1000, 10000, 100000),
+    },
+}
+
+
+def _measure(run, operations, repeat):
+    """Лучшее и медианное время одной операции по repeat запускам run
+
+    run выполняет operations операций и возвращает затраченное время;
+    сборщик мусора на время замера отключается.
+    """
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            times.append(run() / operations)
+    finally:
+        if enabled:
+            gc.enable()
+    return {'best_ns': min(times) * 1e9, 'median_ns': statistics.median(times) * 1e9}
+
+
+def _suite_lookup(profile, repeat, rng, seed):
+    lookups = 100000
+    for size in profile['catalog_sizes']:
+        find = build_catalog(size, seed)._find_product_by_id
+        ids = [rng.randint(1, size) for _ in range(lookups)]
+
+        def run():
+            start = time.perf_counter()
+            for product_id in ids:
+                find(product_id)
+            return time.perf_counter() - start
+
+        yield f"lookup[size={size}]", _measure(run, lookups, repeat)
+
+
+def _suite_cart(profile, repeat, rng, seed):
+    catalog_size = max(profile['cart_lines'])
+    catalog = build_catalog(catalog_size, seed)
+    for lines in profile['cart_lines']:
+        ids = rng.sample(range(1, catalog_size + 1), lines)
+        cart = Cart(catalog)
+
+        def run_add():
+            start = time.perf_counter()
+            for product_id in ids:
+                cart.add_item(product_id)
+            elapsed = time.perf_counter() - start
+            cart.clear()
+            return elapsed
+
+        def run_remove():
+            for product_id in ids:
+                cart.add_item(product_id)
+            start = time.perf_counter()
+            for product_id in ids:
+                cart.remove_item(product_id)
+            return time.perf_counter() - start
+
+        yield f"add_item[lines={lines}]", _measure(run_add, lines, repeat)
+        yield f"remove_item[lines={lines}]", _measure(run_remove, lines, repeat)
+
+
+def _suite_total(profile, repeat, rng, seed):
+    catalog = build_catalog(1000, seed)
+    for rule_count in profile['rule_counts']:
+        cart = Cart(catalog)
+        for product_id in rng.sample(range(1, 1001), 100):
+            cart.add_item(product_id, rng.randint(1, 3))
+        for number in range(rule_count):
+            kind = number % 4
+            if kind == 0:
+                cart.add_discount_rule('percentage', value=rng.randint(1, 5))
+            elif kind == 1:
+                cart.add_discount_rule('fixed', value=rng.randint(100, 1000))
+            elif kind == 2:
+                cart.add_discount_rule('threshold', threshold=rng.randint(1000, 1000000),
+                                       discount_type='percentage', discount_value=rng.randint(1, 5))
+            else:
+                cart.add_discount_rule('category', value=rng.randint(1, 10), category=rng.choice(CATEGORIES))
+        calls = 10000
+
+        def run():
+            start = time.perf_counter()
+            for _ in range(calls):
+                cart.calculate_total()
+            return time.perf_counter() - start
+
+        yield f"calculate_total[rules={rule_count}]", _measure(run, calls, repeat)
+
+
+def _suite_sort(profile, repeat, rng, seed):
+    catalog = build_catalog(profile['sort_lines'], seed)
+    items = [{'product': product, 'quantity': 1} for product in catalog]
+    rng.shuffle(items)
+    for algorithm in ('tim', 'quick', 'merge', 'insertion', 'bubble'):
+        lines = profile['quadratic_sort_lines'] if algorithm in ('insertion', 'bubble') else profile['sort_lines']
+        for key in Sorter.FIELDS:
+
+            def run():
+                shuffled = items[:lines]
+                start = time.perf_counter()
+                Sorter.sort(shuffled, algorithm=algorithm, key=key)
+                return time.perf_counter() - start
+
+            yield f"sort[{algorithm},key={key},lines={lines}]", _measure(run, lines, repeat)
+
+
+def _suite_display(profile, repeat, rng, seed):
+    for size in profile['display_sizes']:
+        catalog = build_catalog(size, seed)
+
+        def run():
+            with _silenced():
+                start = time.perf_counter()
+                catalog.display_catalog()
+                return time.perf_counter() - start
+
+        yield f"display_catalog[size={size}]", _measure(run, size, repeat)
+
+
+SUITE = (_suite_lookup, _suite_cart, _suite_total, _suite_sort, _suite_display)
+
+
+def run_suite(profile='quick', repeat=5, seed=0):
+    """Замер горячих путей магазина на синтетических данных
+
+    Данные строятся из фиксированного seed, поэтому запуски на одной
+    машине сравнимы между собой. Время указано на одну операцию
+    (поиск, строку корзины, расчет, элемент сортировки, товар каталога).
+    """
+    sizes = SUITE_PROFILES[profile]
+    results = {}
+    for case in SUITE:
+        for name, timing in case(sizes, repeat, random.Random(seed), seed):
+            results[name] = timing
+    return {
+        'profile': profile,
+        'repeat': repeat,
+        'seed': seed,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare_results(report, baseline, threshold=0.20):
+    """Сравнение лучших времен с базовым отчетом
+
+    Возвращает строки (имя замера, базовое время, текущее время,
+    относительное изменение) для замеров, ставших медленнее больше
+    чем на threshold. Замеры, которых нет в одном из отчетов, пропускаются.
+    """
+    regressions = []
+    for name, timing in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = timing['best_ns'] / base['best_ns'] - 1
+        if change > threshold:
+            regressions.append((name, base['best_ns'], timing['best_ns'], change))
+    return regressions
+
+
+def print_report():
+    """Все сравнительные замеры с выводом на экран"""
+    print("=== ПОИСК ТОВАРА ПО ID ===")
+    for row in bench_lookup():
+        print(f"{row['size']:>9} товаров: {row['ns_per_lookup']:8.1f} нс/поиск")
+
+    print("\n=== ЧТЕНИЕ ИЗ НЕСКОЛЬКИХ ПОТОКОВ ===")
+    for row in bench_concurrent_reads():
+        print(f"{row['storage']:>17}, потоков {row['threads']}: {row['reads_per_sec']:12.0f} чтений/с")
+
+    print("\n=== ПАМЯТЬ НА ЗАПИСЬ ===")
+    for row in bench_record_memory():
+        print(f"{row['object']:>15}: словарь {row['before']:6.0f} Б, __slots__ {row['after']:6.0f} Б")
+
+    print("\n=== ПОЛНЫЙ ПРОХОД ПО КАТАЛОГУ ===")
+    for row in bench_columnar_scan():
+        print(f"{row['storage']:>16}, {row['size']} товаров: {row['ms_per_scan']:8.1f} мс")
+
+    print("\n=== ПАКЕТНЫЙ РАСЧЕТ КОРЗИН ===")
+    for row in bench_batch_quote():
+        print(f"{row['mode']:>22}: {row['carts_per_sec']:12.0f} корзин/с")
+
+    print("\n=== ПЕРЕСЧЕТ КОРЗИН В ПУЛЕ ПРОЦЕССОВ ===")
+    for row in bench_reprice():
+        mode = f"процессов {row['workers']}" if row['workers'] else "quote_carts"
+        print(f"{mode:>12}: {row['carts_per_sec']:12.0f} корзин/с")
+
+    print("\n=== РЕЗЕРВ ПОПУЛЯРНОГО ТОВАРА ===")
+    for row in bench_reservations():
+        print(f"счетчиков {row['shards']:>2}, потоков {row['threads']}: "
+              f"{row['reservations_per_sec']:10.0f} резервов/с")
+
+    print("\n=== ИЗМЕНЕНИЯ КОРЗИНЫ ===")
+    for row in bench_cart_mutations():
+        print(f"{row['mode']:>16}: {row['ns_per_operation']:8.0f} нс/операция")
+
+    print("\n=== ОБНОВЛЕНИЕ КОРЗИН ДО ПОСЛЕДНИХ ВЕРСИЙ ТОВАРОВ ===")
+    row = bench_cart_refresh()
+    print(f"{row['carts']} корзин, обновлено строк {row['lines_updated']}: {row['us_per_cart']:.1f} мкс/корзина")
+
+    print("\n=== КОРЗИНЫ СЕССИЙ ===")
+    row = bench_sessions()
+    print(f"Память на корзину: Cart {row['cart_bytes']:.0f} Б, SessionCart {row['session_cart_bytes']:.0f} Б")
+    print(f"{row['sessions']} сессий: {row['seconds']:.1f} с, вытеснено {row['evictions']} "
+          f"({row['eviction_us']:.1f} мкс), загружено {row['rehydrations']} ({row['rehydration_us']:.1f} мкс)")
+
+    print("\n=== НАКЛАДНЫЕ РАСХОДЫ МЕТРИК ===")
+    for row in bench_metrics_overhead():
+        print(f"{'включены' if row['metrics'] else 'выключены':>10}: {row['ns_per_operation']:8.0f} нс/операция")
+
+    print("\n=== ПАКЕТНЫЙ СЦЕНАРИЙ ===")
+    row = bench_script_replay()
+    print(f"{row['commands']} команд: {row['commands_per_sec']:10.0f} команд/с")
+
+    print("\n=== СОРТИРОВКА КОРЗИНЫ ===")
+    for row in bench_sort():
+        print(f"{row['algorithm']:>9}, {row['lines']} строк: {row['seconds'] * 1e3:8.1f} мс")
+
+    print("\n=== ПЕРВАЯ СТРАНИЦА КАТАЛОГА ===")
+    for row in bench_first_page():
+        print(f"{row['size']:>9} товаров: сортировка {row['sort_ms']:8.1f} мс, top-k {row['page_ms']:8.1f} мс")
+
+    print("\n=== ВЫВОД КАТАЛОГА ===")
+    for row in bench_render():
+        print(f"{row['mode']:>5}, {row['size']} товаров: {row['ms']:8.1f} мс")
+
+    print("\n=== HTTP-СЕРВИС ===")
+    row = bench_service()
+    print(f"{row['requests']} запросов: {row['requests_per_sec']:.0f} запросов/с, p50 {row['p50_ms']:.2f} мс, "
+          f"p99 {row['p99_ms']:.2f} мс, товаров на пакет поиска {row['lookups_per_batch']:.1f}")
+
+    print("\n=== ЗАПРОС ПО ДИАПАЗОНУ ЦЕН ===")
+    row = bench_range_query()
+    print(f"{row['size']} товаров: проход {row['scan_ms']:.2f} мс, "
+          f"индекс {row['index_ms']:.3f} мс (построение {row['index_build_ms']:.0f} мс)")
+
+    print("\n=== АГРЕГАТЫ ПО КАТЕГОРИЯМ ===")
+    row = bench_facets()
+    print(f"{row['size']} товаров: проход {row['scan_ms']:.0f} мс, индекс {row['index_ms']:.3f} мс "
+          f"(построение {row['index_build_ms']:.0f} мс, изменение товара {row['edit_us']:.1f} мкс)")
+
+    print("\n=== КЭШ ПРЕДСТАВЛЕНИЙ КАТАЛОГА ===")
+    row = bench_view_cache()
+    print(f"{row['size']} товаров, {row['edits']} изменений: заново {row['rebuild_ms']:.0f} мс, "
+          f"через кэш {row['cached_ms']:.1f} мс")
+
+    print("\n=== ПОДСКАЗКИ ПРИ НАБОРЕ ===")
+    report = bench_search()
+    print(f"{report['size']} товаров: индекс {report['index_mb']:.0f} МБ, построение {report['build_s']:.1f} с")
+    for row in report['queries']:
+        print(f"{row['query']!r:>18}: {row['ms']:.3f} мс")
+
+    print("\n=== ЗАГРУЗКА КАТАЛОГА ИЗ ХРАНИЛИЩА ===")
+    for row in bench_startup():
+        print(f"{row['source']:>7}, {row['storage']:>16}: {row['seconds']:6.2f} с")
+
+    print("\n=== ИМПОРТ И ВЫГРУЗКА КАТАЛОГА ===")
+    for row in bench_import():
+        print(f"{row['mode']:>10}, {row['rows']} строк: {row['rows_per_sec']:10.0f} строк/с")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности магазина")
+    parser.add_argument('--suite', choices=sorted(SUITE_PROFILES),
+                        help="набор замеров горячих путей вместо сравнительного отчета")
+    parser.add_argument('--repeat', type=int, default=5, help="число повторов каждого замера")
+    parser.add_argument('--output', metavar='FILE', help="записать результаты набора в JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="сравнить с результатами из JSON")
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help="допустимое замедление относительно базовых результатов (доля)")
+    args = parser.parse_args(argv)
+
+    if args.suite is None:
+        print_report()
+        return 0
+
+    report = run_suite(args.suite, args.repeat)
+    for name, timing in report['results'].items():
+        print(f"{name:<45} {timing['best_ns']:12.1f} нс  (медиана {timing['median_ns']:.1f})")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print("\n=== ЗАМЕДЛЕНИЯ ОТНОСИТЕЛЬНО БАЗОВЫХ РЕЗУЛЬТАТОВ ===")
+            for name, before, after, change in regressions:
+                print(f"{name:<45} {before:12.1f} -> {after:12.1f} нс  (+{change:.0%})")
+            return 1
+        print("\nЗамедлений относительно базовых результатов нет.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
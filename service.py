@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from store import Cart, LatencyHistogram, ProductNotFound, Sorter, TextInterface
+
+
+class ServiceError(Exception):
+    """Ошибка запроса с HTTP-статусом ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LookupBatcher:
+    """Объединение одновременных запросов товаров по ID в один вызов каталога
+
+    Запросы, пришедшие за одну итерацию цикла событий, копятся в
+    словаре ID -> ожидающие future и разрешаются одним get_products
+    в следующем проходе цикла.
+    """
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+        self._pending = {}
+        self.batches = 0
+        self.lookups = 0
+
+    def lookup(self, product_id):
+        """Future с товаром или None"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.setdefault(product_id, []).append(future)
+        return future
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        self.batches += 1
+        self.lookups += len(pending)
+        for futures, product in zip(pending.values(), self._catalog.get_products(list(pending))):
+            for future in futures:
+                if not future.done():
+                    future.set_result(product)
+
+
+class CatalogService:
+    """HTTP/JSON-сервис каталога и корзин покупок на asyncio
+
+    Соединения HTTP/1.1 по умолчанию остаются открытыми, запросы одного
+    соединения (в том числе отправленные конвейером без ожидания
+    ответов) обрабатываются и получают ответы по порядку. Корзины
+    хранятся в памяти процесса и получают правила скидок и ставку
+    налога корзины-образца pricing.
+    """
+
+    ROUTES = (
+        ('GET', r'/products', '_list_products'),
+        ('GET', r'/products/(\d+)', '_get_product'),
+        ('GET', r'/search', '_search'),
+        ('GET', r'/facets', '_facets'),
+        ('POST', r'/carts', '_create_cart'),
+        ('GET', r'/carts/(\w+)', '_get_cart'),
+        ('DELETE', r'/carts/(\w+)', '_delete_cart'),
+        ('POST', r'/carts/(\w+)/items', '_add_item'),
+        ('DELETE', r'/carts/(\w+)/items/(\d+)', '_remove_item'),
+        ('POST', r'/carts/(\w+)/sort', '_sort_cart'),
+        ('POST', r'/carts/(\w+)/discounts', '_add_discount'),
+        ('GET', r'/carts/(\w+)/total', '_cart_total'),
+    )
+    REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+    def __init__(self, product_catalog, pricing=None):
+        self.product_catalog = product_catalog
+        self.pricing = pricing
+        self.carts = {}
+        self.batcher = LookupBatcher(product_catalog)
+        self.requests = 0
+        self._cart_ids = itertools.count(1)
+        self._routes = [(method, re.compile(pattern + '$'), name) for method, pattern, name in self.ROUTES]
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Запуск сервера; возвращает asyncio.Server"""
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                except ValueError:
+                    writer.write(self._response(400, {'error': "Неверная строка запроса"}, False))
+                    break
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    writer.write(self._response(400, {'error': "Неверный заголовок Content-Length"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                status, payload = await self.handle(method, target, body)
+                writer.write(self._response(status, payload, keep_alive))
+                if not keep_alive:
+                    break
+                await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _response(self, status, payload, keep_alive):
+        # Готовый JSON (вывод Renderer) передается строкой и не кодируется повторно
+        body = (payload if isinstance(payload, str)
+                else json.dumps(payload, ensure_ascii=False, separators=(',', ':'))).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode('ascii') + body
+
+    async def handle(self, method, target, body=b''):
+        """Обработка одного запроса; возвращает (статус, данные ответа)"""
+        self.requests += 1
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, name in self._routes:
+            match = pattern.match(url.path)
+            if match is None:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                data = json.loads(body) if body else {}
+                result = getattr(self, name)(query, data, *match.groups())
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except ServiceError as error:
+                return error.status, {'error': str(error)}
+            except (ValueError, TypeError, KeyError) as error:
+                return 400, {'error': str(error)}
+            except Exception as error:
+                return 500, {'error': f"{type(error).__name__}: {error}"}
+            status = 201 if method == 'POST' and name == '_create_cart' else 200
+            return status, result
+        if allowed:
+            return 405, {'error': f"Метод {method} не поддерживается"}
+        return 404, {'error': f"Адрес {url.path} не найден"}
+
+    @staticmethod
+    def _int(query, name, default=None):
+        value = query.get(name)
+        return default if value is None else int(value)
+
+    def _cart(self, cart_id):
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            raise ServiceError(404, f"Корзина {cart_id} не найдена")
+        return cart
+
+    def _list_products(self, query, data):
+        if 'ids' in query:
+            ids = [int(value) for value in query['ids'].split(',') if value]
+            return [None if product is None else dict(product)
+                    for product in self.product_catalog.get_products(ids)]
+        fields = query['fields'].split(',') if query.get('fields') else None
+        return ''.join(self.product_catalog.render_catalog(
+            'json', fields, self._int(query, 'page'), self._int(query, 'limit'), self._int(query, 'offset', 0)))
+
+    async def _get_product(self, query, data, product_id):
+        product = await self.batcher.lookup(int(product_id))
+        if product is None:
+            raise ServiceError(404, ProductNotFound(int(product_id)).message())
+        return dict(product)
+
+    def _search(self, query, data):
+        products = self.product_catalog.search(query.get('q', ''), self._int(query, 'limit'),
+                                               query.get('prefix') == '1')
+        return [dict(product) for product in products]
+
+    def _facets(self, query, data):
+        return self.product_catalog.facets()
+
+    def _create_cart(self, query, data):
+        cart_id = str(next(self._cart_ids))
+        cart = self.carts[cart_id] = Cart(self.product_catalog)
+        if self.pricing is not None:
+            cart.discount_rules = list(self.pricing.discount_rules)
+            cart.tax_rate = self.pricing.tax_rate
+        return {'cart': cart_id}
+
+    def _get_cart(self, query, data, cart_id):
+        cart = self._cart(cart_id)
+        lines = ''.join(cart.render('json')).rstrip()
+        total = json.dumps(cart.calculate_total(), separators=(',', ':'))
+        return f'{{"cart":{json.dumps(cart_id)},"lines":{lines},"total":{total}}}'
+
+    def _delete_cart(self, query, data, cart_id):
+        self._cart(cart_id)
+        del self.carts[cart_id]
+        return {'deleted': cart_id}
+
+    def _add_item(self, query, data, cart_id):
+        cart = self._cart(cart_id)
+        product_id = int(data['product_id'])
+        quantity = int(data.get('quantity', 1))
+        if quantity <= 0:
+            raise ValueError("Количество должно быть положительным")
+        if not cart.add_item(product_id, quantity):
+            raise ServiceError(404, ProductNotFound(product_id).message())
+        return {'lines': cart.line_count, 'subtotal': cart.calculate_subtotal()}
+
+    def _remove_item(self, query, data, cart_id, product_id):
+        cart = self._cart(cart_id)
+        quantity = self._int(query, 'quantity')
+        if quantity is not None and quantity <= 0:
+            raise ValueError("Количество должно быть положительным")
+        if not cart.remove_item(int(product_id), quantity):
+            raise ServiceError(404, f"Товар с ID {product_id} не найден в корзине")
+        return {'lines': cart.line_count, 'subtotal': cart.calculate_subtotal()}
+
+    def _sort_cart(self, query, data, cart_id):
+        cart = self._cart(cart_id)
+        if cart.line_count:
+            cart.items = Sorter.sort(cart.items, algorithm=data.get('algorithm', 'tim'),
+                                     key=data.get('key', 'price'), reverse=bool(data.get('reverse')))
+        return [item['product']['id'] for item in cart.items]
+
+    def _add_discount(self, query, data, cart_id):
+        cart = self._cart(cart_id)
+        cart.add_discount_rule(**data)
+        return {'rules': len(cart.discount_rules)}
+
+    def _cart_total(self, query, data, cart_id):
+        return self._cart(cart_id).calculate_total(query.get('include_tax', '1') == '1',
+                                                   query.get('apply_discounts', '1') == '1')
+
+
+class LoadClient:
+    """Клиент HTTP/1.1 для нагрузочного теста: одно соединение, запросы конвейером"""
+
+    def __init__(self, reader, writer, host):
+        self._reader = reader
+        self._writer = writer
+        self._host = host
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, host)
+
+    def send(self, method, target, payload=None):
+        """Отправка запроса без ожидания ответа"""
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self._writer.write(f"{method} {target} HTTP/1.1\r\nHost: {self._host}\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+
+    async def receive(self):
+        """Следующий ответ соединения: (статус, данные)"""
+        head = await self._reader.readuntil(b'\r\n\r\n')
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        body = await self._reader.readexactly(length)
+        return int(lines[0].split(' ', 2)[1]), json.loads(body)
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+async def _shopping_session(client, rng, catalog_size, pipeline, histogram, statuses):
+    """Сеанс покупателя: поиск, просмотр товаров конвейером, корзина, итоги, сортировка"""
+    async def call(*requests):
+        started = time.perf_counter_ns()
+        for request in requests:
+            client.send(*request)
+        results = []
+        for _ in requests:
+            status, data = await client.receive()
+            histogram.observe(time.perf_counter_ns() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            results.append(data)
+        return results
+
+    await call(('GET', f"/search?q={rng.choice(('pro', 'black', 'samsung', 'mini'))}&limit=10&prefix=1"))
+    viewed = [rng.randint(1, catalog_size) for _ in range(pipeline)]
+    await call(*[('GET', f"/products/{product_id}") for product_id in viewed])
+    [created] = await call(('POST', '/carts'))
+    cart = created['cart']
+    await call(*[('POST', f"/carts/{cart}/items", {'product_id': product_id, 'quantity': rng.randint(1, 3)})
+                 for product_id in viewed[:rng.randint(1, len(viewed))]])
+    await call(('GET', f"/carts/{cart}/total"))
+    await call(('POST', f"/carts/{cart}/sort", {'algorithm': 'tim', 'key': ['category', '-price']}))
+    await call(('DELETE', f"/carts/{cart}/items/{viewed[0]}"), ('GET', f"/carts/{cart}"))
+    await call(('DELETE', f"/carts/{cart}"))
+
+
+async def run_load(host='127.0.0.1', port=8080, connections=32, sessions=1000, pipeline=8,
+                   catalog_size=None, seed=0):
+    """Нагрузочный тест: connections соединений выполняют sessions сеансов покупателей
+
+    Просмотры товаров и добавления в корзину отправляются пакетами по
+    pipeline запросов без ожидания ответов. Задержка запроса считается
+    от отправки его пакета до получения ответа. Возвращает число запросов,
+    запросы в секунду, перцентили задержки в миллисекундах и статусы ответов.
+    """
+    rng = random.Random(seed)
+    histogram = LatencyHistogram()
+    statuses = {}
+    if catalog_size is None:
+        client = await LoadClient.connect(host, port)
+        client.send('GET', '/facets')
+        _, facets = await client.receive()
+        await client.close()
+        catalog_size = max(1, sum(facet['count'] for facet in facets.values()))
+    remaining = itertools.count(sessions, -1)
+
+    async def worker(worker_rng):
+        client = await LoadClient.connect(host, port)
+        try:
+            while next(remaining) > 0:
+                await _shopping_session(client, worker_rng, catalog_size, pipeline, histogram, statuses)
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(random.Random(rng.random())) for _ in range(connections)])
+    seconds = time.perf_counter() - started
+    return {
+        'requests': histogram.count,
+        'seconds': seconds,
+        'requests_per_sec': histogram.count / seconds,
+        'p50_ms': histogram.percentile(0.50) / 1e6,
+        'p95_ms': histogram.percentile(0.95) / 1e6,
+        'p99_ms': histogram.percentile(0.99) / 1e6,
+        'max_ms': histogram.max / 1e6,
+        'statuses': statuses,
+    }
+
+
+async def _serve(service, host, port):
+    server = await service.start(host, port)
+    print(f"Сервис запущен на http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    """Точка входа: запуск сервиса или нагрузочного теста уже запущенного сервиса"""
+    parser = argparse.ArgumentParser(description="HTTP/JSON-сервис каталога и корзин")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data', metavar='DIR', help="каталог хранилища товаров и правил скидок")
+    parser.add_argument('--load', action='store_true', help="нагрузочный тест вместо запуска сервиса")
+    parser.add_argument('--connections', type=int, default=32, help="число соединений нагрузочного теста")
+    parser.add_argument('--sessions', type=int, default=1000, help="число сеансов покупателей")
+    parser.add_argument('--pipeline', type=int, default=8, help="запросов в пакете без ожидания ответов")
+    args = parser.parse_args(argv)
+
+    if args.load:
+        report = asyncio.run(run_load(args.host, args.port, args.connections, args.sessions, args.pipeline))
+        print(f"{report['requests']} запросов за {report['seconds']:.2f} с: "
+              f"{report['requests_per_sec']:.0f} запросов/с")
+        print(f"Задержка: p50 {report['p50_ms']:.2f} мс, p95 {report['p95_ms']:.2f} мс, "
+              f"p99 {report['p99_ms']:.2f} мс, максимум {report['max_ms']:.2f} мс")
+        print(f"Статусы ответов: {report['statuses']}")
+        return 0
+
+    interface = TextInterface(args.data, verbose=False)
+    try:
+        asyncio.run(_serve(CatalogService(interface.product_catalog, interface.cart), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        interface.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,166 +1,2566 @@
-class Product:
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import csv
+import heapq
+import io
+from itertools import accumulate, count, islice
+import json
+import logging
+import mmap
+from multiprocessing import shared_memory
+import os
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него запросы выполняются циклом по array
+    np = None
+
+
+# События каталога и корзины. Они создаются, только если у объекта есть
+# подписчики, а текст сообщения формируется лишь при вызове message()
+
+class ProductAdded(namedtuple('ProductAdded', 'product')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар '{self.product['name']}' (ID: {self.product['id']}) добавлен в каталог."
+
+
+class ProductUpdated(namedtuple('ProductUpdated', 'product_id changes')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар с ID {self.product_id} обновлен."
+
+
+class ProductDeleted(namedtuple('ProductDeleted', 'product')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар '{self.product['name']}' (ID: {self.product['id']}) удален из каталога."
+
+
+class ProductNotFound(namedtuple('ProductNotFound', 'product_id')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар с ID {self.product_id} не найден."
+
+
+class InvalidFieldValue(namedtuple('InvalidFieldValue', 'product_id field value')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Ошибка: неверный формат для поля {self.field}"
+
+
+class CartItemAdded(namedtuple('CartItemAdded', 'product quantity')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар '{self.product['name']}' добавлен в корзину."
+
+
+class CartItemIncreased(namedtuple('CartItemIncreased', 'product quantity line_quantity')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Количество товара '{self.product['name']}' в корзине увеличено до {self.line_quantity}."
+
+
+class CartItemRemoved(namedtuple('CartItemRemoved', 'product quantity')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар '{self.product['name']}' полностью удален из корзины."
+
+
+class CartItemDecreased(namedtuple('CartItemDecreased', 'product quantity line_quantity')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Количество товара '{self.product['name']}' уменьшено до {self.line_quantity}."
+
+
+class CartItemNotFound(namedtuple('CartItemNotFound', 'product_id')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Товар с ID {self.product_id} не найден в корзине."
+
+
+class OutOfStock(namedtuple('OutOfStock', 'product quantity available')):
+    __slots__ = ()
+
+    def message(self):
+        return (f"Недостаточно товара '{self.product['name']}' на складе: "
+                f"запрошено {self.quantity}, доступно {self.available}.")
+
+
+class ReservationExpired(namedtuple('ReservationExpired', 'product quantity')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Резерв товара '{self.product['name']}' истек, из корзины убрано {self.quantity} шт."
+
+
+class CartRefreshed(namedtuple('CartRefreshed', 'updated removed')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Корзина обновлена: строк с новыми версиями товаров {self.updated}, удалено строк {self.removed}."
+
+
+class CartCleared(namedtuple('CartCleared', '')):
+    __slots__ = ()
+
+    def message(self):
+        return "Корзина очищена."
+
+
+class DiscountRuleAdded(namedtuple('DiscountRuleAdded', 'rule')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Добавлено правило скидки: {self.rule}"
+
+
+class TaxRateSet(namedtuple('TaxRateSet', 'rate')):
+    __slots__ = ()
+
+    def message(self):
+        return f"Ставка налога установлена: {self.rate * 100}%"
+
+
+def print_event(event):
+    """Подписчик, выводящий сообщение события на экран"""
+    print(event.message())
+
+
+def log_events(logger=None, level=logging.INFO):
+    """Подписчик, записывающий события в журнал logging"""
+    logger = logger or logging.getLogger('store')
+
+    def log(event):
+        if logger.isEnabledFor(level):
+            logger.log(level, event.message(), extra={'event': event})
+    return log
+
+
+class EventSource:
+    """Рассылка событий подписчикам; без подписчиков события не создаются"""
+
+    _subscribers = ()
+
+    def subscribe(self, callback):
+        """Подписка функции callback(event) на события объекта"""
+        # Кортеж заменяется целиком, поэтому подписчики могут отписываться во время рассылки
+        self._subscribers = self._subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        """Отмена подписки"""
+        subscribers = list(self._subscribers)
+        subscribers.remove(callback)
+        self._subscribers = tuple(subscribers)
+
+    def _emit(self, event):
+        for callback in self._subscribers:
+            callback(event)
+
+
+class Change(namedtuple('Change', 'version kind old new')):
+    """Запись ленты изменений каталога
+
+    kind - 'add', 'edit', 'delete' или 'reset'; old и new - записи товара
+    до и после изменения (None, если записи нет). После 'reset' все
+    производные данные каталога нужно строить заново.
+    """
+    __slots__ = ()
+
+
+class ProductRecord:
+    """Запись товара с полями в __slots__ и доступом как к словарю
+
+    Запись занимает около трети памяти словаря с теми же полями. Чтение
+    product['price'], product.get(...), dict(product) и сравнение со
+    словарем работают как раньше. Запись не изменяется: новая версия
+    товара создается через replace(). Строки категорий интернируются,
+    поэтому у товаров одной категории она хранится один раз.
+    """
+
+    __slots__ = ('id', 'name', 'category', 'price', 'weight', 'description', 'version')
+
+    FIELDS = __slots__
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, id, name, category, price, weight, description, version=1):
+        self.id = id
+        self.name = name
+        self.category = sys.intern(category) if type(category) is str else category
+        self.price = price
+        self.weight = weight
+        self.description = description
+        self.version = version
+
+    @classmethod
+    def from_mapping(cls, product):
+        """Запись из словаря товара; товар без версии получает первую"""
+        if type(product) is cls:
+            return product
+        return cls(product['id'], product['name'], product['category'], product['price'],
+                   product['weight'], product['description'], product.get('version', 1))
+
+    def replace(self, **changes):
+        """Новая запись с измененными полями"""
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(changes)
+        return ProductRecord(**values)
+
+    def __getitem__(self, field):
+        if field in self._FIELD_SET:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __contains__(self, field):
+        return field in self._FIELD_SET
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self._FIELD_SET else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def values(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.FIELDS]
+
+    def __eq__(self, other):
+        if isinstance(other, ProductRecord):
+            return self.values() == other.values()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class Product(EventSource):
     def __init__(self):
-        self.products = []
+        # Индекс ID -> товар; dict сохраняет порядок добавления,
+        # поэтому отдельный список для display_catalog не нужен
+        self._products = {}
         self.next_id = 1
+        # Наблюдатели хранилища (индексы), получающие каждое изменение товаров
+        self._listeners = []
+        self._sorted_indexes = {}
+        self._search_index = None
+        self._facets = None
+        # Внешние артикулы товаров для обновления при импорте: SKU -> ID и ID -> SKU
+        self._skus = {}
+        self._sku_by_id = {}
+        # Версия каталога растет на единицу с каждым изменением; последние
+        # FEED_SIZE изменений хранятся в ленте для changes_since
+        self.version = 0
+        self._feed = deque(maxlen=self.FEED_SIZE)
+
+    # Поля, по которым строятся отсортированные индексы
+    INDEXED_FIELDS = ('price', 'weight', 'name', 'category')
+    # Колонки выгрузки каталога по умолчанию
+    EXPORT_FIELDS = ('id', 'sku', 'name', 'category', 'price', 'weight', 'description')
+    # Сколько последних изменений хранит лента
+    FEED_SIZE = 10000
+
+    @property
+    def products(self):
+        """Список товаров в порядке добавления"""
+        return list(self._products.values())
+
+    @products.setter
+    def products(self, products):
+        self._products = {product['id']: self._versioned(product) for product in products}
+        self._reset()
+
+    @staticmethod
+    def _versioned(product):
+        """Запись товара с номером версии; товары без него получают первую версию"""
+        return ProductRecord.from_mapping(product)
+
+    def __len__(self):
+        return len(self._products)
+
+    def __iter__(self):
+        return iter(self._products.values())
 
     def _find_product_by_id(self, product_id):
         """Поиск товара по ID"""
-        for product in self.products:
-            if product['id'] == product_id:
-                return product
-        return None
+        return self._products.get(product_id)
+
+    def _insert(self, product):
+        """Сохранение нового товара в хранилище"""
+        self._products[product['id']] = product
+
+    def _update(self, product, changes):
+        """Запись новой версии товара в хранилище; прежняя запись не изменяется"""
+        self._products[product['id']] = self._products[product['id']].replace(**changes)
+
+    def _remove(self, product):
+        """Удаление товара из хранилища"""
+        del self._products[product['id']]
+
+    def _assign_sku(self, sku, product_id):
+        """Привязка внешнего артикула к товару"""
+        self._skus[sku] = product_id
+        self._sku_by_id[product_id] = sku
+
+    def _forget_sku(self, product_id):
+        """Удаление артикула удаленного товара"""
+        sku = self._sku_by_id.pop(product_id, None)
+        if sku is not None and self._skus.get(sku) == product_id:
+            del self._skus[sku]
+
+    def _added(self, product):
+        """Уведомление наблюдателей о новом товаре"""
+        self._record_change('add', None, product)
+        for listener in self._listeners:
+            listener.product_added(product)
+
+    def _updated(self, old, product):
+        """Уведомление наблюдателей об измененном товаре"""
+        self._record_change('edit', old, product)
+        for listener in self._listeners:
+            listener.product_updated(old, product)
+
+    def _removed(self, product):
+        """Уведомление наблюдателей об удаленном товаре"""
+        self._record_change('delete', product, None)
+        for listener in self._listeners:
+            listener.product_removed(product)
+
+    def _reset(self):
+        """Уведомление наблюдателей о полной замене содержимого каталога"""
+        self._feed.clear()
+        self._record_change('reset', None, None)
+        for listener in self._listeners:
+            listener.catalog_reset(self)
+
+    def _record_change(self, kind, old, new):
+        """Новая версия каталога и запись о ней в ленте изменений"""
+        self.version += 1
+        self._feed.append(Change(self.version, kind, old, new))
+
+    def _reading(self):
+        """Контекст согласованного чтения версии и содержимого каталога"""
+        return contextlib.nullcontext()
+
+    def changes_since(self, version):
+        """Изменения каталога после версии version по порядку
+
+        Возвращает None, если часть этих изменений уже вытеснена из
+        ленты или version не из истории этого каталога (больше текущей):
+        тогда производные данные нужно строить заново.
+        """
+        if version > self.version:
+            return None
+        if version == self.version:
+            return []
+        feed = self._feed
+        if not feed or feed[0].version > version + 1:
+            return None
+        return list(islice(feed, version + 1 - feed[0].version, None))
+
+    def _columns(self):
+        """Содержимое каталога по колонкам: ID, названия, словарь и коды категорий, цены, веса, описания"""
+        products = list(self)
+        category_names = []
+        category_index = {}
+        category_codes = array('i')
+        for product in products:
+            code = category_index.get(product['category'])
+            if code is None:
+                code = category_index[product['category']] = len(category_names)
+                category_names.append(product['category'])
+            category_codes.append(code)
+        return (
+            array('q', [product['id'] for product in products]),
+            [product['name'] for product in products],
+            category_names,
+            category_codes,
+            array('d', [product['price'] for product in products]),
+            array('d', [product['weight'] for product in products]),
+            [product['description'] for product in products]
+        )
+
+    def _load_columns(self, ids, names, category_names, category_codes, prices, weights, descriptions):
+        """Замена содержимого каталога товарами из колонок"""
+        categories = [category_names[code] for code in category_codes]
+        self._products = {
+            product_id: ProductRecord(product_id, name, category, price, weight, description)
+            for product_id, name, category, price, weight, description
+            in zip(ids, names, categories, prices, weights, descriptions)
+        }
+        self._reset()
+
+    def _edited_versions(self):
+        """Версии товаров, которые менялись после добавления: ID -> версия"""
+        return {product['id']: product['version'] for product in self if product['version'] != 1}
+
+    def _restore_versions(self, versions):
+        """Восстановление версий товаров при загрузке каталога"""
+        for product_id, version in versions:
+            self._products[product_id] = self._products[product_id].replace(version=version)
 
     def add_product(self, name, category, price, weight, description):
         """Добавление товара в каталог"""
-        product = {
-            'id': self.next_id,
-            'name': name,
-            'category': category,
-            'price': float(price),
-            'weight': float(weight),
-            'description': description
-        }
-        self.products.append(product)
+        product = ProductRecord(self.next_id, name, category, float(price), float(weight), description)
+        self._insert(product)
+        self._added(product)
         self.next_id += 1
-        print(f"Товар '{name}' (ID: {product['id']}) добавлен в каталог.")
+        if self._subscribers:
+            self._emit(ProductAdded(product))
         return product['id']
 
     def edit_product(self, product_id, **kwargs):
         """Редактирование товара"""
         product = self._find_product_by_id(product_id)
         if not product:
-            print(f"Товар с ID {product_id} не найден.")
+            if self._subscribers:
+                self._emit(ProductNotFound(product_id))
             return False
 
         valid_fields = ['name', 'category', 'price', 'weight', 'description']
+        changes = {}
         for field, value in kwargs.items():
             if field in valid_fields:
                 if field in ['price', 'weight']:
                     try:
                         value = float(value)
                     except ValueError:
-                        print(f"Ошибка: неверный формат для поля {field}")
+                        if self._subscribers:
+                            self._emit(InvalidFieldValue(product_id, field, value))
                         continue
-                product[field] = value
-        print(f"Товар с ID {product_id} обновлен.")
+                if product[field] != value:
+                    changes[field] = value
+        # Без изменений новая версия не создается и в журнал ничего не пишется
+        if changes:
+            self._apply_changes(product, changes)
+        if self._subscribers:
+            self._emit(ProductUpdated(product_id, changes))
         return True
 
+    def _apply_changes(self, product, changes):
+        """Запись изменений товара новой версией с уведомлением наблюдателей
+
+        Выданные ранее записи товара (например, в строках корзин) остаются
+        прежними: корзина переходит на новую версию только в Cart.refresh.
+        """
+        old = self._find_product_by_id(product['id'])
+        self._update(old, dict(changes, version=old['version'] + 1))
+        self._updated(old, self._find_product_by_id(product['id']))
+
     def delete_product(self, product_id):
         """Удаление товара из каталога"""
         product = self._find_product_by_id(product_id)
         if not product:
-            print(f"Товар с ID {product_id} не найден.")
+            if self._subscribers:
+                self._emit(ProductNotFound(product_id))
             return False
 
-        self.products.remove(product)
-        print(f"Товар '{product['name']}' (ID: {product_id}) удален из каталога.")
+        self._remove(product)
+        self._forget_sku(product_id)
+        self._removed(product)
+        if self._subscribers:
+            self._emit(ProductDeleted(product))
         return True
 
     def get_product_info(self, product_id):
         """Получение информации о товаре"""
         product = self._find_product_by_id(product_id)
         if not product:
-            print(f"Товар с ID {product_id} не найден.")
+            if self._subscribers:
+                self._emit(ProductNotFound(product_id))
             return None
         return product
 
-    def display_catalog(self):
+    def get_products(self, product_ids):
+        """Товары по списку ID одним вызовом; для отсутствующих - None"""
+        find = self._find_product_by_id
+        return [find(product_id) for product_id in product_ids]
+
+    def render_catalog(self, format='text', fields=None, page=None, limit=None, offset=0):
+        """Генератор частей вывода каталога: text, csv или json
+
+        page/limit/offset выбирают часть товаров в порядке добавления,
+        fields - выводимые поля (по умолчанию все).
+        """
+        products = Renderer.select(iter(self), page, limit, offset)
+        if format != 'text':
+            yield from Renderer.render(products, Renderer.CATALOG_LABELS, format, fields)
+            return
+        yield "\n=== КАТАЛОГ ТОВАРОВ ===\n"
+        yield from Renderer.render(products, Renderer.CATALOG_LABELS, format, fields)
+        yield "\n=======================\n"
+
+    def display_catalog(self, format='text', fields=None, page=None, limit=None, offset=0):
         """Отображение каталога товаров"""
-        print("\n=== КАТАЛОГ ТОВАРОВ ===")
-        for product in self.products:
-            print(f"\nID: {product['id']}")
-            print(f"Название: {product['name']}")
-            print(f"Категория: {product['category']}")
-            print(f"Цена: {product['price']:.2f} руб.")
-            print(f"Вес: {product['weight']:.2f} кг")
-            print(f"Описание: {product['description']}")
-        print("\n=======================")
-
-
-class Cart:
+        Renderer.write(self.render_catalog(format, fields, page, limit, offset))
+
+    def find_by_sku(self, sku):
+        """Поиск товара по внешнему артикулу"""
+        product_id = self._skus.get(sku)
+        return None if product_id is None else self._find_product_by_id(product_id)
+
+    def import_products(self, source, format=None, batch_size=10000, max_errors=100):
+        """Потоковый импорт товаров из CSV или JSONL
+
+        source - путь к файлу или открытый текстовый файл; формат берется из
+        расширения, если не указан явно. Строки читаются пакетами по
+        batch_size, поэтому память не зависит от размера файла. Колонки:
+        name, category, price, weight, description и необязательный sku;
+        колонка id игнорируется. Строка с уже известным артикулом обновляет
+        товар (только если значения изменились), новые товары получают ID
+        блоком от next_id в порядке строк. Подписчики получают ProductAdded
+        и ProductUpdated по каждому товару. Возвращает статистику импорта
+        со скоростью в строках в секунду; в errors попадают первые
+        max_errors ошибок.
+        """
+        start = time.perf_counter()
+        stats = {'rows': 0, 'added': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []}
+        file = open(source, encoding='utf-8', newline='') if isinstance(source, (str, os.PathLike)) else source
+        try:
+            rows = self._read_rows(file, format or self._detect_format(file))
+            batch = list(islice(rows, batch_size))
+            while batch:
+                self._import_batch(batch, stats, max_errors)
+                batch = list(islice(rows, batch_size))
+        finally:
+            if file is not source:
+                file.close()
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    @staticmethod
+    def _detect_format(file):
+        """Формат файла по расширению"""
+        name = str(getattr(file, 'name', '')).lower()
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson', '.json')):
+            return 'jsonl'
+        raise ValueError(f"Не удалось определить формат файла {name!r}, укажите format='csv' или 'jsonl'")
+
+    @staticmethod
+    def _read_rows(file, format):
+        """Генератор пар (номер строки, запись) из CSV или JSONL"""
+        if format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        elif format == 'jsonl':
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+        else:
+            raise ValueError(f"Неизвестный формат {format}")
+
+    def _import_batch(self, batch, stats, max_errors):
+        """Проверка пакета строк, обновление известных товаров и добавление новых"""
+        errors = stats['errors']
+        # Новые товары в порядке строк файла: [артикул или None, поля]
+        new = []
+        new_by_sku = {}
+        for line_number, row in batch:
+            stats['rows'] += 1
+            error = None
+            if not isinstance(row, dict):
+                error = "неверный формат строки"
+            else:
+                name = row.get('name')
+                if not name or not isinstance(name, str):
+                    error = "не указано название"
+                else:
+                    try:
+                        price = float(row['price'])
+                        weight = float(row['weight'])
+                    except KeyError as missing:
+                        error = f"нет поля {missing.args[0]}"
+                    except (TypeError, ValueError):
+                        error = "неверный формат цены или веса"
+                    else:
+                        # Сравнение отбрасывает и отрицательные значения, и NaN
+                        if not (0 <= price < float('inf') and 0 <= weight < float('inf')):
+                            error = "цена и вес должны быть неотрицательными числами"
+            if error is not None:
+                stats['failed'] += 1
+                if len(errors) < max_errors:
+                    errors.append((line_number, error))
+                continue
+
+            fields = {'name': name, 'price': price, 'weight': weight}
+            # Отсутствующие категория и описание не затирают значения обновляемого товара
+            for field in ('category', 'description'):
+                if field in row:
+                    fields[field] = row[field] or ''
+            sku = row.get('sku')
+            sku = str(sku) if sku not in (None, '') else None
+            product = self.find_by_sku(sku) if sku is not None else None
+            if product is not None:
+                changes = {field: value for field, value in fields.items() if product[field] != value}
+                if changes:
+                    self._apply_changes(product, changes)
+                    stats['updated'] += 1
+                    if self._subscribers:
+                        self._emit(ProductUpdated(product['id'], changes))
+                else:
+                    stats['unchanged'] += 1
+            elif sku in new_by_sku:
+                # Повтор артикула внутри пакета обновляет еще не добавленный товар
+                entry = new_by_sku[sku]
+                pending = dict(entry[1], **fields)
+                stats['updated' if pending != entry[1] else 'unchanged'] += 1
+                entry[1] = pending
+            else:
+                entry = [sku, fields]
+                new.append(entry)
+                if sku is not None:
+                    new_by_sku[sku] = entry
+
+        product_id = self.next_id
+        self.next_id += len(new)
+        for sku, fields in new:
+            product = self._new_record(product_id, fields)
+            self._insert(product)
+            if sku is not None:
+                self._assign_sku(sku, product_id)
+            self._added(product)
+            if self._subscribers:
+                self._emit(ProductAdded(product))
+            product_id += 1
+        stats['added'] += len(new)
+
+    @staticmethod
+    def _new_record(product_id, fields):
+        """Запись нового товара из проверенных полей импорта"""
+        return ProductRecord(product_id, fields['name'], fields.get('category', ''), fields['price'],
+                             fields['weight'], fields.get('description', ''))
+
+    def export_rows(self, fields=None):
+        """Генератор записей каталога для выгрузки с артикулами"""
+        fields = fields or self.EXPORT_FIELDS
+        sku_by_id = self._sku_by_id
+        for product in self:
+            yield {
+                field: sku_by_id.get(product['id']) if field == 'sku' else product[field]
+                for field in fields
+            }
+
+    def export_products(self, destination, format=None, fields=None):
+        """Потоковая выгрузка каталога в CSV или JSONL; возвращает число товаров"""
+        fields = fields or self.EXPORT_FIELDS
+        file = (open(destination, 'w', encoding='utf-8', newline='')
+                if isinstance(destination, (str, os.PathLike)) else destination)
+        count = 0
+        try:
+            format = format or self._detect_format(file)
+            if format == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(fields)
+                for row in self.export_rows(fields):
+                    writer.writerow(['' if value is None else value for value in row.values()])
+                    count += 1
+            elif format == 'jsonl':
+                for row in self.export_rows(fields):
+                    file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    count += 1
+            else:
+                raise ValueError(f"Неизвестный формат {format}")
+        finally:
+            if file is not destination:
+                file.close()
+        return count
+
+    def _sorted_index(self, field):
+        """Отсортированный индекс по полю; строится при первом обращении"""
+        index = self._sorted_indexes.get(field)
+        if index is None:
+            if field not in self.INDEXED_FIELDS:
+                raise ValueError(f"Поле {field} не индексируется")
+            index = self._sorted_indexes[field] = SortedIndex(field, self)
+            self._listeners.append(index)
+        return index
+
+    def find_by_range(self, field, low=None, high=None):
+        """Товары со значением поля в диапазоне [low, high] по возрастанию поля"""
+        find = self._find_product_by_id
+        return [find(product_id) for _, product_id in self._sorted_index(field).irange(low, high)]
+
+    def find_by_prefix(self, prefix, field='name'):
+        """Товары, у которых значение поля начинается с prefix"""
+        find = self._find_product_by_id
+        return [find(product_id) for _, product_id in self._sorted_index(field).prefix(prefix)]
+
+    def iter_sorted(self, field, reverse=False):
+        """Товары в порядке значения поля"""
+        find = self._find_product_by_id
+        for _, product_id in self._sorted_index(field).irange(reverse=reverse):
+            yield find(product_id)
+
+    def _get_search_index(self):
+        """Полнотекстовый индекс; строится при первом поиске"""
+        if self._search_index is None:
+            self._search_index = SearchIndex(self)
+            self._listeners.append(self._search_index)
+        return self._search_index
+
+    def search(self, query, limit=None, prefix=False):
+        """Поиск товаров, в названии или описании которых есть все слова запроса
+
+        При prefix=True последнее слово запроса ищется как начало слова.
+        Результаты упорядочены по релевантности: совпадения в названии
+        весят больше совпадений в описании.
+        """
+        find = self._find_product_by_id
+        return [find(product_id) for product_id in self._get_search_index().search(query, limit, prefix)]
+
+    def suggest(self, text, limit=10):
+        """Подсказки при наборе: последнее слово текста считается недописанным"""
+        return self.search(text, limit=limit, prefix=not text[-1:].isspace())
+
+    def _get_facets(self):
+        """Агрегаты по категориям; строятся при первом запросе"""
+        if self._facets is None:
+            self._facets = CategoryFacets(self)
+            self._listeners.append(self._facets)
+        return self._facets
+
+    def facets(self, products=None):
+        """Количество товаров, минимальная, максимальная и средняя цена и общий вес по категориям
+
+        Без аргумента агрегаты всего каталога берутся из индекса за
+        O(число категорий). Если передан набор товаров (результат search,
+        find_by_range и т.п.), агрегаты считаются только по нему.
+        """
+        if products is None:
+            return self._get_facets().facets()
+        return CategoryFacets.aggregate(products)
+
+
+class SortedList:
+    """Отсортированный список, разбитый на блоки ограниченного размера
+
+    Вставка и удаление сдвигают элементы только внутри одного блока,
+    поиск границы диапазона - два бинарных поиска: по максимумам
+    блоков и внутри блока.
+    """
+
+    _LOAD = 1000
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        load = self._LOAD
+        self._blocks = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._size = len(values)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def add(self, value):
+        """Вставка значения с сохранением порядка"""
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            blocks.append([value])
+            maxes.append(value)
+        else:
+            i = min(bisect_left(maxes, value), len(maxes) - 1)
+            block = blocks[i]
+            insort(block, value)
+            maxes[i] = block[-1]
+            if len(block) > 2 * self._LOAD:
+                blocks.insert(i + 1, block[self._LOAD:])
+                del block[self._LOAD:]
+                maxes[i] = block[-1]
+                maxes.insert(i + 1, blocks[i + 1][-1])
+        self._size += 1
+
+    def remove(self, value):
+        """Удаление значения; ValueError, если его нет"""
+        blocks, maxes = self._blocks, self._maxes
+        i = bisect_left(maxes, value)
+        if i < len(maxes):
+            block = blocks[i]
+            j = bisect_left(block, value)
+            if block[j] == value:
+                del block[j]
+                if block:
+                    maxes[i] = block[-1]
+                else:
+                    del blocks[i]
+                    del maxes[i]
+                self._size -= 1
+                return
+        raise ValueError(f"{value!r} отсутствует в списке")
+
+    def irange(self, low=None, high=None, reverse=False):
+        """Значения из диапазона [low, high] по возрастанию или убыванию"""
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            return
+        if not reverse:
+            i = 0 if low is None else bisect_left(maxes, low)
+            j = 0 if low is None or i == len(blocks) else bisect_left(blocks[i], low)
+            for k in range(i, len(blocks)):
+                block = blocks[k]
+                for position in range(j if k == i else 0, len(block)):
+                    value = block[position]
+                    if high is not None and value > high:
+                        return
+                    yield value
+        else:
+            if high is None:
+                i, j = len(blocks) - 1, len(blocks[-1])
+            else:
+                i = min(bisect_right(maxes, high), len(blocks) - 1)
+                j = bisect_right(blocks[i], high)
+            for k in range(i, -1, -1):
+                block = blocks[k]
+                for position in range(j if k == i else len(block), 0, -1):
+                    value = block[position - 1]
+                    if low is not None and value < low:
+                        return
+                    yield value
+
+
+class SortedIndex:
+    """Отсортированный индекс каталога по одному полю
+
+    Хранит пары (значение поля, ID товара) и обновляется каталогом
+    при добавлении, изменении и удалении товаров.
+    """
+
+    def __init__(self, field, products):
+        self.field = field
+        self.entries = SortedList((product[field], product['id']) for product in products)
+
+    def product_added(self, product):
+        self.entries.add((product[self.field], product['id']))
+
+    def product_updated(self, old, product):
+        if old[self.field] != product[self.field]:
+            self.entries.remove((old[self.field], old['id']))
+            self.entries.add((product[self.field], product['id']))
+
+    def product_removed(self, product):
+        self.entries.remove((product[self.field], product['id']))
+
+    def catalog_reset(self, products):
+        self.entries = SortedList((product[self.field], product['id']) for product in products)
+
+    def irange(self, low=None, high=None, reverse=False):
+        """Пары (значение, ID) со значением в диапазоне [low, high]"""
+        # (low,) меньше любой пары с тем же значением, (high, inf) - больше
+        low_key = None if low is None else (low,)
+        high_key = None if high is None else (high, float('inf'))
+        return self.entries.irange(low_key, high_key, reverse)
+
+    def prefix(self, prefix):
+        """Пары (значение, ID) со строковым значением, начинающимся с prefix"""
+        for entry in self.entries.irange((prefix,)):
+            if not entry[0].startswith(prefix):
+                return
+            yield entry
+
+
+class SearchIndex:
+    """Инвертированный индекс по словам названия и описания товаров
+
+    Для каждого слова хранится множество ID товаров, в которых оно
+    встречается, и отдельно - множество товаров, где оно есть в названии
+    (для ранжирования). Отсортированный словарь слов нужен для поиска
+    по началу слова. Слова приводятся к нижнему регистру, 'ё' заменяется
+    на 'е', поэтому кириллица и латиница обрабатываются одинаково.
+    """
+
+    _TOKEN_RE = re.compile(r'\w+')
+    _EMPTY = frozenset()
+    # Во сколько раз проверка слов одного товара дороже обхода одного слова словаря
+    _CHECK_COST = 4
+    # Сколько первых товаров перебирать, прежде чем искать по множествам
+    _SCAN_BUDGET = 1000
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+        self._build(catalog)
+
+    @classmethod
+    def tokenize(cls, text):
+        """Слова текста в нормализованном виде"""
+        return cls._TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+    def _product_tokens(self, product):
+        """Слова названия и все слова товара"""
+        name_tokens = set(self.tokenize(product['name']))
+        return name_tokens, name_tokens.union(self.tokenize(product['description']))
+
+    def _build(self, products):
+        self._postings = {}
+        self._name_postings = {}
+        for product in products:
+            name_tokens, tokens = self._product_tokens(product)
+            self._add(self._name_postings, product['id'], name_tokens)
+            self._add(self._postings, product['id'], tokens)
+        self._vocabulary = SortedList(self._postings)
+
+    @staticmethod
+    def _add(postings, product_id, tokens):
+        """Добавление товара в списки слов; возвращает новые слова"""
+        new_tokens = []
+        for token in tokens:
+            ids = postings.get(token)
+            if ids is None:
+                postings[token] = {product_id}
+                new_tokens.append(token)
+            else:
+                ids.add(product_id)
+        return new_tokens
+
+    @staticmethod
+    def _discard(postings, product_id, tokens):
+        """Удаление товара из списков слов; возвращает исчезнувшие слова"""
+        removed_tokens = []
+        for token in tokens:
+            ids = postings[token]
+            ids.discard(product_id)
+            if not ids:
+                del postings[token]
+                removed_tokens.append(token)
+        return removed_tokens
+
+    def _index(self, product_id, name_tokens, tokens):
+        self._add(self._name_postings, product_id, name_tokens)
+        for token in self._add(self._postings, product_id, tokens):
+            self._vocabulary.add(token)
+
+    def _unindex(self, product_id, name_tokens, tokens):
+        self._discard(self._name_postings, product_id, name_tokens)
+        for token in self._discard(self._postings, product_id, tokens):
+            self._vocabulary.remove(token)
+
+    def product_added(self, product):
+        self._index(product['id'], *self._product_tokens(product))
+
+    def product_updated(self, old, product):
+        if old['name'] == product['name'] and old['description'] == product['description']:
+            return
+        old_name_tokens, old_tokens = self._product_tokens(old)
+        name_tokens, tokens = self._product_tokens(product)
+        self._unindex(product['id'], old_name_tokens - name_tokens, old_tokens - tokens)
+        self._index(product['id'], name_tokens - old_name_tokens, tokens - old_tokens)
+
+    def product_removed(self, product):
+        self._unindex(product['id'], *self._product_tokens(product))
+
+    def catalog_reset(self, catalog):
+        self._catalog = catalog
+        self._build(catalog)
+
+    def _prefix_tokens(self, prefix):
+        """Слова словаря, начинающиеся с prefix"""
+        for token in self._vocabulary.irange(prefix):
+            if not token.startswith(prefix):
+                return
+            yield token
+
+    def search(self, query, limit=None, prefix=False):
+        """ID товаров, содержащих все слова запроса, по убыванию релевантности
+
+        Выше товары, у которых больше слов запроса в названии; при
+        равенстве выше более ранний товар. С limit результат совпадает
+        с началом полной выдачи: частые запросы сначала ищутся перебором
+        первых товаров, остальные - операциями над множествами индекса,
+        после которых упорядочиваются только старшие группы.
+        """
+        terms = self.tokenize(query)
+        if not terms:
+            return []
+        partial = terms.pop() if prefix else None
+        if limit is not None and limit <= 0:
+            return []
+        term_ids = sorted((self._postings.get(term, self._EMPTY) for term in terms), key=len)
+        name_ids = [self._name_postings.get(term, self._EMPTY) for term in terms]
+
+        if limit is not None and (not term_ids or len(term_ids[0]) > self._SCAN_BUDGET):
+            # У частых слов и коротких префиксов (вроде «1» - десятки тысяч слов)
+            # лучшие товары обычно находятся среди первых ID
+            ranked = self._scan(term_ids, name_ids, partial, limit, self._SCAN_BUDGET)
+            if ranked is not None:
+                return ranked
+
+        # Пересечение начинается с самого короткого списка; множества индекса
+        # не изменяются, поэтому они не копируются
+        matches = None
+        for ids in term_ids:
+            matches = ids if matches is None else matches & ids
+        if partial is not None:
+            matches, in_name = self._match_prefix(partial, matches)
+            name_ids.append(in_name)
+        return self._ranked(matches, name_ids, limit)
+
+    def _match_prefix(self, partial, candidates=None):
+        """Товары со словом на partial (среди candidates) и товары со словом на partial в названии"""
+        if candidates is not None:
+            # Слов на partial может быть много (например, номеров моделей):
+            # тогда дешевле проверить слова самих кандидатов
+            tokens = list(islice(self._prefix_tokens(partial), len(candidates) * self._CHECK_COST + 1))
+            if len(tokens) > len(candidates) * self._CHECK_COST:
+                return self._check_prefix(partial, candidates)
+
+        tokens = list(self._prefix_tokens(partial))
+        postings = [self._postings[token] for token in tokens]
+        if candidates is None:
+            matches = set().union(*postings)
+        else:
+            # Списки длиннее candidates сначала сужаются до них, короткие
+            # объединяются как есть и отсеиваются одним пересечением
+            size = len(candidates)
+            matches = set().union(*(ids if len(ids) < size else candidates & ids for ids in postings))
+            matches &= candidates
+        name_postings = self._name_postings
+        in_name = set().union(*(name_postings.get(token, self._EMPTY) for token in tokens))
+        return matches, in_name
+
+    def _check_prefix(self, partial, candidates):
+        """_match_prefix проверкой слов каждого кандидата"""
+        find = self._catalog._find_product_by_id
+        matches = set()
+        in_name = set()
+        for product_id in candidates:
+            name_tokens, tokens = self._product_tokens(find(product_id))
+            if any(token.startswith(partial) for token in tokens):
+                matches.add(product_id)
+                if any(token.startswith(partial) for token in name_tokens):
+                    in_name.add(product_id)
+        return matches, in_name
+
+    def _scan(self, term_ids, name_ids, partial, limit, budget):
+        """Первые limit товаров выдачи перебором ID по возрастанию; None, если не хватило budget товаров
+
+        Перебор заканчивается, когда limit товаров набрано в самой старшей
+        возможной группе: товары с большими ID их уже не обойдут.
+        """
+        catalog = self._catalog
+        find = catalog._find_product_by_id
+        top = sum(1 for ids in name_ids if ids) + (partial is not None)
+        groups = [[] for _ in range(top + 1)]
+        end = min(catalog.next_id, budget + 1)
+        for product_id in range(1, end):
+            if not all(product_id in ids for ids in term_ids):
+                continue
+            hits = sum(product_id in ids for ids in name_ids)
+            if partial is not None:
+                product = find(product_id)
+                if product is None:
+                    continue
+                name_tokens, tokens = self._product_tokens(product)
+                if not any(token.startswith(partial) for token in tokens):
+                    continue
+                hits += any(token.startswith(partial) for token in name_tokens)
+            groups[hits].append(product_id)
+            if len(groups[top]) >= limit:
+                return groups[top]
+        if end < catalog.next_id:
+            return None
+        return [product_id for group in reversed(groups) for product_id in group][:limit]
+
+    @staticmethod
+    def _ranked(matches, name_ids, limit=None):
+        """Товары matches по убыванию числа множеств name_ids, в которые они входят, затем по ID"""
+        # at_least[hits] - товары matches, входящие не меньше чем в hits множеств
+        at_least = [matches]
+        for ids in name_ids:
+            if not ids:
+                continue
+            at_least.append(at_least[-1] & ids)
+            for hits in range(len(at_least) - 2, 0, -1):
+                at_least[hits] = at_least[hits] | (at_least[hits - 1] & ids)
+
+        ranked = []
+        for hits in range(len(at_least) - 1, -1, -1):
+            group = at_least[hits] - at_least[hits + 1] if hits + 1 < len(at_least) else at_least[hits]
+            if limit is None:
+                ranked.extend(sorted(group))
+            else:
+                ranked.extend(heapq.nsmallest(limit - len(ranked), group))
+                if len(ranked) >= limit:
+                    break
+        return ranked
+
+    def memory_usage(self):
+        """Оценка занимаемой индексом памяти в байтах"""
+        size = sys.getsizeof(self._postings) + sys.getsizeof(self._name_postings)
+        for postings in (self._postings, self._name_postings):
+            for ids in postings.values():
+                size += sys.getsizeof(ids)
+        size += sum(sys.getsizeof(token) for token in self._postings)
+        size += sum(sys.getsizeof(block) for block in self._vocabulary._blocks)
+        return size
+
+
+class CategoryFacets:
+    """Агрегаты каталога по категориям, обновляемые при каждом изменении
+
+    Для категории хранятся количество товаров, суммы цен и весов и
+    отсортированный список цен, из которого минимум и максимум берутся
+    без прохода по товарам. Запрос агрегатов - O(число категорий).
+    """
+
+    def __init__(self, products):
+        self._build(products)
+
+    def _build(self, products):
+        # Категория -> [количество, сумма цен, сумма весов, SortedList цен]
+        self._categories = {}
+        prices = {}
+        for product in products:
+            entry = self._entry(product['category'])
+            entry[0] += 1
+            entry[1] += product['price']
+            entry[2] += product['weight']
+            prices.setdefault(product['category'], []).append(product['price'])
+        for category, values in prices.items():
+            self._categories[category][3] = SortedList(values)
+
+    def _entry(self, category):
+        entry = self._categories.get(category)
+        if entry is None:
+            entry = self._categories[category] = [0, 0.0, 0.0, SortedList()]
+        return entry
+
+    def _add(self, product):
+        entry = self._entry(product['category'])
+        entry[0] += 1
+        entry[1] += product['price']
+        entry[2] += product['weight']
+        entry[3].add(product['price'])
+
+    def _discard(self, product):
+        category = product['category']
+        entry = self._categories[category]
+        if entry[0] == 1:
+            # Суммы пустой категории не сохраняются, чтобы не копить ошибку округления
+            del self._categories[category]
+            return
+        entry[0] -= 1
+        entry[1] -= product['price']
+        entry[2] -= product['weight']
+        entry[3].remove(product['price'])
+
+    def product_added(self, product):
+        self._add(product)
+
+    def product_updated(self, old, product):
+        if (old['category'] != product['category'] or old['price'] != product['price']
+                or old['weight'] != product['weight']):
+            self._discard(old)
+            self._add(product)
+
+    def product_removed(self, product):
+        self._discard(product)
+
+    def catalog_reset(self, products):
+        self._build(products)
+
+    @staticmethod
+    def _facet(count, price_sum, weight_sum, min_price, max_price):
+        return {
+            'count': count,
+            'min_price': min_price,
+            'max_price': max_price,
+            'avg_price': price_sum / count,
+            'total_weight': weight_sum,
+        }
+
+    def facets(self):
+        """Агрегаты по всем категориям каталога в порядке появления категорий"""
+        return {
+            category: self._facet(count, price_sum, weight_sum,
+                                  next(prices.irange()), next(prices.irange(reverse=True)))
+            for category, (count, price_sum, weight_sum, prices) in self._categories.items()
+        }
+
+    @classmethod
+    def aggregate(cls, products):
+        """Агрегаты по категориям для произвольного набора товаров за один проход"""
+        categories = {}
+        for product in products:
+            price = product['price']
+            entry = categories.get(product['category'])
+            if entry is None:
+                categories[product['category']] = [1, price, product['weight'], price, price]
+            else:
+                entry[0] += 1
+                entry[1] += price
+                entry[2] += product['weight']
+                if price < entry[3]:
+                    entry[3] = price
+                elif price > entry[4]:
+                    entry[4] = price
+        return {category: cls._facet(*entry) for category, entry in categories.items()}
+
+
+class StringColumn:
+    """Колонка строк, хранящаяся одним блоком UTF-8 со смещениями
+
+    Строки блока декодируются только при обращении, поэтому колонку из
+    снимка не нужно разбирать целиком при загрузке. Измененные строки
+    хранятся отдельно, добавленные - в обычном списке после блока.
+    """
+
+    def __init__(self, blob=b'', offsets=None, values=None):
+        self._blob = blob
+        self._offsets = offsets if offsets is not None else array('q', [0])
+        self._base = len(self._offsets) - 1
+        self._changed = {}
+        self._tail = values if values is not None else []
+
+    def __len__(self):
+        return self._base + len(self._tail)
+
+    def __getitem__(self, row):
+        if row >= self._base:
+            return self._tail[row - self._base]
+        value = self._changed.get(row)
+        if value is None:
+            value = self._blob[self._offsets[row]:self._offsets[row + 1]].decode('utf-8')
+        return value
+
+    def __setitem__(self, row, value):
+        if row >= self._base:
+            self._tail[row - self._base] = value
+        else:
+            self._changed[row] = value
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """Все строки колонки списком"""
+        blob, offsets = self._blob, self._offsets
+        values = [blob[start:end].decode('utf-8') for start, end in zip(offsets, islice(offsets, 1, None))]
+        for row, value in self._changed.items():
+            values[row] = value
+        return values + self._tail
+
+    def append(self, value):
+        self._tail.append(value)
+
+    @staticmethod
+    def pack(strings):
+        """Блок UTF-8 и смещения строк для записи на диск"""
+        if isinstance(strings, StringColumn) and not strings._changed and not strings._tail:
+            return strings._blob, strings._offsets
+        encoded = [value.encode('utf-8') for value in strings]
+        return b''.join(encoded), array('q', accumulate(map(len, encoded), initial=0))
+
+
+class ColumnarProduct(Product):
+    """Каталог с поколоночным хранением товаров в массивах
+
+    Цена и вес лежат в непрерывных массивах float, ID - в массиве int,
+    категория кодируется номером в словаре категорий. Пока ID идут по
+    возрастанию (товары добавляются через add_product), строка товара
+    находится бинарным поиском по массиву ID без отдельного словаря.
+    Товары, которые возвращают get_product_info и _find_product_by_id,
+    собираются из колонок заново при каждом обращении, поэтому изменять
+    их нужно через edit_product.
+    """
+
+    # Сжатие колонок выполняется, когда удаленных строк больше половины
+    _COMPACT_MIN_DELETED = 1024
+
+    def __init__(self):
+        super().__init__()
+        self._reset_storage()
+
+    def _reset_storage(self):
+        """Создание пустых колонок"""
+        self._ids = array('q')
+        self._prices = array('d')
+        self._weights = array('d')
+        self._category_codes = array('i')
+        self._alive = array('b')
+        self._names = StringColumn()
+        self._descriptions = StringColumn()
+        self._category_names = []
+        self._category_index = {}
+        # Версии измененных товаров; у остальных первая версия
+        self._versions = {}
+        # Словарь ID -> строка нужен, только если ID в колонке не упорядочены
+        self._rows = None
+        self._deleted = 0
+
+    @property
+    def products(self):
+        """Список товаров в порядке добавления"""
+        return list(self)
+
+    @products.setter
+    def products(self, products):
+        self._reset_storage()
+        for product in products:
+            self._insert(dict(product))
+            self.next_id = max(self.next_id, product['id'] + 1)
+        self._reset()
+
+    def __len__(self):
+        return len(self._ids) - self._deleted
+
+    def __iter__(self):
+        record = self._record
+        alive = self._alive
+        return (record(row) for row in range(len(alive)) if alive[row])
+
+    def _record(self, row):
+        """Сборка словаря товара из строки колонок"""
+        product_id = self._ids[row]
+        return ProductRecord(
+            product_id,
+            self._names[row],
+            self._category_names[self._category_codes[row]],
+            self._prices[row],
+            self._weights[row],
+            self._descriptions[row],
+            self._versions.get(product_id, 1)
+        )
+
+    def _encode_category(self, category):
+        """Код категории в словаре категорий"""
+        code = self._category_index.get(category)
+        if code is None:
+            code = len(self._category_names)
+            self._category_names.append(category)
+            self._category_index[category] = code
+        return code
+
+    def _row(self, product_id):
+        """Номер строки товара или None"""
+        if self._rows is not None:
+            return self._rows.get(product_id)
+        ids = self._ids
+        row = bisect_left(ids, product_id)
+        if row < len(ids) and ids[row] == product_id and self._alive[row]:
+            return row
+        return None
+
+    def _build_rows(self):
+        """Словарь ID -> строка для колонки с неупорядоченными ID"""
+        alive = self._alive
+        self._rows = {product_id: row for row, product_id in enumerate(self._ids) if alive[row]}
+
+    def _find_product_by_id(self, product_id):
+        """Поиск товара по ID"""
+        row = self._row(product_id)
+        if row is None:
+            return None
+        return self._record(row)
+
+    def _insert(self, product):
+        """Сохранение нового товара в хранилище"""
+        product_id = product['id']
+        if self._rows is None and self._ids and product_id <= self._ids[-1]:
+            self._build_rows()
+        if self._rows is not None:
+            self._rows[product_id] = len(self._ids)
+        self._ids.append(product_id)
+        self._names.append(product['name'])
+        self._category_codes.append(self._encode_category(product['category']))
+        self._prices.append(product['price'])
+        self._weights.append(product['weight'])
+        self._descriptions.append(product['description'])
+        self._alive.append(1)
+        if product.get('version', 1) != 1:
+            self._versions[product_id] = product['version']
+
+    def _update(self, product, changes):
+        """Запись измененных полей товара в хранилище"""
+        row = self._row(product['id'])
+        for field, value in changes.items():
+            if field == 'price':
+                self._prices[row] = value
+            elif field == 'weight':
+                self._weights[row] = value
+            elif field == 'category':
+                self._category_codes[row] = self._encode_category(value)
+            elif field == 'name':
+                self._names[row] = value
+            elif field == 'description':
+                self._descriptions[row] = value
+            elif field == 'version':
+                self._versions[product['id']] = value
+
+    def _remove(self, product):
+        """Удаление товара из хранилища"""
+        row = self._row(product['id'])
+        if self._rows is not None:
+            del self._rows[product['id']]
+        self._versions.pop(product['id'], None)
+        self._alive[row] = 0
+        self._deleted += 1
+        if self._deleted >= self._COMPACT_MIN_DELETED and self._deleted * 2 > len(self._ids):
+            self._compact()
+
+    def _compact(self):
+        """Удаление из колонок строк удаленных товаров"""
+        keep = [row for row in range(len(self._alive)) if self._alive[row]]
+        self._ids = array('q', (self._ids[row] for row in keep))
+        self._prices = array('d', (self._prices[row] for row in keep))
+        self._weights = array('d', (self._weights[row] for row in keep))
+        self._category_codes = array('i', (self._category_codes[row] for row in keep))
+        self._names = StringColumn(values=[self._names[row] for row in keep])
+        self._descriptions = StringColumn(values=[self._descriptions[row] for row in keep])
+        self._alive = array('b', bytes([1]) * len(keep))
+        self._deleted = 0
+        if self._rows is not None:
+            self._build_rows()
+
+    def _columns(self):
+        """Содержимое каталога по колонкам: ID, названия, словарь и коды категорий, цены, веса, описания"""
+        if self._deleted:
+            self._compact()
+        return (self._ids, self._names, self._category_names, self._category_codes,
+                self._prices, self._weights, self._descriptions)
+
+    def _load_columns(self, ids, names, category_names, category_codes, prices, weights, descriptions):
+        """Замена содержимого каталога товарами из колонок"""
+        self._reset_storage()
+        self._ids = ids
+        self._names = names if isinstance(names, StringColumn) else StringColumn(values=list(names))
+        self._descriptions = (descriptions if isinstance(descriptions, StringColumn)
+                              else StringColumn(values=list(descriptions)))
+        self._category_names = list(category_names)
+        self._category_index = {category: code for code, category in enumerate(self._category_names)}
+        self._category_codes = category_codes
+        self._prices = prices
+        self._weights = weights
+        self._alive = array('b', bytes([1]) * len(ids))
+        if np is not None:
+            ordered = bool(np.all(np.diff(np.frombuffer(ids, dtype=np.int64)) > 0)) if len(ids) else True
+        else:
+            ordered = all(previous < current for previous, current in zip(ids, islice(ids, 1, None)))
+        if not ordered:
+            self._build_rows()
+        self._reset()
+
+    def _edited_versions(self):
+        return dict(self._versions)
+
+    def _restore_versions(self, versions):
+        self._versions.update(versions)
+
+    def select(self, category=None, min_price=None, max_price=None):
+        """ID товаров категории с ценой в диапазоне [min_price, max_price]"""
+        code = None
+        if category is not None:
+            code = self._category_index.get(category)
+            if code is None:
+                return []
+        if not len(self):
+            return []
+
+        if np is not None:
+            mask = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            if code is not None:
+                mask &= np.frombuffer(self._category_codes, dtype=np.intc) == code
+            prices = np.frombuffer(self._prices, dtype=np.float64)
+            if min_price is not None:
+                mask &= prices >= min_price
+            if max_price is not None:
+                mask &= prices <= max_price
+            return np.frombuffer(self._ids, dtype=np.int64)[mask].tolist()
+
+        return [
+            product_id
+            for product_id, price, product_code, alive
+            in zip(self._ids, self._prices, self._category_codes, self._alive)
+            if alive
+            and (code is None or product_code == code)
+            and (min_price is None or price >= min_price)
+            and (max_price is None or price <= max_price)
+        ]
+
+    def average_price_by_category(self):
+        """Средняя цена товаров по категориям"""
+        size = len(self._category_names)
+        if np is not None:
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            codes = np.frombuffer(self._category_codes, dtype=np.intc)[alive]
+            prices = np.frombuffer(self._prices, dtype=np.float64)[alive]
+            sums = np.bincount(codes, weights=prices, minlength=size)
+            counts = np.bincount(codes, minlength=size)
+            return {
+                self._category_names[code]: float(sums[code] / counts[code])
+                for code in range(size) if counts[code]
+            }
+
+        sums = [0.0] * size
+        counts = [0] * size
+        for price, code, alive in zip(self._prices, self._category_codes, self._alive):
+            if alive:
+                sums[code] += price
+                counts[code] += 1
+        return {
+            self._category_names[code]: sums[code] / counts[code]
+            for code in range(size) if counts[code]
+        }
+
+
+class ConcurrentProduct(Product):
+    """Каталог для одновременной работы многих читателей и писателей
+
+    Опубликованная версия каталога - пара (сегменты, число товаров), где
+    сегменты - словарь номер -> dict товаров с ID из одного диапазона
+    длиной 2**_SHARD_BITS. Опубликованные словари и записи товаров больше
+    не изменяются, поэтому get_product_info, Cart.add_item, display_catalog
+    и обход каталога работают без блокировок: читатель один раз берет
+    ссылку на текущую версию. Писатели выполняются по одному под
+    блокировкой, копируют только затронутые сегменты и записи и
+    публикуют новую версию одним присваиванием. Отсортированные и
+    полнотекстовый индексы - общие изменяемые структуры, поэтому запросы
+    к ним выполняются под той же блокировкой.
+
+    """
+
+    _SHARD_BITS = 10
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot = ({}, 0)
+        # Черновик новой версии и поток, который его заполняет
+        self._staged = None
+        self._writer = None
+        super().__init__()
+
+    # Базовый класс обращается к self._products при замене всего содержимого
+    @property
+    def _products(self):
+        return {product['id']: product for product in self}
+
+    @_products.setter
+    def _products(self, products):
+        with self._lock:
+            shards = {}
+            for product_id, product in products.items():
+                shards.setdefault(product_id >> self._SHARD_BITS, {})[product_id] = product
+            self._snapshot = (shards, len(products))
+
+    @property
+    def products(self):
+        """Список товаров по возрастанию ID"""
+        return list(self)
+
+    @products.setter
+    def products(self, products):
+        with self._lock:
+            self._products = {product['id']: self._versioned(product) for product in products}
+            self._reset()
+
+    def __len__(self):
+        return self._snapshot[1]
+
+    def __iter__(self):
+        shards = self._snapshot[0]
+        for number in sorted(shards):
+            yield from shards[number].values()
+
+    def _find_product_by_id(self, product_id):
+        """Поиск товара по ID в опубликованной версии без блокировки
+
+        Пишущий поток видит свой черновик, остальные - последнюю опубликованную версию.
+        """
+        shards = self._snapshot[0]
+        if self._staged is not None and self._writer == threading.get_ident():
+            shards = self._staged[0]
+        shard = shards.get(product_id >> self._SHARD_BITS)
+        return None if shard is None else shard.get(product_id)
+
+    def get_products(self, product_ids):
+        """Товары по списку ID из одной опубликованной версии каталога"""
+        if self._staged is not None and self._writer == threading.get_ident():
+            return super().get_products(product_ids)
+        shards, bits = self._snapshot[0], self._SHARD_BITS
+        products = []
+        for product_id in product_ids:
+            shard = shards.get(product_id >> bits)
+            products.append(None if shard is None else shard.get(product_id))
+        return products
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Запись под блокировкой с публикацией новой версии по выходе из внешнего блока"""
+        with self._lock:
+            if self._staged is not None:
+                yield
+                return
+            shards, count = self._snapshot
+            # Черновик: копия словаря сегментов, число товаров и номера уже скопированных сегментов
+            self._staged = [dict(shards), count, set()]
+            self._writer = threading.get_ident()
+            try:
+                yield
+            finally:
+                # Черновик публикуется и при исключении: наблюдатели (индексы,
+                # журнал, лента изменений) уже получили каждое выполненное
+                # изменение хранилища, как и в Product
+                shards, count, _ = self._staged
+                self._snapshot = (shards, count)
+                self._staged = None
+                self._writer = None
+
+    def _writable_shard(self, number):
+        """Сегмент черновика, который можно изменять"""
+        shards, _, copied = self._staged
+        if number not in copied:
+            shards[number] = dict(shards.get(number, ()))
+            copied.add(number)
+        return shards[number]
+
+    def _restore_versions(self, versions):
+        with self._writing():
+            for product_id, version in versions:
+                self._writable_shard(product_id >> self._SHARD_BITS)[product_id] = (
+                    self._find_product_by_id(product_id).replace(version=version))
+
+    def _insert(self, product):
+        with self._writing():
+            self._writable_shard(product['id'] >> self._SHARD_BITS)[product['id']] = product
+            self._staged[1] += 1
+
+    def _update(self, product, changes):
+        with self._writing():
+            shard = self._writable_shard(product['id'] >> self._SHARD_BITS)
+            shard[product['id']] = shard[product['id']].replace(**changes)
+
+    def _remove(self, product):
+        with self._writing():
+            shards, _, _ = self._staged
+            number = product['id'] >> self._SHARD_BITS
+            shard = self._writable_shard(number)
+            del shard[product['id']]
+            if not shard:
+                del shards[number]
+            self._staged[1] -= 1
+
+    def add_product(self, name, category, price, weight, description):
+        with self._writing():
+            return super().add_product(name, category, price, weight, description)
+
+    def edit_product(self, product_id, **kwargs):
+        with self._writing():
+            return super().edit_product(product_id, **kwargs)
+
+    def delete_product(self, product_id):
+        with self._writing():
+            return super().delete_product(product_id)
+
+    def _import_batch(self, batch, stats, max_errors):
+        # Импорт публикует новую версию после каждого пакета
+        with self._writing():
+            super()._import_batch(batch, stats, max_errors)
+
+    def _load_columns(self, ids, names, category_names, category_codes, prices, weights, descriptions):
+        with self._lock:
+            super()._load_columns(ids, names, category_names, category_codes, prices, weights, descriptions)
+
+    def _sorted_index(self, field):
+        with self._lock:
+            return super()._sorted_index(field)
+
+    def find_by_range(self, field, low=None, high=None):
+        with self._lock:
+            return super().find_by_range(field, low, high)
+
+    def find_by_prefix(self, prefix, field='name'):
+        with self._lock:
+            return super().find_by_prefix(prefix, field)
+
+    def iter_sorted(self, field, reverse=False):
+        # Порядок фиксируется под блокировкой, выдача идет уже без нее
+        with self._lock:
+            products = list(super().iter_sorted(field, reverse))
+        return iter(products)
+
+    def search(self, query, limit=None, prefix=False):
+        with self._lock:
+            return super().search(query, limit, prefix)
+
+    def facets(self, products=None):
+        with self._lock:
+            return super().facets(products)
+
+    def _reading(self):
+        return self._lock
+
+    def changes_since(self, version):
+        with self._lock:
+            return super().changes_since(version)
+
+
+class CatalogStore:
+    """Долговременное хранилище каталога: журнал изменений и снимки
+
+    Каждое изменение каталога дописывается в журнал строкой JSON.
+    Записи копятся в буфере и сбрасываются на диск с fsync группой:
+    когда набирается group_size записей, когда при очередной записи
+    оказывается, что с прошлого сброса прошло commit_interval секунд,
+    или при явном вызове commit() и close().
+
+    Снимок - двоичный файл с колонками ID, цен, весов и кодов категорий,
+    выровненными по 8 байт, и блоками строк UTF-8 со смещениями (названия,
+    описания и внешние артикулы товаров). При
+    загрузке он читается через mmap целыми колонками, после чего
+    применяется только хвост журнала. После записи снимка журнал
+    начинается заново со следующим номером поколения. Быстрее всего
+    снимок загружается в ColumnarProduct: колонки копируются целиком,
+    а строки декодируются только при обращении к товару.
+    """
+
+    MAGIC = b'STORECAT'
+    SNAPSHOT_FILE = 'catalog.snapshot'
+
+    def __init__(self, directory, group_size=256, commit_interval=0.05, snapshot_every=None):
+        self.directory = directory
+        self.group_size = group_size
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.catalog = None
+        self.pricing = None
+        self._generation = 0
+        self._log = None
+        self._pending = []
+        self._last_commit = time.monotonic()
+        self._records_since_snapshot = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f'catalog.{generation}.log')
+
+    def load(self, catalog_class=Product):
+        """Загрузка каталога из снимка и журнала; далее изменения каталога пишутся в журнал"""
+        catalog = catalog_class()
+        header = self._read_snapshot(catalog)
+        if header is not None:
+            self._generation = header['generation']
+            catalog.next_id = header['next_id']
+            self.pricing = header['pricing']
+
+        self._records_since_snapshot = self._replay(catalog)
+        self._log = open(self._log_path(self._generation), 'a', encoding='utf-8')
+        self.catalog = catalog
+        catalog._listeners.append(self)
+        return catalog
+
+    def _read_snapshot(self, catalog):
+        """Чтение снимка в каталог; None, если снимка нет"""
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:8] != self.MAGIC:
+                raise ValueError(f"Файл {path} не является снимком каталога")
+            header_size = int.from_bytes(data[8:16], 'little')
+            header = json.loads(data[16:16 + header_size].decode('utf-8'))
+
+            def column(typecode, name):
+                start, end = header['sections'][name]
+                values = array(typecode)
+                values.frombytes(data[start:end])
+                return values
+
+            def strings(name):
+                start, end = header['sections'][name]
+                return StringColumn(data[start:end], column('q', name + '_offsets'))
+
+            catalog._load_columns(
+                column('q', 'ids'),
+                strings('names'),
+                header['categories'],
+                column('i', 'category_codes'),
+                column('d', 'prices'),
+                column('d', 'weights'),
+                strings('descriptions')
+            )
+            if 'sku_ids' in header['sections']:
+                for product_id, sku in zip(column('q', 'sku_ids'), strings('skus')):
+                    catalog._assign_sku(sku, product_id)
+            if 'version_ids' in header['sections']:
+                catalog._restore_versions(zip(column('q', 'version_ids'), column('q', 'versions')))
+        return header
+
+    def _replay(self, catalog):
+        """Применение записей журнала текущего поколения; возвращает их число"""
+        path = self._log_path(self._generation)
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        valid_size = 0
+        with open(path, 'rb') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная при сбое последняя запись отбрасывается
+                    break
+                self._apply(catalog, record)
+                valid_size += len(line)
+                count += 1
+        if valid_size != os.path.getsize(path):
+            with open(path, 'r+b') as file:
+                file.truncate(valid_size)
+        return count
+
+    def _apply(self, catalog, record):
+        """Применение одной записи журнала к каталогу"""
+        op = record['op']
+        if op == 'add':
+            product = ProductRecord.from_mapping(record['product'])
+            catalog._insert(product)
+            catalog.next_id = max(catalog.next_id, product['id'] + 1)
+            if 'sku' in record:
+                catalog._assign_sku(record['sku'], product['id'])
+        elif op == 'edit':
+            product = record['product']
+            current = catalog._find_product_by_id(product['id'])
+            catalog._update(current, {field: product[field] for field in product if field != 'id'})
+        elif op == 'delete':
+            catalog._remove(catalog._find_product_by_id(record['id']))
+            catalog._forget_sku(record['id'])
+        elif op == 'pricing':
+            self.pricing = record['pricing']
+
+    def _append(self, record):
+        """Запись в буфер журнала с групповым сбросом на диск"""
+        self._pending.append(json.dumps(record, ensure_ascii=False))
+        self._records_since_snapshot += 1
+        if (len(self._pending) >= self.group_size
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        """Сброс накопленных записей журнала на диск; при необходимости - запись снимка"""
+        self._flush()
+        if self.snapshot_every is not None and self._records_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def _flush(self):
+        """Сброс накопленных записей журнала на диск без проверки снимка"""
+        if self._pending:
+            self._log.write('\n'.join(self._pending) + '\n')
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._pending = []
+        self._last_commit = time.monotonic()
+
+    def product_added(self, product):
+        record = {'op': 'add', 'product': dict(product)}
+        sku = self.catalog._sku_by_id.get(product['id'])
+        if sku is not None:
+            record['sku'] = sku
+        self._append(record)
+
+    def product_updated(self, old, product):
+        self._append({'op': 'edit', 'product': dict(product)})
+
+    def product_removed(self, product):
+        self._append({'op': 'delete', 'id': product['id']})
+
+    def catalog_reset(self, catalog):
+        self.snapshot()
+
+    def save_pricing(self, cart):
+        """Сохранение правил скидок и ставки налога корзины"""
+        self.pricing = {'discount_rules': cart.discount_rules, 'tax_rate': cart.tax_rate}
+        self._append({'op': 'pricing', 'pricing': self.pricing})
+        self.commit()
+
+    def restore_pricing(self, cart):
+        """Восстановление сохраненных правил скидок и ставки налога в корзине"""
+        if self.pricing is None:
+            return False
+        cart.discount_rules = [dict(rule) for rule in self.pricing['discount_rules']]
+        cart.tax_rate = self.pricing['tax_rate']
+        return True
+
+    def snapshot(self):
+        """Запись снимка каталога и переход к новому поколению журнала"""
+        catalog = self.catalog
+        ids, names, category_names, category_codes, prices, weights, descriptions = catalog._columns()
+        names_blob, name_offsets = StringColumn.pack(names)
+        descriptions_blob, description_offsets = StringColumn.pack(descriptions)
+        skus_blob, sku_offsets = StringColumn.pack(catalog._sku_by_id.values())
+        versions = catalog._edited_versions()
+
+        sections = [
+            ('ids', ids.tobytes()),
+            ('prices', prices.tobytes()),
+            ('weights', weights.tobytes()),
+            ('category_codes', category_codes.tobytes()),
+            ('names_offsets', name_offsets.tobytes()),
+            ('descriptions_offsets', description_offsets.tobytes()),
+            ('sku_ids', array('q', catalog._sku_by_id).tobytes()),
+            ('skus_offsets', sku_offsets.tobytes()),
+            ('version_ids', array('q', versions).tobytes()),
+            ('versions', array('q', versions.values()).tobytes()),
+            ('names', names_blob),
+            ('descriptions', descriptions_blob),
+            ('skus', skus_blob)
+        ]
+        header = {
+            'count': len(ids),
+            'next_id': catalog.next_id,
+            'generation': self._generation + 1,
+            'categories': category_names,
+            'pricing': self.pricing,
+            'sections': {}
+        }
+        # Смещения секций зависят от длины заголовка, а заголовок - от смещений,
+        # поэтому под заголовок резервируется место с запасом
+        header_size = len(json.dumps(header, ensure_ascii=False).encode('utf-8')) + 64 * len(sections) + 64
+        offset = self._align(16 + header_size)
+        for name, payload in sections:
+            header['sections'][name] = [offset, offset + len(payload)]
+            offset = self._align(offset + len(payload))
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8').ljust(header_size)
+
+        self._flush()
+        new_log_path = self._log_path(self._generation + 1)
+        open(new_log_path, 'w').close()
+
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(self.MAGIC + len(header_bytes).to_bytes(8, 'little') + header_bytes)
+            for name, payload in sections:
+                file.seek(header['sections'][name][0])
+                file.write(payload)
+            file.truncate(offset)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+
+        old_log_path = self._log_path(self._generation)
+        self._generation += 1
+        if self._log is not None:
+            self._log.close()
+        self._log = open(new_log_path, 'a', encoding='utf-8')
+        if os.path.exists(old_log_path):
+            os.remove(old_log_path)
+        self._records_since_snapshot = 0
+
+    @staticmethod
+    def _align(offset):
+        return (offset + 7) // 8 * 8
+
+    def close(self):
+        """Сброс журнала и отключение от каталога"""
+        if self._log is not None:
+            self.commit()
+            self._log.close()
+            self._log = None
+        if self.catalog is not None and self in self.catalog._listeners:
+            self.catalog._listeners.remove(self)
+
+
+class DiscountPlan:
+    """Скомпилированный план применения правил скидок
+
+    Безусловные процентные и фиксированные скидки сложены в два числа.
+    Пороговые и ступенчатые правила сведены в отсортированный список
+    порогов с накопленными суммами процента и фиксированной скидки,
+    поэтому для суммы заказа достаточно одного бинарного поиска.
+    Категорийные скидки хранятся как суммарный процент по категории.
+    """
+
+    def __init__(self, rules):
+        # Число правил, по которым построен план (см. current)
+        self.rule_count = len(rules)
+        self.percentage = 0.0
+        self.fixed = 0.0
+        self.category_percentages = {}
+
+        # Изменения процента и фиксированной скидки при переходе через порог
+        steps = []
+        for rule in rules:
+            rule_type = rule['type']
+            if rule_type == 'percentage':
+                self.percentage += rule['value']
+            elif rule_type == 'fixed':
+                self.fixed += rule['value']
+            elif rule_type == 'threshold':
+                steps.append((rule['threshold'], rule['discount_type'] == 'percentage', rule['discount_value']))
+            elif rule_type == 'tiered':
+                is_percentage = rule['discount_type'] == 'percentage'
+                previous = 0.0
+                for threshold, value in rule['tiers']:
+                    steps.append((threshold, is_percentage, value - previous))
+                    previous = value
+            elif rule_type == 'category':
+                category = rule['category']
+                self.category_percentages[category] = self.category_percentages.get(category, 0.0) + rule['value']
+        steps.sort(key=lambda step: step[0])
+
+        # Накопленные суммы: элемент k соответствует k пройденным порогам
+        self.thresholds = [step[0] for step in steps]
+        self.threshold_percentages = [0.0]
+        self.threshold_fixed = [0.0]
+        for _, is_percentage, value in steps:
+            self.threshold_percentages.append(self.threshold_percentages[-1] + (value if is_percentage else 0.0))
+            self.threshold_fixed.append(self.threshold_fixed[-1] + (0.0 if is_percentage else value))
+
+    @classmethod
+    def current(cls, plan, rules):
+        """План для rules: plan, если он еще действителен, иначе новый
+
+        Владелец правил (Cart, PricingPolicy) сбрасывает план в None при
+        их замене; добавленные в общий список правила видны по длине.
+        """
+        if plan is None or plan.rule_count != len(rules):
+            plan = cls(rules)
+        return plan
+
+    def evaluate(self, subtotal, category_subtotals=None):
+        """Сумма скидки для заказа"""
+        crossed = bisect_right(self.thresholds, subtotal)
+        percentage = self.percentage + self.threshold_percentages[crossed]
+        discount = subtotal * percentage / 100 + self.fixed + self.threshold_fixed[crossed]
+
+        if self.category_percentages and category_subtotals:
+            discount += self.category_discount(category_subtotals)
+
+        return min(discount, subtotal)
+
+    def category_discount(self, category_subtotals):
+        """Сумма категорийных скидок по суммам заказа в разрезе категорий"""
+        discount = 0.0
+        rules, amounts = self.category_percentages, category_subtotals
+        if len(amounts) < len(rules):
+            for category, amount in amounts.items():
+                if category in rules:
+                    discount += amount * rules[category] / 100
+        else:
+            for category, percentage in rules.items():
+                if category in amounts:
+                    discount += amounts[category] * percentage / 100
+        return discount
+
+
+class Inventory:
+    """Остатки товаров на складе и резервы корзин
+
+    Остаток товара разложен по shards счетчикам, у каждого своя
+    блокировка, поэтому одновременные резервы одного популярного товара
+    из разных потоков чаще всего берут разные блокировки. Поток
+    начинает со «своего» счетчика и добирает недостающее из соседних.
+    Записи о резервах копятся в очереди счетчика и переносятся в общий
+    журнал пачками по batch_size записей под отдельной блокировкой.
+    Резервы держателя (корзины), не обновлявшиеся дольше ttl секунд,
+    снимаются expire(), после чего вызывается метод держателя
+    reservations_expired, если он есть. Товары без заданного остатка
+    не ограничены.
+    """
+
+    def __init__(self, shards=16, ttl=None, batch_size=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._clock = clock
+        self._locks = [threading.Lock() for _ in range(shards)]
+        # Потоки получают «свои» счетчики по очереди: идентификаторы потоков
+        # выровнены, и остаток от их деления почти всегда один и тот же
+        self._threads = threading.local()
+        self._thread_numbers = count()
+        # ID товара -> array остатков по счетчикам
+        self._stock = {}
+        # Очереди записей (держатель, ID товара, количество, время) по счетчикам
+        self._pending = [[] for _ in range(shards)]
+        self._pending_count = 0
+        # Держатель -> [время последнего резерва, {ID товара: количество}]
+        # в порядке последнего резерва, поэтому истекшие резервы в начале
+        self._holders = OrderedDict()
+        self._ledger_lock = threading.Lock()
+
+    def _home(self):
+        """Номер счетчика текущего потока"""
+        home = getattr(self._threads, 'home', None)
+        if home is None:
+            home = self._threads.home = next(self._thread_numbers) % len(self._locks)
+        return home
+
+    def set_stock(self, product_id, quantity):
+        """Установка свободного остатка товара с равной раскладкой по счетчикам"""
+        shards = len(self._locks)
+        counters = array('q', [quantity // shards] * shards)
+        for number in range(quantity % shards):
+            counters[number] += 1
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            self._stock[product_id] = counters
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def available(self, product_id):
+        """Свободный остаток товара; None, если остаток не ведется"""
+        counters = self._stock.get(product_id)
+        return None if counters is None else sum(counters)
+
+    def reserve(self, holder, product_id, quantity):
+        """Резерв quantity единиц товара за держателем; False, если остатка не хватает"""
+        if quantity <= 0:
+            raise ValueError("Количество должно быть положительным")
+        counters = self._stock.get(product_id)
+        if counters is None:
+            return True
+        locks = self._locks
+        home = self._home()
+        needed = quantity
+        taken = []
+        for offset in range(len(locks)):
+            number = (home + offset) % len(locks)
+            if not counters[number]:
+                continue
+            with locks[number]:
+                take = min(counters[number], needed)
+                counters[number] -= take
+            if take:
+                taken.append((number, take))
+                needed -= take
+                if not needed:
+                    break
+        if needed:
+            for number, take in taken:
+                with locks[number]:
+                    counters[number] += take
+            return False
+
+        with locks[home]:
+            self._pending[home].append((holder, product_id, quantity, self._clock()))
+        # Счетчик записей приблизительный: он только решает, когда переносить пачку
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size:
+            self._commit()
+        return True
+
+    def _commit(self):
+        """Перенос накопленных записей о резервах в общий журнал"""
+        with self._ledger_lock:
+            self._pending_count = 0
+            records = []
+            for number, lock in enumerate(self._locks):
+                with lock:
+                    records.extend(self._pending[number])
+                    self._pending[number] = []
+            # Записи разных счетчиков упорядочиваются по времени, чтобы
+            # журнал оставался упорядоченным по последнему резерву
+            records.sort(key=lambda record: record[3])
+            holders = self._holders
+            for holder, product_id, quantity, touched in records:
+                entry = holders.get(holder)
+                if entry is None:
+                    entry = holders[holder] = [touched, {}]
+                else:
+                    holders.move_to_end(holder)
+                    entry[0] = touched
+                entry[1][product_id] = entry[1].get(product_id, 0) + quantity
+
+    def _restock(self, product_id, quantity):
+        """Возврат единиц товара в счетчик текущего потока"""
+        counters = self._stock.get(product_id)
+        if counters is not None and quantity:
+            number = self._home()
+            with self._locks[number]:
+                counters[number] += quantity
+
+    def release(self, holder, product_id, quantity=None):
+        """Снятие резерва товара (целиком при quantity=None); возвращает число снятых единиц"""
+        if quantity is not None and quantity <= 0:
+            raise ValueError("Количество должно быть положительным")
+        self._commit()
+        with self._ledger_lock:
+            entry = self._holders.get(holder)
+            reserved = entry[1].get(product_id, 0) if entry is not None else 0
+            released = reserved if quantity is None else min(quantity, reserved)
+            if released:
+                if released == reserved:
+                    del entry[1][product_id]
+                    if not entry[1]:
+                        del self._holders[holder]
+                else:
+                    entry[1][product_id] = reserved - released
+        self._restock(product_id, released)
+        return released
+
+    def release_all(self, holder):
+        """Снятие всех резервов держателя"""
+        self._commit()
+        with self._ledger_lock:
+            entry = self._holders.pop(holder, None)
+        if entry is not None:
+            for product_id, quantity in entry[1].items():
+                self._restock(product_id, quantity)
+
+    def reserved(self, product_id=None, holder=None):
+        """Зарезервировано единиц товара всеми держателями или одним держателем"""
+        self._commit()
+        with self._ledger_lock:
+            entries = self._holders.values() if holder is None else [self._holders.get(holder, [0, {}])]
+            return sum(
+                quantity
+                for _, products in entries
+                for reserved_id, quantity in products.items()
+                if product_id is None or reserved_id == product_id
+            )
+
+    def expire(self, now=None):
+        """Снятие резервов держателей, неактивных дольше ttl; возвращает их число"""
+        if self.ttl is None:
+            return 0
+        self._commit()
+        deadline = (self._clock() if now is None else now) - self.ttl
+        expired = []
+        with self._ledger_lock:
+            while self._holders:
+                holder, entry = next(iter(self._holders.items()))
+                if entry[0] > deadline:
+                    break
+                del self._holders[holder]
+                expired.append((holder, entry[1]))
+        for holder, products in expired:
+            for product_id, quantity in products.items():
+                self._restock(product_id, quantity)
+            # Держатель (корзина) убирает строки, которые больше не обеспечены резервом
+            callback = getattr(holder, 'reservations_expired', None)
+            if callback is not None:
+                callback(products)
+        return len(expired)
+
+
+class CartLine:
+    """Строка корзины: товар и количество; доступна как словарь line['product']"""
+
+    __slots__ = ('product', 'quantity')
+
+    FIELDS = __slots__
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    def __getitem__(self, field):
+        if field == 'product':
+            return self.product
+        if field == 'quantity':
+            return self.quantity
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return 2
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, CartLine):
+            return self.product == other.product and self.quantity == other.quantity
+        if isinstance(other, dict):
+            return {'product': self.product, 'quantity': self.quantity} == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr({'product': self.product, 'quantity': self.quantity})
+
+
+class Cart(EventSource):
     """Класс для управления корзиной покупок"""
 
-    def __init__(self, product_catalog):
-        self.items = []
+    def __init__(self, product_catalog, inventory=None):
+        # Строки корзины по ID товара и накопленные итоги по ним
+        self._lines = {}
+        self._subtotal = 0.0
+        self._total_weight = 0.0
+        self._quantity = 0
+        self._category_subtotals = {}
         self.product_catalog = product_catalog
-        self.discount_rules = []
+        self._discount_rules = []
+        self._discount_plan = None
         self.tax_rate = 0.20
+        # Склад, на котором резервируются добавленные товары (Inventory или None)
+        self.inventory = inventory
+
+    @property
+    def discount_rules(self):
+        """Правила скидок
+
+        План скидок сбрасывается при замене списка и в add_discount_rule;
+        после изменения правила на месте нужно вызвать invalidate_discounts().
+        """
+        return self._discount_rules
+
+    @discount_rules.setter
+    def discount_rules(self, rules):
+        self._discount_rules = rules
+        self._discount_plan = None
+
+    def invalidate_discounts(self):
+        """Сброс плана скидок после изменения правил на месте"""
+        self._discount_plan = None
+
+    @property
+    def items(self):
+        """Строки корзины в порядке добавления"""
+        return list(self._lines.values())
+
+    @items.setter
+    def items(self, items):
+        self._lines = {item['product']['id']: item for item in items}
+        self._recalculate_totals()
+
+    @property
+    def line_count(self):
+        """Количество строк в корзине"""
+        return len(self._lines)
+
+    @property
+    def quantity(self):
+        """Общее количество единиц товара в корзине"""
+        return self._quantity
+
+    def _add_to_totals(self, product, quantity):
+        """Учет изменения количества товара в накопленных итогах"""
+        amount = product['price'] * quantity
+        self._subtotal += amount
+        self._total_weight += product['weight'] * quantity
+        self._quantity += quantity
+        category = product['category']
+        self._category_subtotals[category] = self._category_subtotals.get(category, 0.0) + amount
+
+    def _totals(self):
+        """Сумма корзины и суммы по категориям"""
+        return self._subtotal, self._category_subtotals
+
+    def _recalculate_totals(self):
+        """Пересчет накопленных итогов по всем строкам"""
+        self._subtotal = 0.0
+        self._total_weight = 0.0
+        self._quantity = 0
+        self._category_subtotals = {}
+        for item in self._lines.values():
+            self._add_to_totals(item['product'], item['quantity'])
 
     def add_item(self, product_id, quantity=1):
         """Добавление товара в корзину"""
         product = self.product_catalog._find_product_by_id(product_id)
         if not product:
-            print(f"Товар с ID {product_id} не найден.")
+            if self._subscribers:
+                self._emit(ProductNotFound(product_id))
+            return False
+        if self.inventory is not None and not self.inventory.reserve(self, product_id, quantity):
+            if self._subscribers:
+                self._emit(OutOfStock(product, quantity, self.inventory.available(product_id)))
             return False
 
         # Проверяем, есть ли уже такой товар в корзине
-        for item in self.items:
-            if item['product']['id'] == product_id:
-                item['quantity'] += quantity
-                print(f"Количество товара '{product['name']}' в корзине увеличено до {item['quantity']}.")
-                return True
+        item = self._lines.get(product_id)
+        if item is not None:
+            item['quantity'] += quantity
+            self._add_to_totals(item['product'], quantity)
+            if self._subscribers:
+                self._emit(CartItemIncreased(product, quantity, item['quantity']))
+            return True
 
         # Если товара еще нет в корзине
-        self.items.append({
-            'product': product,
-            'quantity': quantity
-        })
-        print(f"Товар '{product['name']}' добавлен в корзину.")
+        self._lines[product_id] = CartLine(product, quantity)
+        self._add_to_totals(product, quantity)
+        if self._subscribers:
+            self._emit(CartItemAdded(product, quantity))
         return True
 
     def remove_item(self, product_id, quantity=None):
         """Удаление товара из корзины"""
-        for item in self.items[:]:
-            if item['product']['id'] == product_id:
-                if quantity is None or quantity >= item['quantity']:
-                    self.items.remove(item)
-                    print(f"Товар '{item['product']['name']}' полностью удален из корзины.")
-                else:
-                    item['quantity'] -= quantity
-                    print(f"Количество товара '{item['product']['name']}' уменьшено до {item['quantity']}.")
-                return True
+        item = self._lines.get(product_id)
+        if item is None:
+            if self._subscribers:
+                self._emit(CartItemNotFound(product_id))
+            return False
 
-        print(f"Товар с ID {product_id} не найден в корзине.")
-        return False
+        if self.inventory is not None:
+            self.inventory.release(self, product_id, quantity)
+        if quantity is None or quantity >= item['quantity']:
+            del self._lines[product_id]
+            if self._lines:
+                self._add_to_totals(item['product'], -item['quantity'])
+            else:
+                # Пустая корзина: сбрасываем итоги, чтобы не копить ошибку округления
+                self._recalculate_totals()
+            if self._subscribers:
+                self._emit(CartItemRemoved(item['product'], item['quantity']))
+        else:
+            item['quantity'] -= quantity
+            self._add_to_totals(item['product'], -quantity)
+            if self._subscribers:
+                self._emit(CartItemDecreased(item['product'], quantity, item['quantity']))
+        return True
+
+    def outdated_lines(self):
+        """ID товаров, версия которых в корзине отстает от каталога или которых в нем больше нет"""
+        find = self.product_catalog._find_product_by_id
+        outdated = []
+        for product_id, item in self._lines.items():
+            current = find(product_id)
+            if current is None or current['version'] != item['product'].get('version'):
+                outdated.append(product_id)
+        return outdated
+
+    def refresh(self):
+        """Перевод строк корзины на последние версии товаров
+
+        Строка корзины хранит товар в той версии, в которой он был
+        добавлен, поэтому изменения цен и веса в каталоге попадают в
+        корзину только здесь. Строки удаленных из каталога товаров
+        убираются. Возвращает число обновленных и удаленных строк.
+        """
+        find = self.product_catalog._find_product_by_id
+        updated = removed = 0
+        for product_id in self.outdated_lines():
+            current = find(product_id)
+            if current is None:
+                del self._lines[product_id]
+                if self.inventory is not None:
+                    self.inventory.release(self, product_id)
+                removed += 1
+            else:
+                self._lines[product_id]['product'] = current
+                updated += 1
+        if updated or removed:
+            self._recalculate_totals()
+            if self._subscribers:
+                self._emit(CartRefreshed(updated, removed))
+        return updated, removed
+
+    def reservations_expired(self, products):
+        """Удаление из корзины единиц товаров, резерв которых истек на складе"""
+        for product_id, quantity in products.items():
+            item = self._lines.get(product_id)
+            if item is None:
+                continue
+            removed = min(quantity, item['quantity'])
+            if removed == item['quantity']:
+                del self._lines[product_id]
+            else:
+                item['quantity'] -= removed
+            if self._subscribers:
+                self._emit(ReservationExpired(item['product'], removed))
+        self._recalculate_totals()
 
     def clear(self):
         """Очистка корзины"""
-        self.items = []
-        print("Корзина очищена.")
+        if self.inventory is not None:
+            self.inventory.release_all(self)
+        self._lines = {}
+        self._recalculate_totals()
+        if self._subscribers:
+            self._emit(CartCleared())
+
+    def _display_rows(self):
+        """Строки корзины с полями товара, количеством и суммой строки"""
+        for item in self._lines.values():
+            product = item['product']
+            yield {
+                'id': product['id'],
+                'name': product['name'],
+                'category': product['category'],
+                'price': product['price'],
+                'weight': product['weight'],
+                'quantity': item['quantity'],
+                'subtotal': product['price'] * item['quantity'],
+            }
 
-    def display(self):
-        """Отображение содержимого корзины"""
-        print("\n=== ВАША КОРЗИНА ===")
-        if not self.items:
-            print("Корзина пуста.")
+    def render(self, format='text', fields=None, page=None, limit=None, offset=0):
+        """Генератор частей вывода корзины: text (со строкой итогов), csv или json"""
+        rows = Renderer.select(self._display_rows(), page, limit, offset)
+        if format != 'text':
+            yield from Renderer.render(rows, Renderer.CART_LABELS, format, fields)
+            return
+        yield "\n=== ВАША КОРЗИНА ===\n"
+        if not self._lines:
+            yield "Корзина пуста.\n"
         else:
-            total_price = 0
-            total_weight = 0
-
-            for item in self.items:
-                product = item['product']
-                subtotal = product['price'] * item['quantity']
-                total_price += subtotal
-                total_weight += product['weight'] * item['quantity']
-
-                print(f"\nID: {product['id']}")
-                print(f"Название: {product['name']}")
-                print(f"Категория: {product['category']}")
-                print(f"Цена за шт.: {product['price']:.2f} руб.")
-                print(f"Вес за шт.: {product['weight']:.2f} кг")
-                print(f"Количество: {item['quantity']}")
-                print(f"Итого: {subtotal:.2f} руб.")
-
-            print("\n=== ИТОГО ===")
-            print(f"Общая стоимость: {total_price:.2f} руб.")
-            print(f"Общий вес: {total_weight:.2f} кг")
-        print("\n===================")
+            yield from Renderer.render(rows, Renderer.CART_LABELS, format, fields)
+            yield (f"\n=== ИТОГО ===\n"
+                   f"Общая стоимость: {self.calculate_subtotal():.2f} руб.\n"
+                   f"Общий вес: {self.calculate_total_weight():.2f} кг\n")
+        yield "\n===================\n"
+
+    def display(self, format='text', fields=None, page=None, limit=None, offset=0):
+        """Отображение содержимого корзины"""
+        Renderer.write(self.render(format, fields, page, limit, offset))
 
     def calculate_subtotal(self):
         """Расчет суммы без учета скидок и налогов"""
-        return sum(item['product']['price'] * item['quantity'] for item in self.items)
+        return self._subtotal
+
+    def calculate_total_weight(self):
+        """Расчет общего веса товаров в корзине"""
+        return self._total_weight
 
-    def add_discount_rule(self, rule_type, value=None, threshold=None, discount_type=None, discount_value=None):
+    def add_discount_rule(self, rule_type, value=None, threshold=None, discount_type=None, discount_value=None,
+                          category=None, tiers=None):
         """Добавление правила скидки"""
         rule = {'type': rule_type}
 
@@ -172,40 +2572,40 @@ class Cart:
             rule['threshold'] = float(threshold)
             rule['discount_type'] = discount_type
             rule['discount_value'] = float(discount_value)
+        elif rule_type == 'category':
+            # Процентная скидка на товары одной категории
+            rule['category'] = category
+            rule['value'] = float(value)
+        elif rule_type == 'tiered':
+            # Ступенчатая скидка: действует только старшая пройденная ступень
+            rule['discount_type'] = discount_type
+            rule['tiers'] = sorted((float(tier_threshold), float(tier_value)) for tier_threshold, tier_value in tiers)
         else:
             raise ValueError("Неизвестный тип скидки")
 
-        self.discount_rules.append(rule)
-        print(f"Добавлено правило скидки: {rule}")
+        self._discount_rules.append(rule)
+        self._discount_plan = None
+        if self._subscribers:
+            self._emit(DiscountRuleAdded(rule))
+
+    def _get_discount_plan(self):
+        """Скомпилированный план скидок, пересобираемый при изменении правил"""
+        plan = self._discount_plan = DiscountPlan.current(self._discount_plan, self._discount_rules)
+        return plan
 
     def _apply_discounts(self, subtotal):
         """Применение скидок к сумме"""
-        total_discount = 0
-
-        for rule in self.discount_rules:
-            if rule['type'] == 'percentage':
-                discount = subtotal * rule['value'] / 100
-                total_discount += discount
-            elif rule['type'] == 'fixed':
-                total_discount += rule['value']
-            elif rule['type'] == 'threshold':
-                if subtotal >= rule['threshold']:
-                    if rule['discount_type'] == 'percentage':
-                        discount = subtotal * rule['discount_value'] / 100
-                    else:
-                        discount = rule['discount_value']
-                    total_discount += discount
-
-        return min(total_discount, subtotal)
+        return self._get_discount_plan().evaluate(subtotal, self._category_subtotals)
 
     def set_tax_rate(self, rate):
         """Установка ставки налога"""
         self.tax_rate = float(rate)
-        print(f"Ставка налога установлена: {rate * 100}%")
+        if self._subscribers:
+            self._emit(TaxRateSet(rate))
 
     def calculate_total(self, include_tax=True, apply_discounts=True):
         """Расчет итоговой суммы"""
-        if not self.items:
+        if not self._lines:
             return {
                 'subtotal': 0,
                 'discounts': 0,
@@ -239,22 +2639,561 @@ class Cart:
         print("======================")
 
 
+class BatchPricer:
+    """Расчет итоговых сумм для множества корзин за один вызов
+
+    Результаты совпадают с Cart.calculate_total: суммы строк копятся
+    в том же порядке, а скидки и налог считаются теми же формулами,
+    только над массивами (NumPy) или в одном цикле без создания Cart.
+    """
+
+    @staticmethod
+    def quote_rows(product_catalog, rows, discount_rules=(), tax_rate=0.20,
+                   include_tax=True, apply_discounts=True):
+        """Расчет корзин, заданных таблицей строк (cart_id, product_id, quantity)
+
+        Возвращает словарь cart_id -> итоги в формате Cart.calculate_total.
+        Строки с отсутствующими в каталоге товарами пропускаются, как
+        это делает Cart.add_item; корзина из одних таких строк получает
+        нулевые итоги, как пустая Cart.
+        """
+        plan = DiscountPlan(list(discount_rules))
+        find = product_catalog._find_product_by_id
+        cart_index = {}
+        line_carts = []
+        amounts = []
+        categories = []
+
+        for cart_id, product_id, quantity in rows:
+            index = cart_index.get(cart_id)
+            if index is None:
+                index = cart_index[cart_id] = len(cart_index)
+            product = find(product_id)
+            if not product:
+                continue
+            line_carts.append(index)
+            amounts.append(product['price'] * quantity)
+            categories.append(product['category'])
+
+        count = len(cart_index)
+        if np is not None and count:
+            subtotals = np.bincount(line_carts, weights=amounts, minlength=count)
+        else:
+            subtotals = [0.0] * count
+            for index, amount in zip(line_carts, amounts):
+                subtotals[index] += amount
+
+        category_subtotals = None
+        if plan.category_percentages:
+            category_subtotals = [{} for _ in range(count)]
+            for index, amount, category in zip(line_carts, amounts, categories):
+                cart_categories = category_subtotals[index]
+                cart_categories[category] = cart_categories.get(category, 0.0) + amount
+
+        totals = BatchPricer._quote(subtotals, category_subtotals, plan, tax_rate,
+                                    include_tax, apply_discounts)
+        return dict(zip(cart_index, totals))
+
+    @staticmethod
+    def quote_carts(carts, include_tax=True, apply_discounts=True):
+        """Расчет итоговых сумм для списка корзин
+
+        Корзины с общим списком правил скидок и одинаковой ставкой налога
+        считаются одной группой. Возвращает итоги в порядке корзин.
+        """
+        results = [None] * len(carts)
+        groups = {}
+        for position, cart in enumerate(carts):
+            if not cart._lines:
+                results[position] = cart.calculate_total(include_tax, apply_discounts)
+                continue
+            key = (id(cart.discount_rules), cart.tax_rate)
+            groups.setdefault(key, (cart, []))[1].append(position)
+
+        for cart, positions in groups.values():
+            group = [carts[position] for position in positions]
+            subtotals = [member._subtotal for member in group]
+            category_subtotals = [member._category_subtotals for member in group]
+            if np is not None:
+                subtotals = np.array(subtotals, dtype=np.float64)
+            totals = BatchPricer._quote(subtotals, category_subtotals, cart._get_discount_plan(),
+                                        cart.tax_rate, include_tax, apply_discounts)
+            for position, total in zip(positions, totals):
+                results[position] = total
+        return results
+
+    @staticmethod
+    def _quote(subtotals, category_subtotals, plan, tax_rate, include_tax, apply_discounts):
+        """Скидки, налог и итог для массива сумм корзин"""
+        if np is not None and len(subtotals):
+            if apply_discounts:
+                crossed = np.searchsorted(np.array(plan.thresholds, dtype=np.float64), subtotals, side='right')
+                percentage = plan.percentage + np.array(plan.threshold_percentages)[crossed]
+                discounts = subtotals * percentage / 100 + plan.fixed + np.array(plan.threshold_fixed)[crossed]
+                if category_subtotals is not None and plan.category_percentages:
+                    discounts += np.array([plan.category_discount(amounts) for amounts in category_subtotals])
+                discounts = np.minimum(discounts, subtotals)
+            else:
+                discounts = np.zeros_like(subtotals)
+            amounts_after_discounts = subtotals - discounts
+            taxes = amounts_after_discounts * tax_rate if include_tax else np.zeros_like(subtotals)
+            columns = (subtotals.tolist(), discounts.tolist(), taxes.tolist(),
+                       (amounts_after_discounts + taxes).tolist())
+        else:
+            if category_subtotals is None:
+                category_subtotals = [None] * len(subtotals)
+            columns = ([], [], [], [])
+            for subtotal, amounts in zip(subtotals, category_subtotals):
+                discount = plan.evaluate(subtotal, amounts) if apply_discounts else 0.0
+                amount_after_discounts = subtotal - discount
+                tax = amount_after_discounts * tax_rate if include_tax else 0.0
+                for column, value in zip(columns, (subtotal, discount, tax, amount_after_discounts + tax)):
+                    column.append(value)
+
+        return [
+            {'subtotal': subtotal, 'discounts': discount, 'tax': tax, 'total': total}
+            for subtotal, discount, tax, total in zip(*columns)
+        ]
+
+    # Состояние процесса-обработчика reprice_carts: общая память, план скидок, налог
+    _worker = None
+
+    @staticmethod
+    def reprice_carts(carts, discount_rules, tax_rate, workers=None, chunk_size=50000,
+                      include_tax=True, apply_discounts=True):
+        """Пересчет итогов всех корзин по новым правилам скидок и налогу в пуле процессов
+
+        Генератор пар (номер корзины в carts, итоги в формате
+        Cart.calculate_total), выдаваемых по мере готовности частей.
+        Суммы корзин и суммы по категориям один раз записываются в
+        общую память, правила скидок передаются каждому процессу один
+        раз при запуске, а задания содержат только границы части.
+        Принимаются Cart и SessionCart.
+        """
+        plan = DiscountPlan(list(discount_rules))
+        positions = []
+        subtotals = array('d')
+        offsets = array('q', [0])
+        codes = array('i')
+        amounts = array('d')
+        category_codes = {}
+        for position, cart in enumerate(carts):
+            if not cart.line_count:
+                yield position, cart.calculate_total(include_tax, apply_discounts)
+                continue
+            subtotal, category_subtotals = cart._totals()
+            positions.append(position)
+            subtotals.append(subtotal)
+            if plan.category_percentages:
+                for category, amount in category_subtotals.items():
+                    code = category_codes.get(category)
+                    if code is None:
+                        code = category_codes[category] = len(category_codes)
+                    codes.append(code)
+                    amounts.append(amount)
+                offsets.append(len(codes))
+        if not positions:
+            return
+
+        sections = [('subtotals', subtotals), ('offsets', offsets), ('codes', codes), ('amounts', amounts)]
+        layout = {}
+        size = 0
+        for name, values in sections:
+            layout[name] = (values.typecode, size, len(values))
+            size = CatalogStore._align(size + len(values) * values.itemsize)
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            for name, values in sections:
+                _, offset, _ = layout[name]
+                data = values.tobytes()
+                memory.buf[offset:offset + len(data)] = data
+            initargs = (memory.name, layout, list(discount_rules), list(category_codes), tax_rate,
+                        include_tax, apply_discounts)
+            with ProcessPoolExecutor(workers, initializer=BatchPricer._reprice_init, initargs=initargs) as pool:
+                futures = [pool.submit(BatchPricer._reprice_chunk, start, min(start + chunk_size, len(positions)))
+                           for start in range(0, len(positions), chunk_size)]
+                for future in as_completed(futures):
+                    start, totals = future.result()
+                    for index in range(len(totals) // 4):
+                        subtotal, discount, tax, total = totals[4 * index:4 * index + 4]
+                        yield positions[start + index], {
+                            'subtotal': subtotal, 'discounts': discount, 'tax': tax, 'total': total
+                        }
+        finally:
+            memory.close()
+            memory.unlink()
+
+    @staticmethod
+    def _reprice_init(name, layout, discount_rules, category_names, tax_rate, include_tax, apply_discounts):
+        """Подключение процесса-обработчика к общей памяти и компиляция правил скидок"""
+        memory = shared_memory.SharedMemory(name)
+        columns = {}
+        for column, (typecode, offset, count) in layout.items():
+            columns[column] = memory.buf[offset:offset + count * array(typecode).itemsize].cast(typecode)
+        BatchPricer._worker = (memory, columns, DiscountPlan(discount_rules), category_names,
+                               tax_rate, include_tax, apply_discounts)
+
+    @staticmethod
+    def _reprice_chunk(start, end):
+        """Итоги корзин с номерами [start, end) плоским массивом по четыре числа"""
+        _, columns, plan, category_names, tax_rate, include_tax, apply_discounts = BatchPricer._worker
+        if np is not None:
+            subtotals = np.frombuffer(columns['subtotals'], dtype=np.float64)[start:end]
+        else:
+            subtotals = columns['subtotals'][start:end].tolist()
+        category_subtotals = None
+        if plan.category_percentages:
+            offsets, codes, amounts = columns['offsets'], columns['codes'], columns['amounts']
+            category_subtotals = [
+                {category_names[codes[line]]: amounts[line] for line in range(offsets[cart], offsets[cart + 1])}
+                for cart in range(start, end)
+            ]
+        totals = array('d')
+        for row in BatchPricer._quote(subtotals, category_subtotals, plan, tax_rate, include_tax, apply_discounts):
+            totals.extend((row['subtotal'], row['discounts'], row['tax'], row['total']))
+        return start, totals
+
+
+class PricingPolicy:
+    """Правила скидок и ставка налога, общие для многих корзин
+
+    Корзины сессий хранят ссылку на один объект политики, поэтому
+    изменение правил сразу действует для всех корзин, а план скидок
+    компилируется один раз. План сбрасывается при замене списка правил
+    и замечает правила, добавленные в общий список; после изменения
+    правила на месте нужно вызвать invalidate_discounts().
+    """
+
+    __slots__ = ('_discount_rules', 'tax_rate', '_plan')
+
+    def __init__(self, discount_rules=None, tax_rate=0.20):
+        self._discount_rules = discount_rules if discount_rules is not None else []
+        self.tax_rate = tax_rate
+        self._plan = None
+
+    @property
+    def discount_rules(self):
+        """Правила скидок"""
+        return self._discount_rules
+
+    @discount_rules.setter
+    def discount_rules(self, rules):
+        self._discount_rules = rules
+        self._plan = None
+
+    def invalidate_discounts(self):
+        """Сброс плана скидок после изменения правил на месте"""
+        self._plan = None
+
+    @classmethod
+    def from_cart(cls, cart):
+        """Политика с правилами и налогом корзины; список правил общий с корзиной"""
+        return cls(cart.discount_rules, cart.tax_rate)
+
+    def plan(self):
+        """Скомпилированный план скидок для корзин сессий"""
+        plan = self._plan = DiscountPlan.current(self._plan, self._discount_rules)
+        return plan
+
+
+class SessionCart:
+    """Компактная корзина сессии
+
+    Строки хранятся в двух параллельных последовательностях: записи
+    товаров в закрепленной версии (ссылки на записи каталога, без копий)
+    и количества в массиве. Строка ищется линейным проходом - в корзине
+    обычно единицы или десятки строк, а словарь на каждую корзину занимал
+    бы больше памяти, чем сами строки. Итоги не накапливаются, а
+    считаются при запросе.
+    """
+
+    __slots__ = ('session_id', 'product_catalog', 'policy', 'products', 'quantities', 'last_access')
+
+    def __init__(self, session_id, product_catalog, policy, products=None, quantities=None):
+        self.session_id = session_id
+        self.product_catalog = product_catalog
+        self.policy = policy
+        self.products = products if products is not None else []
+        self.quantities = quantities if quantities is not None else array('q')
+        self.last_access = 0.0
+
+    @property
+    def line_count(self):
+        """Количество строк в корзине"""
+        return len(self.products)
+
+    @property
+    def items(self):
+        """Строки корзины в формате Cart.items"""
+        return [CartLine(product, quantity) for product, quantity in zip(self.products, self.quantities)]
+
+    def _line(self, product_id):
+        """Номер строки товара или None"""
+        for line, product in enumerate(self.products):
+            if product['id'] == product_id:
+                return line
+        return None
+
+    def add_item(self, product_id, quantity=1):
+        """Добавление товара в корзину"""
+        line = self._line(product_id)
+        if line is not None:
+            self.quantities[line] += quantity
+            return True
+        product = self.product_catalog._find_product_by_id(product_id)
+        if not product:
+            return False
+        self.products.append(product)
+        self.quantities.append(quantity)
+        return True
+
+    def remove_item(self, product_id, quantity=None):
+        """Удаление товара из корзины"""
+        line = self._line(product_id)
+        if line is None:
+            return False
+        if quantity is None or quantity >= self.quantities[line]:
+            del self.products[line]
+            del self.quantities[line]
+        else:
+            self.quantities[line] -= quantity
+        return True
+
+    def clear(self):
+        """Очистка корзины"""
+        self.products = []
+        self.quantities = array('q')
+
+    def refresh(self):
+        """Перевод строк на последние версии товаров; возвращает число обновленных и удаленных строк"""
+        find = self.product_catalog._find_product_by_id
+        updated = removed = 0
+        for line in range(len(self.products) - 1, -1, -1):
+            product = self.products[line]
+            current = find(product['id'])
+            if current is None:
+                del self.products[line]
+                del self.quantities[line]
+                removed += 1
+            elif current['version'] != product.get('version'):
+                self.products[line] = current
+                updated += 1
+        return updated, removed
+
+    def _totals(self):
+        """Сумма корзины и суммы по категориям"""
+        subtotal = 0.0
+        category_subtotals = {}
+        for product, quantity in zip(self.products, self.quantities):
+            amount = product['price'] * quantity
+            subtotal += amount
+            category = product['category']
+            category_subtotals[category] = category_subtotals.get(category, 0.0) + amount
+        return subtotal, category_subtotals
+
+    def calculate_subtotal(self):
+        """Расчет суммы без учета скидок и налогов"""
+        return sum(product['price'] * quantity for product, quantity in zip(self.products, self.quantities))
+
+    def calculate_total_weight(self):
+        """Расчет общего веса товаров в корзине"""
+        return sum(product['weight'] * quantity for product, quantity in zip(self.products, self.quantities))
+
+    def calculate_total(self, include_tax=True, apply_discounts=True):
+        """Расчет итоговой суммы по общей политике цен"""
+        if not self.products:
+            return {'subtotal': 0, 'discounts': 0, 'tax': 0, 'total': 0}
+
+        subtotal, category_subtotals = self._totals()
+        discounts = self.policy.plan().evaluate(subtotal, category_subtotals) if apply_discounts else 0
+        amount_after_discounts = subtotal - discounts
+        tax = amount_after_discounts * self.policy.tax_rate if include_tax else 0
+        return {
+            'subtotal': subtotal,
+            'discounts': discounts,
+            'tax': tax,
+            'total': amount_after_discounts + tax
+        }
+
+    def memory_usage(self):
+        """Оценка памяти корзины в байтах без общих записей товаров"""
+        return sys.getsizeof(self) + sys.getsizeof(self.products) + sys.getsizeof(self.quantities)
+
+
+class SessionCartManager:
+    """Корзины сессий по идентификатору с вытеснением простаивающих на диск
+
+    В памяти держится не больше max_carts корзин; корзина, к которой
+    дольше всех не обращались, вытесняется первой. Корзины, простоявшие
+    дольше ttl секунд, вытесняются при очередном обращении к менеджеру
+    или вызове evict_idle(). Вытесненные корзины хранятся в SQLite в
+    каталоге directory и загружаются обратно при следующем get_cart.
+    Корзину нужно получать через get_cart при каждом обращении: ссылка
+    на вытесненную корзину больше не связана с менеджером.
+    """
+
+    DATABASE_FILE = 'sessions.db'
+
+    def __init__(self, product_catalog, directory, policy=None, max_carts=None, ttl=None):
+        self.product_catalog = product_catalog
+        self.policy = policy if policy is not None else PricingPolicy()
+        self.max_carts = max_carts
+        self.ttl = ttl
+        # Корзины в порядке последнего обращения: первая - самая давняя
+        self._carts = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, self.DATABASE_FILE))
+        # Вытесненные корзины - кэш сессий, поэтому fsync на каждую запись не нужен
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS carts (session_id PRIMARY KEY, lines TEXT NOT NULL)')
+        self.evictions = 0
+        self.rehydrations = 0
+        self.eviction_seconds = 0.0
+        self.rehydration_seconds = 0.0
+
+    def __len__(self):
+        """Количество корзин в памяти"""
+        return len(self._carts)
+
+    def get_cart(self, session_id):
+        """Корзина сессии: из памяти, с диска или новая"""
+        now = time.monotonic()
+        carts = self._carts
+        cart = carts.get(session_id)
+        if cart is not None:
+            carts.move_to_end(session_id)
+        else:
+            cart = self._rehydrate(session_id)
+            if cart is None:
+                cart = SessionCart(session_id, self.product_catalog, self.policy)
+            carts[session_id] = cart
+        cart.last_access = now
+
+        if self.ttl is not None:
+            self.evict_idle(now)
+        if self.max_carts is not None and len(carts) > self.max_carts:
+            self._evict([carts.popitem(last=False)[1] for _ in range(len(carts) - self.max_carts)])
+        return cart
+
+    def evict_idle(self, now=None):
+        """Вытеснение корзин, к которым не обращались дольше ttl; возвращает их число"""
+        if self.ttl is None or not self._carts:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.ttl
+        carts = self._carts
+        idle = []
+        for cart in carts.values():
+            if cart.last_access > deadline:
+                break
+            idle.append(cart)
+        for cart in idle:
+            del carts[cart.session_id]
+        self._evict(idle)
+        return len(idle)
+
+    def evict(self, session_id):
+        """Принудительное вытеснение корзины сессии на диск"""
+        cart = self._carts.pop(session_id, None)
+        if cart is None:
+            return False
+        self._evict([cart])
+        return True
+
+    def _evict(self, carts):
+        """Запись корзин на диск одной транзакцией"""
+        if not carts:
+            return
+        start = time.perf_counter()
+        rows = []
+        empty = []
+        for cart in carts:
+            if cart.products:
+                products = [dict(product) for product in cart.products]
+                rows.append((cart.session_id, json.dumps(
+                    [products, cart.quantities.tolist()], ensure_ascii=False, separators=(',', ':'))))
+            else:
+                empty.append((cart.session_id,))
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO carts VALUES (?, ?)', rows)
+            self._db.executemany('DELETE FROM carts WHERE session_id = ?', empty)
+        self.evictions += len(carts)
+        self.eviction_seconds += time.perf_counter() - start
+
+    def _rehydrate(self, session_id):
+        """Загрузка вытесненной корзины; None, если на диске ее нет"""
+        start = time.perf_counter()
+        row = self._db.execute('SELECT lines FROM carts WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        products, quantities = json.loads(row[0])
+        # Записи той же версии, что в каталоге, снова разделяются с каталогом
+        find = self.product_catalog._find_product_by_id
+        for line, product in enumerate(products):
+            current = find(product['id'])
+            if current is not None and current['version'] == product.get('version'):
+                products[line] = current
+            else:
+                products[line] = ProductRecord.from_mapping(product)
+        with self._db:
+            self._db.execute('DELETE FROM carts WHERE session_id = ?', (session_id,))
+        self.rehydrations += 1
+        self.rehydration_seconds += time.perf_counter() - start
+        return SessionCart(session_id, self.product_catalog, self.policy, products, array('q', quantities))
+
+    def close_session(self, session_id):
+        """Удаление корзины сессии из памяти и с диска"""
+        self._carts.pop(session_id, None)
+        with self._db:
+            self._db.execute('DELETE FROM carts WHERE session_id = ?', (session_id,))
+
+    def stored_count(self):
+        """Количество корзин на диске"""
+        return self._db.execute('SELECT COUNT(*) FROM carts').fetchone()[0]
+
+    def memory_usage(self):
+        """Оценка памяти корзин в памяти в байтах без общих записей товаров"""
+        return sys.getsizeof(self._carts) + sum(cart.memory_usage() for cart in self._carts.values())
+
+    def stats(self):
+        """Счетчики вытеснения и загрузки корзин со средней задержкой"""
+        return {
+            'in_memory': len(self._carts),
+            'on_disk': self.stored_count(),
+            'evictions': self.evictions,
+            'rehydrations': self.rehydrations,
+            'eviction_us': self.eviction_seconds / self.evictions * 1e6 if self.evictions else 0.0,
+            'rehydration_us': self.rehydration_seconds / self.rehydrations * 1e6 if self.rehydrations else 0.0
+        }
+
+    def close(self):
+        """Вытеснение всех корзин на диск и закрытие базы"""
+        carts = list(self._carts.values())
+        self._carts.clear()
+        self._evict(carts)
+        self._db.close()
+
+
 class Sorter:
-    """Класс для сортировки товаров в корзине"""
+    """Класс для сортировки товаров в корзине и в каталоге
+
+    Сортировать можно строки корзины (Cart.items) и товары каталога
+    (Product.products). Ключ сортировки - имя поля ('price', 'weight', 'category', 'name')
+    или последовательность полей для составного ключа; префикс '-'
+    задает убывание по отдельному полю, например ('category', '-price').
+    Значения ключа вычисляются один раз на элемент, список сортируется
+    на месте, порядок равных элементов сохраняется для всех алгоритмов.
+    """
+
+    FIELDS = ('price', 'weight', 'category', 'name')
 
     @staticmethod
-    def sort(items, algorithm='quick', key='price', reverse=False):
+    def sort(items, algorithm='tim', key='price', reverse=False):
         if not items:
             return items
 
-        key_func = {
-            'price': lambda x: x['product']['price'],
-            'weight': lambda x: x['product']['weight'],
-            'category': lambda x: x['product']['category'],
-            'name': lambda x: x['product']['name']
-        }.get(key.lower(), lambda x: x['product']['price'])
-
         algorithms = {
+            'tim': None,
             'bubble': Sorter._bubble_sort,
             'insertion': Sorter._insertion_sort,
             'quick': Sorter._quick_sort,
@@ -264,84 +3203,640 @@ class Sorter:
         if algorithm.lower() not in algorithms:
             print(f"Алгоритм '{algorithm}' не поддерживается. Используется быстрая сортировка.")
             algorithm = 'quick'
+        sort_entries = algorithms[algorithm.lower()]
+
+        keys = Sorter._sort_keys(items, key)
+        if sort_entries is None:
+            order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+        else:
+            # Номер элемента в паре с ключом делает все ключи различными,
+            # поэтому результат не зависит от устойчивости алгоритма
+            sign = -1 if reverse else 1
+            entries = [(value, sign * index) for index, value in enumerate(keys)]
+            sort_entries(entries)
+            if reverse:
+                entries.reverse()
+            order = [sign * index for _, index in entries]
+
+        items[:] = [items[index] for index in order]
+        return items
 
-        return algorithms[algorithm](items, key_func, reverse)
+    @staticmethod
+    def top_k(items, k, key='price', reverse=False):
+        """Первые k элементов в порядке сортировки без сортировки всей коллекции"""
+        if not isinstance(items, list):
+            items = list(items)
+        if k <= 0 or not items:
+            return []
+
+        keys = Sorter._sort_keys(items, key)
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return [items[index] for index in select(k, range(len(keys)), key=keys.__getitem__)]
+
+    @staticmethod
+    def page(items, page, page_size, key='price', reverse=False):
+        """Страница page (с 1) размером page_size в порядке сортировки"""
+        if page < 1:
+            return []
+        return Sorter.top_k(items, page * page_size, key, reverse)[(page - 1) * page_size:]
+
+    @staticmethod
+    def _sort_keys(items, key):
+        """Значения ключа сортировки для каждого элемента"""
+        fields = [key] if isinstance(key, str) else list(key)
+        records = [item['product'] for item in items] if 'product' in items[0] else items
+        columns = []
+        for field in fields:
+            name = field.lstrip('-').lower()
+            if name not in Sorter.FIELDS:
+                name = 'price'
+            values = [record[name] for record in records]
+            if field.startswith('-'):
+                values = Sorter._descending(values)
+            columns.append(values)
+        return columns[0] if len(columns) == 1 else list(zip(*columns))
+
+    @staticmethod
+    def _descending(values):
+        """Преобразование значений так, чтобы сортировка по возрастанию давала убывание"""
+        if all(isinstance(value, (int, float)) for value in values):
+            return [-value for value in values]
+        ranks = {value: rank for rank, value in enumerate(sorted(set(values)))}
+        return [-ranks[value] for value in values]
 
     @staticmethod
-    def _bubble_sort(items, key, reverse=False):
-        n = len(items)
+    def _bubble_sort(entries):
+        n = len(entries)
         for i in range(n - 1):
+            swapped = False
             for j in range(0, n - i - 1):
-                a = key(items[j])
-                b = key(items[j + 1])
-                if (a > b and not reverse) or (a < b and reverse):
-                    items[j], items[j + 1] = items[j + 1], items[j]
-        return items
+                if entries[j] > entries[j + 1]:
+                    entries[j], entries[j + 1] = entries[j + 1], entries[j]
+                    swapped = True
+            if not swapped:
+                break
 
     @staticmethod
-    def _insertion_sort(items, key, reverse=False):
-        for i in range(1, len(items)):
-            current = items[i]
+    def _insertion_sort(entries, lo=0, hi=None):
+        if hi is None:
+            hi = len(entries)
+        for i in range(lo + 1, hi):
+            current = entries[i]
             j = i - 1
-            while j >= 0 and (
-                    (key(items[j]) > key(current) and not reverse) or
-                    (key(items[j]) < key(current) and reverse)
-            ):
-                items[j + 1] = items[j]
+            while j >= lo and entries[j] > current:
+                entries[j + 1] = entries[j]
                 j -= 1
-            items[j + 1] = current
-        return items
+            entries[j + 1] = current
 
     @staticmethod
-    def _quick_sort(items, key, reverse=False):
-        if len(items) <= 1:
-            return items
+    def _quick_sort(entries):
+        # Итеративная сортировка на месте: стек диапазонов вместо рекурсии,
+        # короткие диапазоны досортировываются вставками
+        stack = [(0, len(entries) - 1)]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo < 16:
+                Sorter._insertion_sort(entries, lo, hi + 1)
+                continue
+
+            pivot = sorted((entries[lo], entries[(lo + hi) // 2], entries[hi]))[1]
+            i, j = lo, hi
+            while i <= j:
+                while entries[i] < pivot:
+                    i += 1
+                while entries[j] > pivot:
+                    j -= 1
+                if i <= j:
+                    entries[i], entries[j] = entries[j], entries[i]
+                    i += 1
+                    j -= 1
+
+            if j - lo > hi - i:
+                stack.append((lo, j))
+                stack.append((i, hi))
+            else:
+                stack.append((i, hi))
+                stack.append((lo, j))
 
-        pivot = items[len(items) // 2]
-        pivot_key = key(pivot)
-        left = [x for x in items if (key(x) < pivot_key) ^ reverse]
-        middle = [x for x in items if key(x) == pivot_key]
-        right = [x for x in items if (key(x) > pivot_key) ^ reverse]
+    @staticmethod
+    def _merge_sort(entries):
+        # Восходящая сортировка слиянием с одним буфером вместо рекурсивных срезов
+        n = len(entries)
+        source, target = entries, [None] * n
+        width = 1
+        while width < n:
+            for lo in range(0, n, 2 * width):
+                mid = min(lo + width, n)
+                hi = min(lo + 2 * width, n)
+                Sorter._merge(source, target, lo, mid, hi)
+            source, target = target, source
+            width *= 2
+        if source is not entries:
+            entries[:] = source
 
-        return Sorter._quick_sort(left, key, reverse) + middle + Sorter._quick_sort(right, key, reverse)
+    @staticmethod
+    def _merge(source, target, lo, mid, hi):
+        i, j, k = lo, mid, lo
+        while i < mid and j < hi:
+            if source[i] <= source[j]:
+                target[k] = source[i]
+                i += 1
+            else:
+                target[k] = source[j]
+                j += 1
+            k += 1
+
+        target[k:k + mid - i] = source[i:mid]
+        k += mid - i
+        target[k:k + hi - j] = source[j:hi]
+
+
+class Renderer:
+    """Построение текстового, CSV и JSON представления записей каталога и корзины
+
+    Вывод выдается генератором по частям из chunk_size записей, поэтому
+    даже большой каталог можно передавать в файл или канал без
+    накопления всего текста. Строка текстового вывода для записи
+    собирается одним шаблоном format_map по выбранным полям.
+    """
+
+    # Подписи и формат полей в текстовом выводе: поле -> (подпись, формат)
+    CATALOG_LABELS = {
+        'id': ('ID', ''),
+        'name': ('Название', ''),
+        'category': ('Категория', ''),
+        'price': ('Цена', ':.2f} руб.'),
+        'weight': ('Вес', ':.2f} кг'),
+        'description': ('Описание', ''),
+    }
+    CART_LABELS = {
+        'id': ('ID', ''),
+        'name': ('Название', ''),
+        'category': ('Категория', ''),
+        'price': ('Цена за шт.', ':.2f} руб.'),
+        'weight': ('Вес за шт.', ':.2f} кг'),
+        'quantity': ('Количество', ''),
+        'subtotal': ('Итого', ':.2f} руб.'),
+    }
+    FORMATS = ('text', 'csv', 'json')
 
     @staticmethod
-    def _merge_sort(items, key, reverse=False):
-        if len(items) <= 1:
-            return items
+    def select(rows, page=None, limit=None, offset=0):
+        """Записи со смещением offset; при заданном page (с 1) - страница размером limit"""
+        if page is not None:
+            if limit is None:
+                raise ValueError("Для постраничного вывода нужен limit")
+            offset += (max(page, 1) - 1) * limit
+        return islice(rows, offset, None if limit is None else offset + limit)
 
-        mid = len(items) // 2
-        left = Sorter._merge_sort(items[:mid], key, reverse)
-        right = Sorter._merge_sort(items[mid:], key, reverse)
+    @staticmethod
+    def _template(labels, fields):
+        """Шаблон текстового блока одной записи"""
+        parts = []
+        for field in fields:
+            label, spec = labels[field]
+            parts.append(f"{label}: {{{field}{spec or '}'}")
+        return '\n' + '\n'.join(parts) + '\n'
 
-        return Sorter._merge(left, right, key, reverse)
+    @staticmethod
+    def _chunks(rows, chunk_size):
+        """Записи списками по chunk_size штук"""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
 
     @staticmethod
-    def _merge(left, right, key, reverse):
-        result = []
-        i = j = 0
+    def render(rows, labels, format='text', fields=None, chunk_size=1000):
+        """Генератор частей вывода записей rows в формате text, csv или json
+
+        Для text запись выводится блоком "Подпись: значение" по полям
+        fields (по умолчанию все поля labels). csv начинается строкой
+        заголовка, json - компактный массив объектов.
+        """
+        fields = tuple(fields or labels)
+        for field in fields:
+            if field not in labels:
+                raise ValueError(f"Неизвестное поле {field}")
+        if format == 'text':
+            render_row = Renderer._template(labels, fields).format_map
+            for chunk in Renderer._chunks(rows, chunk_size):
+                yield ''.join(map(render_row, chunk))
+        elif format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            for chunk in Renderer._chunks(rows, chunk_size):
+                writer.writerows([[row[field] for field in fields] for row in chunk])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        elif format == 'json':
+            encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+            separator = '['
+            for chunk in Renderer._chunks(rows, chunk_size):
+                # Массив части без скобок дописывается к общему массиву
+                yield separator + encode([{field: row[field] for field in fields} for row in chunk])[1:-1]
+                separator = ','
+            yield ']\n' if separator == ',' else '[]\n'
+        else:
+            raise ValueError(f"Неизвестный формат {format}")
 
-        while i < len(left) and j < len(right):
-            left_val = key(left[i])
-            right_val = key(right[j])
+    @staticmethod
+    def write(chunks, file=None):
+        """Вывод частей одной записью в file (по умолчанию sys.stdout)"""
+        (file or sys.stdout).write(''.join(chunks))
+
+
+class ViewCache:
+    """Кэш производных представлений каталога с вытеснением давно не использованных
+
+    Представление хранится вместе с версией каталога, для которой оно
+    построено. При запросе после изменений каталога оно обновляется
+    функцией update по записям ленты changes_since, а если функции нет,
+    лента уже не содержит нужных изменений или каталог был заменен
+    целиком - строится заново функцией build.
+    """
+
+    def __init__(self, catalog, max_entries=64):
+        self.catalog = catalog
+        self.max_entries = max_entries
+        # Ключ представления -> (версия каталога, значение) в порядке использования
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.updates = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, build, update=None):
+        """Значение представления key для текущей версии каталога
+
+        build(catalog) строит значение с нуля, update(value, changes)
+        возвращает значение с учетом списка изменений Change.
+        """
+        catalog = self.catalog
+        with catalog._reading():
+            version = catalog.version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+                changes = catalog.changes_since(entry[0]) if update is not None else None
+                if changes is not None and all(change.kind != 'reset' for change in changes):
+                    self.updates += 1
+                    value = update(entry[1], changes)
+                    self._entries[key] = (version, value)
+                    return value
+            self.builds += 1
+            value = build(catalog)
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self, key=None):
+        """Удаление одного представления или всех"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def sorted_products(self, field, reverse=False):
+        """Товары по возрастанию (убыванию) поля; при изменениях сдвигаются только измененные записи"""
+        def sort_key(product):
+            return (product[field], product['id'])
+
+        def build(catalog):
+            products = sorted(catalog, key=sort_key)
+            return [sort_key(product) for product in products], products
+
+        def update(value, changes):
+            keys, products = value
+            for change in changes:
+                if change.old is not None:
+                    position = bisect_left(keys, sort_key(change.old))
+                    del keys[position]
+                    del products[position]
+                if change.new is not None:
+                    key = sort_key(change.new)
+                    position = bisect_left(keys, key)
+                    keys.insert(position, key)
+                    products.insert(position, change.new)
+            return value
+
+        products = self.get(('sorted', field), build, update)[1]
+        return products[::-1] if reverse else list(products)
+
+    def rendered_catalog(self, fields=None):
+        """Текст каталога как у display_catalog; при изменениях форматируются только измененные товары"""
+        fields = tuple(fields or Renderer.CATALOG_LABELS)
+        render = Renderer._template(Renderer.CATALOG_LABELS, fields).format_map
+
+        def build(catalog):
+            return {product['id']: render(product) for product in catalog}
+
+        def update(blocks, changes):
+            for change in changes:
+                if change.new is None:
+                    del blocks[change.old['id']]
+                else:
+                    blocks[change.new['id']] = render(change.new)
+            return blocks
 
-            if (left_val <= right_val and not reverse) or (left_val >= right_val and reverse):
-                result.append(left[i])
-                i += 1
-            else:
-                result.append(right[j])
-                j += 1
+        blocks = self.get(('rendered', fields), build, update)
+        return "\n=== КАТАЛОГ ТОВАРОВ ===\n" + ''.join(blocks.values()) + "\n=======================\n"
 
-        result.extend(left[i:])
-        result.extend(right[j:])
-        return result
 
+class LatencyHistogram:
+    """Гистограмма задержек в наносекундах с логарифмическими корзинами
+
+    Значения меньше 8 нс учитываются точно, дальше каждая октава делится
+    на четыре корзины, поэтому ошибка перцентилей не превышает 25%.
+    """
+
+    _SIZE = 8 + 4 * 61
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * self._SIZE))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, nanoseconds):
+        if nanoseconds < 8:
+            index = max(nanoseconds, 0)
+        else:
+            bits = nanoseconds.bit_length()
+            index = 8 + (bits - 4) * 4 + ((nanoseconds >> (bits - 3)) & 3)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    @staticmethod
+    def upper_bound(index):
+        """Верхняя граница корзины в наносекундах"""
+        if index < 8:
+            return index
+        bits, step = divmod(index - 8, 4)
+        bits += 4
+        return (1 << (bits - 1)) + (step + 1) * (1 << (bits - 3)) - 1
+
+    def percentile(self, fraction):
+        """Оценка перцентиля в наносекундах"""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * fraction // 1))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+
+class Metrics:
+    """Счетчики вызовов, гистограммы задержек и показатели каталога и корзин
+
+    Сбор выключен по умолчанию и ничего не стоит: enable() подменяет
+    измеряемые методы классов обертками с замером времени, disable()
+    возвращает исходные методы. Вложенный вызов той же операции
+    (переопределение в подклассе, вызывающее super()) учитывается один
+    раз, внешним вызовом. Показатели (число товаров, строк корзин
+    и правил скидок) вычисляются только при выгрузке по объектам,
+    переданным в track_catalog и track_cart.
+    """
+
+    PREFIX = 'store'
 
-class TextInterface:
     def __init__(self):
-        self.product_catalog = Product()
+        self.histograms = {}
+        self.enabled = False
+        self._originals = []
+        self._active = threading.local()
+        self._catalogs = weakref.WeakSet()
+        self._carts = weakref.WeakSet()
+
+    def _operations(self):
+        """Измеряемые методы: (класс, имя метода, имя операции или функция имени по аргументам)"""
+        def sort_operation(args, kwargs):
+            algorithm = args[1] if len(args) > 1 else kwargs.get('algorithm', 'tim')
+            return f'sorter.sort.{str(algorithm).lower()}'
+
+        return (
+            (Product, '_find_product_by_id', 'product.lookup'),
+            (Product, 'add_product', 'product.add'),
+            (Product, 'edit_product', 'product.edit'),
+            (Product, 'delete_product', 'product.delete'),
+            (Cart, 'add_item', 'cart.add_item'),
+            (Cart, 'remove_item', 'cart.remove_item'),
+            (Cart, 'clear', 'cart.clear'),
+            (Cart, 'calculate_total', 'cart.calculate_total'),
+            (Cart, '_apply_discounts', 'cart.apply_discounts'),
+            (Sorter, 'sort', sort_operation)
+        )
+
+    @staticmethod
+    def _class_tree(cls):
+        """Класс и все его подклассы"""
+        classes = [cls]
+        for subclass in cls.__subclasses__():
+            classes.extend(Metrics._class_tree(subclass))
+        return classes
+
+    def enable(self):
+        """Включение сбора: замена измеряемых методов обертками"""
+        if self.enabled:
+            return
+        for base, name, operation in self._operations():
+            for cls in self._class_tree(base):
+                original = cls.__dict__.get(name)
+                if original is None:
+                    continue
+                self._originals.append((cls, name, original))
+                if isinstance(original, staticmethod):
+                    setattr(cls, name, staticmethod(self._timed(original.__func__, operation)))
+                else:
+                    setattr(cls, name, self._timed(original, operation))
+        self.enabled = True
+
+    def disable(self):
+        """Выключение сбора: возврат исходных методов; накопленные значения сохраняются"""
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        self.enabled = False
+
+    def reset(self):
+        """Обнуление накопленных гистограмм"""
+        self.histograms = {}
+
+    def _timed(self, function, operation):
+        """Обертка метода с замером времени вызова"""
+        clock = time.perf_counter_ns
+
+        if callable(operation):
+            def timed(*args, **kwargs):
+                active = self._active.__dict__.setdefault('operations', set())
+                if operation in active:
+                    return function(*args, **kwargs)
+                active.add(operation)
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = clock() - start
+                    active.discard(operation)
+                    name = operation(args, kwargs)
+                    histogram = self.histograms.get(name)
+                    if histogram is None:
+                        histogram = self.histograms[name] = LatencyHistogram()
+                    histogram.observe(elapsed)
+        else:
+            def timed(*args, **kwargs):
+                active = self._active.__dict__.setdefault('operations', set())
+                if operation in active:
+                    return function(*args, **kwargs)
+                active.add(operation)
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = clock() - start
+                    active.discard(operation)
+                    histogram = self.histograms.get(operation)
+                    if histogram is None:
+                        histogram = self.histograms[operation] = LatencyHistogram()
+                    histogram.observe(elapsed)
+
+        timed.__name__ = function.__name__
+        timed.__doc__ = function.__doc__
+        timed.__wrapped__ = function
+        return timed
+
+    def track_catalog(self, catalog):
+        """Учет каталога в показателях"""
+        self._catalogs.add(catalog)
+
+    def track_cart(self, cart):
+        """Учет корзины в показателях"""
+        self._carts.add(cart)
+
+    def gauges(self):
+        """Текущие показатели каталогов и корзин"""
+        carts = list(self._carts)
+        return {
+            'catalog_products': sum(len(catalog) for catalog in self._catalogs),
+            'carts': len(carts),
+            'cart_lines': sum(cart.line_count for cart in carts),
+            'cart_discount_rules': sum(len(cart.discount_rules) for cart in carts)
+        }
+
+    def to_dict(self):
+        """Снимок метрик: вызовы и перцентили задержек в секундах, показатели"""
+        operations = {}
+        for name, histogram in sorted(self.histograms.items()):
+            operations[name] = {
+                'count': histogram.count,
+                'sum': histogram.total / 1e9,
+                'max': histogram.max / 1e9,
+                'p50': histogram.percentile(0.50) / 1e9,
+                'p95': histogram.percentile(0.95) / 1e9,
+                'p99': histogram.percentile(0.99) / 1e9
+            }
+        return {'enabled': self.enabled, 'operations': operations, 'gauges': self.gauges()}
+
+    def dump_json(self, indent=2):
+        """Метрики в формате JSON"""
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def dump_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        prefix = self.PREFIX
+        lines = [
+            f'# HELP {prefix}_operation_seconds Время выполнения операций',
+            f'# TYPE {prefix}_operation_seconds histogram'
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            # Наружу выдаются границы по степеням двойки от 1 мкс до 17 с
+            cumulative = list(accumulate(histogram.counts))
+            for power in range(10, 35):
+                seen = cumulative[8 + (power - 4) * 4 + 3]
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{name}",le="{2 ** power / 1e9:g}"}} {seen}')
+            lines.append(f'{prefix}_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{prefix}_operation_seconds_sum{{operation="{name}"}} {histogram.total / 1e9:g}')
+            lines.append(f'{prefix}_operation_seconds_count{{operation="{name}"}} {histogram.count}')
+        for name, value in self.gauges().items():
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def display(self):
+        """Отображение метрик таблицей"""
+        print("\n=== МЕТРИКИ ===")
+        print(f"Сбор метрик: {'включен' if self.enabled else 'выключен'}")
+        if self.histograms:
+            print(f"\n{'Операция':<26}{'Вызовы':>10}{'p50, мкс':>12}{'p95, мкс':>12}{'p99, мкс':>12}")
+            for name, row in self.to_dict()['operations'].items():
+                print(f"{name:<26}{row['count']:>10}{row['p50'] * 1e6:>12.1f}"
+                      f"{row['p95'] * 1e6:>12.1f}{row['p99'] * 1e6:>12.1f}")
+        print()
+        for name, value in self.gauges().items():
+            print(f"{name}: {value}")
+        print("===============")
+
+
+# Общий сборщик метрик модуля
+metrics = Metrics()
+
+
+class TextInterface:
+    def __init__(self, data_dir=None, verbose=True):
+        # С data_dir каталог и правила скидок загружаются из хранилища и сохраняются в нем
+        # Библиотечные классы работают молча, сообщения выводит подписанный интерфейс
+        self.verbose = verbose
+        self.store = None
+        if data_dir is None:
+            self.product_catalog = Product()
+            self.cart = Cart(self.product_catalog)
+            self._subscribe()
+            self._initialize_sample_data()
+            return
+
+        self.store = CatalogStore(data_dir)
+        self.product_catalog = self.store.load()
         self.cart = Cart(self.product_catalog)
-        self._initialize_sample_data()
+        self._subscribe()
+        if not self.store.restore_pricing(self.cart):
+            if not len(self.product_catalog):
+                self._initialize_sample_data()
+            self.store.save_pricing(self.cart)
+        self.cart.subscribe(self._save_pricing)
+
+    def _save_pricing(self, event):
+        """Сохранение правил скидок и ставки налога в хранилище после их изменения"""
+        if self.store is not None and isinstance(event, (DiscountRuleAdded, TaxRateSet)):
+            self.store.save_pricing(self.cart)
+
+    def _subscribe(self):
+        """Вывод сообщений каталога и корзины на экран"""
+        if self.verbose:
+            self.product_catalog.subscribe(print_event)
+            self.cart.subscribe(print_event)
+        metrics.track_catalog(self.product_catalog)
+        metrics.track_cart(self.cart)
 
     def _initialize_sample_data(self):
         """Инициализация тестовых данных"""
@@ -391,11 +3886,13 @@ class TextInterface:
 
     def sort_cart_interface(self):
         """Интерфейс сортировки корзины"""
-        print("\nДоступные алгоритмы сортировки: bubble, insertion, quick, merge")
-        algorithm = input("Выберите алгоритм (по умолчанию quick): ") or 'quick'
+        print("\nДоступные алгоритмы сортировки: tim, bubble, insertion, quick, merge")
+        algorithm = input("Выберите алгоритм (по умолчанию tim): ") or 'tim'
 
         print("\nДоступные поля для сортировки: price, weight, category, name")
+        print("Несколько полей указываются через запятую, '-' перед полем - по убыванию")
         key = input("Выберите поле для сортировки (по умолчанию price): ") or 'price'
+        key = [field.strip() for field in key.split(',') if field.strip()] or 'price'
 
         reverse = input("Сортировать по убыванию? (y/n, по умолчанию n): ").lower() == 'y'
 
@@ -403,6 +3900,25 @@ class TextInterface:
         print("Корзина успешно отсортирована.")
         self.cart.display()
 
+    def metrics_interface(self):
+        """Интерфейс метрик производительности"""
+        if not metrics.enabled:
+            if input("Сбор метрик выключен. Включить? (y/n): ").lower() == 'y':
+                metrics.enable()
+                print("Сбор метрик включен.")
+            return
+
+        output = input("Формат вывода (text/json/prometheus, по умолчанию text): ").lower() or 'text'
+        if output == 'json':
+            print(metrics.dump_json())
+        elif output == 'prometheus':
+            print(metrics.dump_prometheus())
+        else:
+            metrics.display()
+        if input("Выключить сбор метрик? (y/n, по умолчанию n): ").lower() == 'y':
+            metrics.disable()
+            print("Сбор метрик выключен.")
+
     def main_menu(self):
         """Главное меню"""
         while True:
@@ -414,6 +3930,7 @@ class TextInterface:
             print("5. Сортировка корзины")
             print("6. Расчет итоговой суммы")
             print("7. Выход")
+            print("8. Метрики производительности")
 
             choice = input("Выберите действие: ")
 
@@ -430,217 +3947,104 @@ class TextInterface:
             elif choice == '6':
                 self.cart.display_totals()
             elif choice == '7':
+                self.close()
                 print("До свидания!")
                 break
+            elif choice == '8':
+                self.metrics_interface()
             else:
                 print("Неверный ввод, попробуйте еще раз.")
 
-
-
-# Запуск программы
-
-interface = TextInterface()
-interface.main_menu()
-
-# Добавляем товары в корзину (имитация пользовательского ввода)
-interface.cart.add_item(1, 2)  # 2 смартфона
-interface.cart.add_item(2, 1)  # 1 ноутбук
-
-print("\nДемонстрация работы скидок:")
-interface.cart.display_totals()
-
-# Добавим еще товаров, чтобы активировать пороговую скидку
-interface.cart.add_item(3, 2)  # 2 наушников
-
-print("\nПосле добавления товаров для пороговой скидки:")
-interface.cart.display_totals()
+    def close(self):
+        """Сохранение и закрытие хранилища"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def run_script(self, lines):
+        """Пакетное выполнение команд без запросов ввода; возвращает число ошибок
+
+        Команды (по одной в строке, '#' - комментарий):
+          product <название> <категория> <цена> <вес> [описание]
+          add <ID> [количество]
+          remove <ID> [количество]
+          sort [алгоритм] [поле[,поле...]] [desc]
+          discount percentage|fixed <значение>
+          tax <ставка>
+          totals | display | catalog | clear | refresh
+        Значения с пробелами берутся в кавычки.
+        """
+        errors = 0
+        for line_number, line in enumerate(lines, 1):
+            try:
+                # shlex нужен только строкам с кавычками и комментариями
+                words = shlex.split(line, comments=True) if '"' in line or "'" in line or '#' in line else line.split()
+                if words:
+                    self._run_command(words[0].lower(), words[1:])
+            except (ValueError, IndexError) as error:
+                errors += 1
+                print(f"Строка {line_number}: {error}", file=sys.stderr)
+        return errors
+
+    def _run_command(self, command, args):
+        """Выполнение одной команды пакетного режима"""
+        if command == 'product':
+            name, category, price, weight = args[:4]
+            self.product_catalog.add_product(name, category, price, weight, ' '.join(args[4:]))
+        elif command == 'add':
+            self.cart.add_item(int(args[0]), int(args[1]) if len(args) > 1 else 1)
+        elif command == 'remove':
+            self.cart.remove_item(int(args[0]), int(args[1]) if len(args) > 1 else None)
+        elif command == 'sort':
+            reverse = bool(args) and args[-1].lower() == 'desc'
+            if reverse:
+                args = args[:-1]
+            algorithm = args[0] if args else 'tim'
+            key = [field for field in args[1].split(',') if field] if len(args) > 1 else 'price'
+            self.cart.items = Sorter.sort(self.cart.items, algorithm=algorithm, key=key, reverse=reverse)
+        elif command == 'discount':
+            self.cart.add_discount_rule(args[0], value=args[1])
+        elif command == 'tax':
+            self.cart.set_tax_rate(float(args[0]))
+        elif command == 'totals':
+            self.cart.display_totals()
+        elif command == 'display':
+            self.cart.display()
+        elif command == 'catalog':
+            self.product_catalog.display_catalog()
+        elif command == 'clear':
+            self.cart.clear()
+        elif command == 'refresh':
+            self.cart.refresh()
+        else:
+            raise ValueError(f"неизвестная команда {command}")
+
+
+def main(argv=None):
+    """Точка входа командной строки: интерактивное меню или пакетный сценарий"""
+    parser = argparse.ArgumentParser(description="Каталог товаров и корзина покупок")
+    parser.add_argument('--data', metavar='DIR',
+                        help="каталог хранилища: товары и правила скидок загружаются из него и сохраняются в нем")
+    parser.add_argument('--script', metavar='FILE',
+                        help="файл команд для пакетного режима ('-' - стандартный ввод)")
+    parser.add_argument('--quiet', action='store_true',
+                        help="не выводить сообщения об изменениях каталога и корзины")
+    args = parser.parse_args(argv)
+
+    interface = TextInterface(args.data, verbose=not args.quiet)
+    try:
+        if args.script is None:
+            interface.main_menu()
+            return 0
+        if args.script == '-':
+            errors = interface.run_script(sys.stdin)
+        else:
+            with open(args.script, encoding='utf-8') as script:
+                errors = interface.run_script(script)
+        return 1 if errors else 0
+    finally:
+        interface.close()
 
 
 if __name__ == "__main__":
-    catalog = Product()
-
-    phone_id = catalog.add_product(
-        name="Смартфон Samsung Galaxy S21",
-        category="Смартфоны",
-        price=69990,
-        weight=0.17,
-        description="Флагманский смартфон с AMOLED-экраном и тройной камерой"
-    )
-
-    laptop_id = catalog.add_product(
-        name="Ноутбук ASUS VivoBook 15",
-        category="Ноутбуки",
-        price=54990,
-        weight=1.8,
-        description="Ультрабук с процессором Intel Core i5 и SSD на 512 ГБ"
-    )
-
-
-    catalog.display_catalog()
-
-
-    catalog.edit_product(
-        phone_id,
-        name="Смартфон Samsung Galaxy S21 Ultra",
-        price=79990,
-        description="Флагманский смартфон с S-Pen, AMOLED-экраном и 108MP камерой"
-    )
-
-
-    phone = catalog.get_product_info(phone_id)
-    print("\nОбновленная информация о товаре:")
-    print(f"Название: {phone['name']}")
-    print(f"Новая цена: {phone['price']} руб.")
-    print(f"Новое описание: {phone['description']}")
-
-
-    catalog.delete_product(laptop_id)
-
-
-    print("\nКаталог после удаления:")
-    catalog.display_catalog()
-
-
-    print(f"\nВсего товаров в каталоге: {catalog.get_total_products()}")
-
-
-    phone_id = catalog.add_product(
-        name="Смартфон Samsung Galaxy S21",
-        category="Смартфоны",
-        price=69990,
-        weight=0.17,
-        description="Флагманский смартфон"
-    )
-
-    laptop_id = catalog.add_product(
-        name="Ноутбук ASUS VivoBook 15",
-        category="Ноутбуки",
-        price=54990,
-        weight=1.8,
-        description="Ультрабук с SSD"
-    )
-
-    headphones_id = catalog.add_product(
-        name="Наушники Sony WH-1000XM4",
-        category="Аксессуары",
-        price=29990,
-        weight=0.25,
-        description="С шумоподавлением"
-    )
-
-
-    catalog.add_to_cart(phone_id, 2)
-    catalog.add_to_cart(laptop_id)
-    catalog.add_to_cart(headphones_id, 3)
-
-
-    catalog.display_cart()
-
-
-    catalog.remove_from_cart(headphones_id, 2)
-    catalog.remove_from_cart(phone_id)
-
-
-    catalog.display_cart()
-
-
-    catalog.clear_cart()
-    catalog.display_cart()
-
-
-
-
-
-    catalog.add_product("Смартфон Samsung", "Смартфоны", 69990, 0.17, "Флагман")
-    catalog.add_product("Ноутбук ASUS", "Ноутбуки", 54990, 1.8, "Ультрабук")
-    catalog.add_product("Наушники Sony", "Аксессуары", 29990, 0.25, "Беспроводные")
-    catalog.add_product("Телевизор LG", "Телевизоры", 129990, 18.2, "OLED")
-    catalog.add_product("Мышь Logitech", "Аксессуары", 4990, 0.1, "Беспроводная")
-
-    catalog.add_to_cart(1, 2)
-    catalog.add_to_cart(2)
-    catalog.add_to_cart(3, 3)
-    catalog.add_to_cart(4)
-    catalog.add_to_cart(5)
-
-    print("\nИсходная корзина:")
-    catalog.display_cart()
-
-
-    print("\nСортировка пузырьком по цене (возрастание):")
-    catalog.sort_cart(algorithm='bubble', key='price', reverse=False)
-    catalog.display_cart()
-
-    print("\nСортировка вставками по весу (убывание):")
-    catalog.sort_cart(algorithm='insertion', key='weight', reverse=True)
-    catalog.display_cart()
-
-    print("\nБыстрая сортировка по категории (возрастание):")
-    catalog.sort_cart(algorithm='quick', key='category', reverse=False)
-    catalog.display_cart()
-
-    print("\nСортировка слиянием по названию (убывание):")
-    catalog.sort_cart(algorithm='merge', key='name', reverse=True)
-    catalog.display_cart()
-
-
-    catalog.add_product("Смартфон", "Электроника", 50000, 0.2, "Флагман")
-    catalog.add_product("Ноутбук", "Электроника", 80000, 2.5, "Игровой")
-    catalog.add_product("Наушники", "Аксессуары", 15000, 0.3, "Беспроводные")
-
-
-    catalog.add_to_cart(1, 2)  # 2 смартфона
-    catalog.add_to_cart(2)  # 1 ноутбук
-    catalog.add_to_cart(3, 3)  # 3 наушников
-
-    # Настраиваем налоги и скидки
-    catalog.set_tax_rate(0.20)  # 20% налог
-
-    # Добавляем правила скидок:
-    # 1. Общая 5% скидка на весь заказ
-    catalog.add_discount_rule('percentage', value=5)
-
-    # 2. Дополнительная фиксированная скидка 1000 руб.
-    catalog.add_discount_rule('fixed', value=1000)
-
-    # 3. Скидка 10% при заказе от 100000 руб.
-    catalog.add_discount_rule('threshold', threshold=100000,
-                              discount_type='percentage', discount_value=10)
-
-    # Показываем корзину
-    catalog.display_cart()
-
-    # Показываем итоговую сумму с детализацией
-    catalog.display_totals()
-
-    # Пример получения отдельных значений
-    totals = catalog.calculate_total()
-    print(f"\nСумма без учета налогов: {totals['subtotal'] - totals['discounts']:.2f} руб.")
-    print(f"Общая сумма к оплате: {totals['total']:.2f} руб.")
-
-
-
-
-    if __name__ == "__main__":
-        # Создаем основной каталог
-        main_catalog = Product()
-
-        # Добавляем тестовые товары
-        phone_id = main_catalog.add_product(
-            name="Смартфон Samsung Galaxy S21",
-            category="Смартфоны",
-            price=69990,
-            weight=0.17,
-            description="Флагманский смартфон с AMOLED-экраном и тройной камерой"
-        )
-
-        laptop_id = main_catalog.add_product(
-            name="Ноутбук ASUS VivoBook 15",
-            category="Ноутбуки",
-            price=54990,
-            weight=1.8,
-            description="Ультрабук с процессором Intel Core i5 и SSD на 512 ГБ"
-        )
-
-    interface = TextInterface(main_catalog)
-    interface.main_menu()
\ No newline at end of file
+    sys.exit(main())
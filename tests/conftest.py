@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import Cart, Product  # noqa: E402
+
+
+@pytest.fixture
+def make_catalog():
+    """Фабрика каталогов: товары «Товар i» с ценой 100 * i, ID с 1
+
+    С catalog товары добавляются в уже созданный каталог (например,
+    загруженный из хранилища).
+    """
+    def make(count=3, catalog_class=Product, catalog=None):
+        if catalog is None:
+            catalog = catalog_class()
+        start = catalog.next_id
+        for i in range(start, start + count):
+            catalog.add_product(f"Товар {i}", "Категория", 100 * i, 1.0, f"Описание {i}")
+        return catalog
+    return make
+
+
+@pytest.fixture
+def catalog(make_catalog):
+    return make_catalog()
+
+
+@pytest.fixture
+def cart(make_catalog):
+    """Корзина на 1000: десять единиц первого товара"""
+    cart = Cart(make_catalog(1))
+    cart.add_item(1, 10)
+    return cart
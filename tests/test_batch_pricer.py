@@ -0,0 +1,20 @@
+from store import BatchPricer, Cart, Product
+
+
+def test_quote_rows_matches_carts_including_missing_products():
+    catalog = Product()
+    catalog.add_product("Товар", "Категория", 1000, 1.0, "")
+    catalog.add_product("Другой", "Категория", 250, 1.0, "")
+    rules = [{'type': 'percentage', 'value': 10.0}, {'type': 'fixed', 'value': 50.0}]
+    rows = [('a', 1, 2), ('a', 2, 1), ('b', 99, 3), ('c', 2, 4), ('c', 98, 1)]
+
+    quotes = BatchPricer.quote_rows(catalog, rows, rules, 0.2)
+
+    assert list(quotes) == ['a', 'b', 'c']
+    for cart_id in quotes:
+        cart = Cart(catalog)
+        cart.discount_rules = [dict(rule) for rule in rules]
+        for line_cart, product_id, quantity in rows:
+            if line_cart == cart_id:
+                cart.add_item(product_id, quantity)
+        assert quotes[cart_id] == cart.calculate_total()
@@ -0,0 +1,80 @@
+import io
+import os
+
+import pytest
+
+from store import Cart, CatalogStore, ColumnarProduct, Product
+
+
+def test_snapshot_every_writes_snapshots(tmp_path, make_catalog):
+    store = CatalogStore(str(tmp_path), group_size=4, snapshot_every=10)
+    make_catalog(30, catalog=store.load())
+    store.close()
+
+    assert os.path.exists(tmp_path / CatalogStore.SNAPSHOT_FILE)
+    assert store._generation >= 2
+    restored = CatalogStore(str(tmp_path)).load()
+    assert [product['price'] for product in restored] == [100 * i for i in range(1, 31)]
+
+
+def fill_catalog(catalog):
+    catalog.import_products(io.StringIO(
+        '{"name": "Ноутбук", "category": "Компьютеры", "price": 1000, "weight": 2, "sku": "NB-1"}\n'
+        '{"name": "Мышь", "category": "Периферия", "price": 20, "weight": 0.1, "sku": "MS-1"}\n'
+        '{"name": "Коврик", "category": "Периферия", "price": 5, "weight": 0.2}\n'), format='jsonl')
+    catalog.edit_product(1, price=900, description="Легкий")
+    catalog.delete_product(3)
+    catalog.add_product("Монитор", "Периферия", 300, 4, "")
+
+
+def state(catalog):
+    return [dict(product) for product in catalog], catalog.find_by_sku('MS-1')['id'], catalog.next_id
+
+
+def test_log_replay_restores_catalog(tmp_path):
+    store = CatalogStore(str(tmp_path))
+    catalog = store.load()
+    fill_catalog(catalog)
+    store.close()
+
+    restored = CatalogStore(str(tmp_path)).load()
+    assert state(restored) == state(catalog)
+    assert restored._find_product_by_id(1)['version'] == 2
+
+
+def test_torn_log_tail_is_truncated(tmp_path, make_catalog):
+    store = CatalogStore(str(tmp_path))
+    make_catalog(3, catalog=store.load())
+    store.close()
+    path = store._log_path(store._generation)
+    size = os.path.getsize(path)
+    with open(path, 'ab') as file:
+        file.write(b'{"op": "add", "prod')
+
+    reopened = CatalogStore(str(tmp_path))
+    catalog = reopened.load()
+    assert [product['id'] for product in catalog] == [1, 2, 3]
+    assert os.path.getsize(path) == size
+    catalog.add_product("После сбоя", "Категория", 1, 1, "")
+    reopened.close()
+    assert len(CatalogStore(str(tmp_path)).load()) == 4
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ColumnarProduct])
+def test_snapshot_round_trip(tmp_path, catalog_class):
+    store = CatalogStore(str(tmp_path))
+    catalog = store.load()
+    fill_catalog(catalog)
+    cart = Cart(catalog)
+    cart.discount_rules = [{'type': 'percentage', 'value': 10}]
+    cart.tax_rate = 0.2
+    store.save_pricing(cart)
+    store.snapshot()
+    catalog.edit_product(2, price=25)
+    store.close()
+
+    reopened = CatalogStore(str(tmp_path))
+    restored = reopened.load(catalog_class)
+    assert state(restored) == state(catalog)
+    assert [product['version'] for product in restored] == [2, 2, 1]
+    assert reopened.pricing == {'discount_rules': [{'type': 'percentage', 'value': 10}], 'tax_rate': 0.2}
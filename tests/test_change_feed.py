@@ -0,0 +1,9 @@
+def test_changes_since_returns_changes_after_version(catalog):
+    changes = catalog.changes_since(1)
+    assert [change.version for change in changes] == [2, 3]
+    assert catalog.changes_since(catalog.version) == []
+
+
+def test_changes_since_future_version_is_unknown(catalog, make_catalog):
+    assert catalog.changes_since(catalog.version + 1) is None
+    assert make_catalog(1).changes_since(make_catalog(5).version) is None
@@ -0,0 +1,35 @@
+import pytest
+
+from store import ColumnarProduct, Product
+
+
+def apply_changes(catalog):
+    catalog.edit_product(2, price=250, category="Новая", name="Изменен")
+    catalog.delete_product(3)
+    catalog.delete_product(5)
+    catalog.add_product("Добавлен", "Новая", 900, 3.0, "Описание")
+
+
+@pytest.mark.parametrize('compact_min_deleted', [1, 1024])
+def test_columnar_catalog_matches_product(make_catalog, monkeypatch, compact_min_deleted):
+    monkeypatch.setattr(ColumnarProduct, '_COMPACT_MIN_DELETED', compact_min_deleted)
+    columnar = make_catalog(6, ColumnarProduct)
+    reference = make_catalog(6, Product)
+    apply_changes(columnar)
+    apply_changes(reference)
+
+    assert [dict(product) for product in columnar] == [dict(product) for product in reference]
+    assert len(columnar) == 5
+    assert columnar.get_product_info(3) is None
+    assert dict(columnar.get_product_info(2)) == dict(reference.get_product_info(2))
+    assert columnar.get_product_info(2)['version'] == 2
+
+
+def test_select_and_average_price(make_catalog):
+    catalog = make_catalog(6, ColumnarProduct)
+    apply_changes(catalog)
+    assert catalog.select() == [1, 2, 4, 6, 7]
+    assert catalog.select(category="Новая") == [2, 7]
+    assert catalog.select(min_price=250, max_price=600) == [2, 4, 6]
+    assert catalog.select(category="Нет такой") == []
+    assert catalog.average_price_by_category() == {'Категория': (100 + 400 + 600) / 3, 'Новая': (250 + 900) / 2}
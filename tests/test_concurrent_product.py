@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from store import ConcurrentProduct
+
+
+def test_failed_subscriber_keeps_storage_and_listeners_consistent():
+    catalog = ConcurrentProduct()
+    catalog.add_product("Первый", "Старая", 100, 1.0, "")
+    catalog.find_by_range('price')
+    catalog.facets()
+
+    def fail(event):
+        raise RuntimeError("подписчик")
+
+    catalog.subscribe(fail)
+    with pytest.raises(RuntimeError):
+        catalog.add_product("Второй", "Новая", 200, 1.0, "")
+    catalog.unsubscribe(fail)
+
+    assert len(catalog) == 2
+    assert catalog.next_id == 3
+    assert [product['id'] for product in catalog.find_by_range('price')] == [1, 2]
+    assert set(catalog.facets()) == {product['category'] for product in catalog}
+    assert catalog.get_product_info(2)['name'] == "Второй"
+
+
+def test_readers_see_old_or_new_record_during_writes(make_catalog):
+    catalog = make_catalog(100, ConcurrentProduct)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            for product_id in range(1, 101):
+                product = catalog.get_product_info(product_id)
+                if product is None or product['price'] not in (100 * product_id, -1.0, -2.0):
+                    errors.append(product)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for step in range(200):
+        catalog.edit_product(step % 100 + 1, price=-1.0 - step % 2)
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert not errors
+
+
+def test_published_records_are_not_modified_in_place(make_catalog):
+    catalog = make_catalog(5, ConcurrentProduct)
+    before = catalog.get_product_info(1)
+    snapshot = list(catalog)
+    catalog.edit_product(1, price=999)
+    catalog.delete_product(2)
+
+    assert before['price'] == 100 and before['version'] == 1
+    assert [product['id'] for product in snapshot] == [1, 2, 3, 4, 5]
+    assert catalog.get_product_info(1)['price'] == 999
+    assert catalog.get_product_info(1)['version'] == 2
+    assert catalog.get_product_info(2) is None
+    assert len(catalog) == 4
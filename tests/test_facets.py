@@ -0,0 +1,34 @@
+import pytest
+
+from store import CategoryFacets, ColumnarProduct, ConcurrentProduct, Product
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ColumnarProduct, ConcurrentProduct])
+def test_facets_follow_catalog_changes(catalog_class, make_catalog):
+    catalog = make_catalog(4, catalog_class)
+    assert catalog.facets() == {
+        'Категория': {'count': 4, 'min_price': 100, 'max_price': 400, 'avg_price': 250, 'total_weight': 4.0}
+    }
+
+    catalog.edit_product(1, category="Новая")
+    catalog.edit_product(4, price=50)
+    catalog.add_product("Товар 5", "Новая", 700, 2.5, "")
+    catalog.delete_product(2)
+
+    facets = catalog.facets()
+    assert list(facets) == ['Категория', 'Новая']
+    assert facets['Категория'] == {'count': 2, 'min_price': 50, 'max_price': 300, 'avg_price': 175,
+                                   'total_weight': 2.0}
+    assert facets['Новая'] == {'count': 2, 'min_price': 100, 'max_price': 700, 'avg_price': 400,
+                               'total_weight': 3.5}
+    assert facets == CategoryFacets.aggregate(catalog)
+
+
+def test_emptied_category_disappears(catalog):
+    catalog.facets()
+    catalog.edit_product(2, category="Одна")
+    catalog.delete_product(2)
+    assert list(catalog.facets()) == ['Категория']
+    assert catalog.facets(catalog.find_by_range('price', 300)) == {
+        'Категория': {'count': 1, 'min_price': 300, 'max_price': 300, 'avg_price': 300, 'total_weight': 1.0}
+    }
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+from store import ColumnarProduct, ConcurrentProduct, Product, ProductAdded, ProductUpdated
+
+
+CSV = (
+    'name,category,price,weight,description,sku\n'
+    'Чайник,Кухня,2500,1.2,Стальной,\n'
+    'Тостер,Кухня,3000,1.5,,T-1\n'
+    ',Кухня,100,1,,\n'
+    'Миксер,Кухня,дорого,1,,\n'
+    'Плита,Кухня,-5,10,,\n'
+    'Тостер,Кухня,2800,1.5,,T-1\n'
+    'Блендер,Кухня,4000,2,,B-1\n'
+)
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ColumnarProduct, ConcurrentProduct])
+def test_import_keeps_file_order_and_reports_errors(catalog_class):
+    catalog = catalog_class()
+    stats = catalog.import_products(io.StringIO(CSV), format='csv', batch_size=4)
+
+    assert [(product['id'], product['name']) for product in catalog] == [(1, 'Чайник'), (2, 'Тостер'), (3, 'Блендер')]
+    assert catalog.find_by_sku('T-1')['price'] == 2800
+    assert (stats['rows'], stats['added'], stats['updated'], stats['failed']) == (7, 3, 1, 3)
+    assert [line for line, _ in stats['errors']] == [4, 5, 6]
+
+
+def test_import_updates_known_skus_and_emits_events():
+    catalog = Product()
+    catalog.import_products(io.StringIO(CSV), format='csv')
+    events = []
+    catalog.subscribe(events.append)
+    stats = catalog.import_products(io.StringIO(
+        '{"name": "Тостер", "price": 2800, "weight": 1.5, "sku": "T-1"}\n'
+        '{"name": "Блендер", "price": 3500, "weight": 2, "sku": "B-1"}\n'
+        '{"name": "Кофемолка", "category": "Кухня", "price": 1500, "weight": 0.5}\n'), format='jsonl')
+
+    assert (stats['added'], stats['updated'], stats['unchanged']) == (1, 1, 1)
+    assert catalog.find_by_sku('B-1')['category'] == 'Кухня'
+    assert [type(event) for event in events] == [ProductUpdated, ProductAdded]
+    assert events[0].changes == {'price': 3500.0}
+    assert events[1].product['id'] == 4
+
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl'])
+def test_export_round_trip(format):
+    catalog = Product()
+    catalog.import_products(io.StringIO(CSV), format='csv')
+    output = io.StringIO()
+    assert catalog.export_products(output, format=format) == 3
+
+    restored = Product()
+    restored.import_products(io.StringIO(output.getvalue()), format=format)
+    assert list(restored.export_rows()) == list(catalog.export_rows())
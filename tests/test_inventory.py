@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from store import Cart, Inventory
+
+
+def test_expired_reservation_drops_cart_lines(make_catalog):
+    clock = [0.0]
+    catalog = make_catalog(2)
+    inventory = Inventory(shards=4, ttl=60, clock=lambda: clock[0])
+    inventory.set_stock(1, 100)
+    old_cart = Cart(catalog, inventory)
+    assert old_cart.add_item(1, 100)
+    assert old_cart.add_item(2, 3)
+
+    clock[0] = 61
+    assert inventory.expire() == 1
+    new_cart = Cart(catalog, inventory)
+    assert new_cart.add_item(1, 100)
+
+    assert [item['product']['id'] for item in old_cart.items] == [2]
+    assert old_cart.calculate_subtotal() == 600
+    assert inventory.reserved(1) == 100
+    assert inventory.available(1) == 0
+
+
+def test_remove_and_clear_release_stock(make_catalog):
+    catalog = make_catalog(2)
+    inventory = Inventory(shards=4)
+    inventory.set_stock(1, 10)
+    cart = Cart(catalog, inventory)
+    assert cart.add_item(1, 7)
+    assert not cart.add_item(1, 4)
+    cart.remove_item(1, 2)
+    assert inventory.available(1) == 5
+    cart.clear()
+    assert inventory.available(1) == 10
+    assert inventory.reserved(1) == 0
+
+
+def test_threads_get_different_home_shards():
+    inventory = Inventory(shards=4)
+    homes = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: homes.append(inventory._home()))
+        thread.start()
+        thread.join()
+    assert homes[0] != homes[1]
+    assert inventory._home() == inventory._home()
+
+
+def test_non_positive_quantities_are_rejected(make_catalog):
+    catalog = make_catalog(2)
+    inventory = Inventory(shards=4)
+    inventory.set_stock(1, 10)
+    cart = Cart(catalog, inventory)
+    assert cart.add_item(1, 10)
+    for quantity in (-5, 0):
+        with pytest.raises(ValueError):
+            cart.remove_item(1, quantity)
+        with pytest.raises(ValueError):
+            cart.add_item(1, quantity)
+    assert cart.items[0]['quantity'] == 10
+    assert inventory.available(1) == 0
+    assert inventory.reserved(1) == 10
+    with pytest.raises(ValueError):
+        cart.add_item(2, -3)
+    assert Cart(catalog).add_item(2, -3)
+
+
+def test_hot_product_is_never_oversold(make_catalog):
+    catalog = make_catalog(2)
+    inventory = Inventory(shards=8, batch_size=32)
+    inventory.set_stock(1, 1000)
+    reserved = []
+
+    def shop():
+        carts = [Cart(catalog, inventory) for _ in range(10)]
+        reserved.append(sum(carts[i % 10].add_item(1) for i in range(400)))
+
+    threads = [threading.Thread(target=shop) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(reserved) == 1000
+    assert inventory.available(1) == 0
+    assert inventory.reserved(1) == 1000
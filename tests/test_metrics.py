@@ -0,0 +1,35 @@
+from store import ConcurrentProduct, Metrics, Product
+
+
+def operation_counts(metrics):
+    return {name: data['count'] for name, data in metrics.to_dict()['operations'].items()}
+
+
+def test_override_calling_super_is_counted_once():
+    metrics = Metrics()
+    metrics.enable()
+    try:
+        catalog = ConcurrentProduct()
+        product_id = catalog.add_product("Товар", "Категория", 100, 1.0, "")
+        catalog.edit_product(product_id, price=120)
+        catalog.delete_product(product_id)
+    finally:
+        metrics.disable()
+
+    counts = operation_counts(metrics)
+    assert counts['product.add'] == 1
+    assert counts['product.edit'] == 1
+    assert counts['product.delete'] == 1
+
+
+def test_each_call_is_counted():
+    metrics = Metrics()
+    metrics.enable()
+    try:
+        catalog = Product()
+        for i in range(3):
+            catalog.add_product(f"Товар {i}", "Категория", 100, 1.0, "")
+    finally:
+        metrics.disable()
+
+    assert operation_counts(metrics)['product.add'] == 3
@@ -0,0 +1,49 @@
+from store import PricingPolicy
+
+
+def test_replacing_rules_with_list_of_same_length_recompiles_plan(cart):
+    cart.add_discount_rule('fixed', value=15)
+    assert cart.calculate_total()['discounts'] == 15.0
+
+    cart.discount_rules = [{'type': 'fixed', 'value': 50.0}]
+    assert cart.calculate_total()['discounts'] == 50.0
+
+
+def test_plan_is_reused_until_rules_are_written(cart):
+    cart.add_discount_rule('percentage', value=5)
+    plan = cart._get_discount_plan()
+    cart.calculate_total()
+    assert cart._get_discount_plan() is plan
+
+    cart.add_discount_rule('fixed', value=10)
+    assert cart._get_discount_plan() is not plan
+
+
+def test_editing_rule_in_place_recompiles_plan_after_invalidate(cart):
+    cart.add_discount_rule('tiered', discount_type='fixed', tiers=[(500, 10)])
+    assert cart.calculate_total()['discounts'] == 10.0
+
+    cart.discount_rules[0]['tiers'].append((900, 40.0))
+    cart.invalidate_discounts()
+    assert cart.calculate_total()['discounts'] == 40.0
+    cart.discount_rules[0]['discount_type'] = 'percentage'
+    cart.invalidate_discounts()
+    assert cart.calculate_total()['discounts'] == 400.0
+
+
+def test_policy_plan_follows_rule_changes():
+    policy = PricingPolicy([{'type': 'percentage', 'value': 5.0}])
+    assert policy.plan().percentage == 5.0
+    policy.discount_rules[0]['value'] = 7.0
+    policy.invalidate_discounts()
+    assert policy.plan().percentage == 7.0
+    policy.discount_rules = [{'type': 'percentage', 'value': 9.0}]
+    assert policy.plan().percentage == 9.0
+
+
+def test_policy_sees_rules_added_to_shared_cart_list(cart):
+    cart.add_discount_rule('percentage', value=5)
+    policy = PricingPolicy.from_cart(cart)
+    assert policy.plan().percentage == 5.0
+    cart.add_discount_rule('percentage', value=3)
+    assert policy.plan().percentage == 8.0
@@ -0,0 +1,27 @@
+import pytest
+
+from store import ConcurrentProduct, Product
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ConcurrentProduct])
+def test_edit_without_changes_keeps_version(catalog_class, make_catalog):
+    catalog = make_catalog(1, catalog_class)
+    version = catalog.version
+    events = []
+    catalog.subscribe(events.append)
+
+    assert catalog.edit_product(1, color="красный", price="дорого")
+    assert catalog.edit_product(1, name="Товар 1", price=100)
+    assert catalog.version == version
+    assert catalog.changes_since(version) == []
+    assert catalog.get_product_info(1)['version'] == 1
+    assert all(event.changes == {} for event in events if hasattr(event, 'changes'))
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ConcurrentProduct])
+def test_edit_creates_new_version(catalog_class, make_catalog):
+    catalog = make_catalog(1, catalog_class)
+    assert catalog.edit_product(1, price=150)
+    product = catalog.get_product_info(1)
+    assert (product['price'], product['version']) == (150, 2)
+    assert [change.kind for change in catalog.changes_since(1)] == ['edit']
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+
+import pytest
+
+from store import Renderer
+
+
+ROWS = [
+    {'id': i, 'name': f"Товар, {i}", 'category': "Категория", 'price': 100.5 * i, 'weight': 0.25, 'description': ""}
+    for i in range(1, 6)
+]
+
+
+@pytest.mark.parametrize('format', Renderer.FORMATS)
+def test_output_does_not_depend_on_chunk_size(format):
+    whole = ''.join(Renderer.render(ROWS, Renderer.CATALOG_LABELS, format))
+    chunked = list(Renderer.render(ROWS, Renderer.CATALOG_LABELS, format, chunk_size=2))
+    assert ''.join(chunked) == whole
+    assert len(chunked) > 1
+
+
+def test_text_csv_and_json_output():
+    fields = ('id', 'name', 'price')
+    text = ''.join(Renderer.render(ROWS[:1], Renderer.CATALOG_LABELS, 'text', fields))
+    assert text == "\nID: 1\nНазвание: Товар, 1\nЦена: 100.50 руб.\n"
+
+    rows = list(csv.reader(io.StringIO(''.join(Renderer.render(ROWS, Renderer.CATALOG_LABELS, 'csv', fields)))))
+    assert rows[0] == list(fields)
+    assert rows[1] == ['1', 'Товар, 1', '100.5']
+    assert len(rows) == 6
+
+    data = json.loads(''.join(Renderer.render(ROWS, Renderer.CATALOG_LABELS, 'json', fields)))
+    assert data == [{field: row[field] for field in fields} for row in ROWS]
+    assert ''.join(Renderer.render([], Renderer.CATALOG_LABELS, 'json')) == '[]\n'
+
+
+def test_select_pages_and_errors():
+    assert [row['id'] for row in Renderer.select(ROWS, page=2, limit=2)] == [3, 4]
+    assert [row['id'] for row in Renderer.select(ROWS, offset=3)] == [4, 5]
+    with pytest.raises(ValueError):
+        Renderer.select(ROWS, page=1)
+    with pytest.raises(ValueError):
+        list(Renderer.render(ROWS, Renderer.CATALOG_LABELS, 'text', ['quantity']))
+    with pytest.raises(ValueError):
+        list(Renderer.render(ROWS, Renderer.CATALOG_LABELS, 'xml'))
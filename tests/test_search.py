@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from store import ColumnarProduct, ConcurrentProduct, Product, SearchIndex
+
+
+def catalog_with_late_name_matches():
+    catalog = Product()
+    # Слово 'pro' сначала встречается только в описаниях, название - у поздних товаров
+    for i in range(300):
+        catalog.add_product(f"Товар {i}", "Категория", 100, 1.0, "pro модель")
+    for i in range(5):
+        catalog.add_product(f"Ноутбук Pro {i}", "Ноутбуки", 100, 1.0, "модель")
+    return catalog
+
+
+def test_limited_search_prefers_name_matches():
+    catalog = catalog_with_late_name_matches()
+    expected = [product['id'] for product in catalog.search('pro')[:5]]
+    assert all('Pro' in catalog.get_product_info(product_id)['name'] for product_id in expected)
+    assert [product['id'] for product in catalog.search('pro', limit=5)] == expected
+    assert [product['id'] for product in catalog.suggest('pro ', limit=5)] == expected
+
+
+def test_limited_search_with_prefix_prefers_name_matches():
+    catalog = catalog_with_late_name_matches()
+    results = catalog.search('pro мод', limit=3, prefix=True)
+    assert all('Pro' in product['name'] for product in results)
+    assert results == catalog.search('pro мод', prefix=True)[:3]
+
+
+WORDS = ['pro', 'pad', 'pan', 'max', 'mini', 'модель', 'мобильный', '1', '12', '120', '2', 'ё', 'ещё']
+
+
+def random_catalog(catalog_class, rng, size=400):
+    catalog = catalog_class()
+    for i in range(size):
+        catalog.add_product(' '.join(rng.sample(WORDS, rng.randint(1, 3))), "Категория", 100, 1.0,
+                            ' '.join(rng.sample(WORDS, rng.randint(0, 3))))
+    catalog.search('pro')
+    for _ in range(size // 10):
+        product_id = rng.randint(1, size)
+        if rng.random() < 0.5:
+            catalog.delete_product(product_id)
+        else:
+            catalog.edit_product(product_id, name=' '.join(rng.sample(WORDS, 2)))
+    return catalog
+
+
+def expected_ranking(catalog, terms, partial):
+    """Полная выдача по определению: больше слов запроса в названии, затем меньший ID"""
+    scored = []
+    for product in catalog:
+        name_tokens = set(SearchIndex.tokenize(product['name']))
+        tokens = name_tokens.union(SearchIndex.tokenize(product['description']))
+        if not all(term in tokens for term in terms):
+            continue
+        hits = sum(term in name_tokens for term in terms)
+        if partial is not None:
+            if not any(token.startswith(partial) for token in tokens):
+                continue
+            hits += any(token.startswith(partial) for token in name_tokens)
+        scored.append((-hits, product['id']))
+    return [product_id for _, product_id in sorted(scored)]
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ColumnarProduct, ConcurrentProduct])
+@pytest.mark.parametrize('scan_budget', [5, 1000])
+def test_limited_search_is_prefix_of_full_ranking(catalog_class, scan_budget, monkeypatch):
+    monkeypatch.setattr(SearchIndex, '_SCAN_BUDGET', scan_budget)
+    rng = random.Random(scan_budget)
+    catalog = random_catalog(catalog_class, rng)
+    for _ in range(200):
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        if rng.random() < 0.5:
+            words[-1] = words[-1][:rng.randint(1, len(words[-1]))]
+        query = ' '.join(words)
+        prefix = rng.random() < 0.7
+        terms = SearchIndex.tokenize(query)
+        partial = terms.pop() if prefix else None
+        full = [product['id'] for product in catalog.search(query, prefix=prefix)]
+        assert full == expected_ranking(catalog, terms, partial), query
+
+        limit = rng.choice([1, 3, 10, 50])
+        limited = [product['id'] for product in catalog.search(query, limit=limit, prefix=prefix)]
+        assert limited == full[:limit], (query, prefix, limit)
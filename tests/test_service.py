@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import pytest
+
+from service import CatalogService
+
+
+@pytest.fixture
+def service(catalog):
+    return CatalogService(catalog)
+
+
+def test_remove_item_rejects_non_positive_quantity(service):
+    async def scenario():
+        _, created = await service.handle('POST', '/carts')
+        cart = created['cart']
+        await service.handle('POST', f'/carts/{cart}/items', json.dumps({'product_id': 1, 'quantity': 2}).encode())
+        for quantity in (-5, 0):
+            status, _ = await service.handle('DELETE', f'/carts/{cart}/items/1?quantity={quantity}')
+            assert status == 400
+        return service.carts[cart].items[0]['quantity']
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_malformed_content_length_gets_400(service):
+    async def scenario():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            replies = []
+            for length in ('abc', '-1'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f'POST /carts HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode())
+                replies.append(await reader.read())
+                writer.close()
+            return replies
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    for reply in asyncio.run(scenario()):
+        assert reply.startswith(b'HTTP/1.1 400 ')
+        assert b'Content-Length' in reply.split(b'\r\n\r\n', 1)[1]
@@ -0,0 +1,28 @@
+from store import SessionCartManager
+
+
+def test_evicted_cart_is_restored(tmp_path, catalog):
+    manager = SessionCartManager(catalog, tmp_path, max_carts=1)
+    manager.get_cart('a').add_item(1, 3)
+    manager.get_cart('b')
+    assert len(manager) == 1
+    assert manager.stored_count() == 1
+
+    cart = manager.get_cart('a')
+    assert [(line['product']['id'], line['quantity']) for line in cart.items] == [(1, 3)]
+    assert cart.products[0] is catalog._find_product_by_id(1)
+    manager.close()
+
+
+def test_rehydrated_cart_is_removed_from_disk(tmp_path, catalog):
+    manager = SessionCartManager(catalog, tmp_path)
+    manager.get_cart('a').add_item(2)
+    manager.evict('a')
+    manager.get_cart('a')
+
+    # Другое соединение видит удаление сразу, а не после закрытия менеджера
+    other = SessionCartManager(catalog, tmp_path)
+    assert other.stored_count() == 0
+    assert other.get_cart('a').line_count == 0
+    other.close()
+    manager.close()
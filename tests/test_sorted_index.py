@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from store import ColumnarProduct, ConcurrentProduct, Product, SortedList
+
+
+def test_sorted_list_matches_sorted_builtin(monkeypatch):
+    # Маленькие блоки, чтобы вставки и удаления делили и опустошали блоки
+    monkeypatch.setattr(SortedList, '_LOAD', 4)
+    rng = random.Random(0)
+    values = [rng.randint(0, 50) for _ in range(40)]
+    sorted_list = SortedList(values)
+    for _ in range(300):
+        if values and rng.random() < 0.4:
+            value = rng.choice(values)
+            values.remove(value)
+            sorted_list.remove(value)
+        else:
+            value = rng.randint(0, 50)
+            values.append(value)
+            sorted_list.add(value)
+        low, high = sorted(rng.sample(range(-5, 56), 2))
+        expected = sorted(value for value in values if low <= value <= high)
+        assert list(sorted_list.irange(low, high)) == expected
+        assert list(sorted_list.irange(low, high, reverse=True)) == expected[::-1]
+    assert list(sorted_list) == sorted(values)
+    assert len(sorted_list) == len(values)
+    with pytest.raises(ValueError):
+        sorted_list.remove(100)
+
+
+@pytest.mark.parametrize('catalog_class', [Product, ColumnarProduct, ConcurrentProduct])
+def test_sorted_index_follows_catalog_changes(catalog_class, make_catalog):
+    catalog = make_catalog(5, catalog_class)
+    assert [product['id'] for product in catalog.find_by_range('price', 200, 400)] == [2, 3, 4]
+
+    catalog.edit_product(5, price=150, name="Акустика")
+    catalog.delete_product(3)
+    catalog.add_product("Товар 6", "Категория", 250, 1.0, "")
+
+    assert [product['id'] for product in catalog.find_by_range('price', 150)] == [5, 2, 6, 4]
+    assert [product['id'] for product in catalog.find_by_range('price', high=200)] == [1, 5, 2]
+    assert [product['id'] for product in catalog.find_by_prefix('Товар')] == [1, 2, 4, 6]
+    assert [product['id'] for product in catalog.find_by_prefix('Аку')] == [5]
@@ -0,0 +1,15 @@
+from store import TextInterface
+
+
+def test_script_pricing_commands_are_persisted(tmp_path):
+    interface = TextInterface(str(tmp_path), verbose=False)
+    assert interface.run_script(['product Чайник Кухня 2500 1.2', 'discount fixed 500', 'tax 0.1']) == 0
+    rules = list(interface.cart.discount_rules)
+    interface.close()
+
+    reopened = TextInterface(str(tmp_path), verbose=False)
+    assert reopened.cart.discount_rules == rules
+    assert rules[-1] == {'type': 'fixed', 'value': 500.0}
+    assert reopened.cart.tax_rate == 0.1
+    assert reopened.product_catalog.find_by_prefix('Чайник')
+    reopened.close()